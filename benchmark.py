@@ -0,0 +1,425 @@
+"""
+Offline benchmark for both scrapers
+Serves the fixture corpus from a local stand-in for bizbuysell.com (with
+configurable latency and error injection), runs the full crawl flows against
+it and writes pages/sec, parse time, peak memory and end-to-end time to JSON
+
+Usage:
+    python benchmark.py --latency-ms 80 --error-rate 0.02 --output benchmark_results.json
+    python benchmark.py --baseline benchmark_results.json   # compare against a previous run
+    python benchmark.py --detail-padding-kb 200 --stream-details   # early-stopping detail fetch
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+from metrics import metrics
+
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+SEARCH_PATH_RE = re.compile(r'^/businesses-for-sale/.*-county/?$')
+LISTING_PATH_RE = re.compile(r'^/listing/(\d+)')
+LISTING_HREF_RE = re.compile(rb'/listing/(\d+)/')
+LIVE_SITE = b'https://www.bizbuysell.com'
+RESULT_COUNT_RE = re.compile(rb'Showing [\d,]+ - [\d,]+ of [\d,]+ results')
+
+
+def load_corpus(fixture_dir=FIXTURE_DIR):
+    """Read the fixture pages into memory: {'search': [...], 'detail': [...]}"""
+    corpus = {}
+    for kind in ('search', 'detail'):
+        kind_dir = os.path.join(fixture_dir, kind)
+        corpus[kind] = []
+        for name in sorted(os.listdir(kind_dir)):
+            with open(os.path.join(kind_dir, name), 'rb') as f:
+                corpus[kind].append((name, f.read()))
+    return corpus
+
+
+def _detail_padding(kb):
+    """Filler like the carousels, footers and scripts below a real listing's fields"""
+    if kb <= 0:
+        return b''
+    card = (b'<div class="related-card"><a href="/businesses-for-sale/related/">Related business</a>'
+            b'<p>$100,000</p></div>\n')
+    script = b'<script>window.dataLayer.push({"event": "view", "slot": "carousel"});</script>\n'
+    unit = card * 4 + script
+    return b'<section class="related">\n' + unit * (kb * 1024 // len(unit) + 1) + b'</section>\n'
+
+
+class StandInServer:
+    """Local HTTP server replaying the fixture corpus"""
+
+    def __init__(self, corpus, latency_ms=0, jitter_ms=0, error_rate=0.0, error_status=503,
+                 retry_after=None, pages_per_county=3, detail_padding_kb=0, seed=0):
+        """
+        Args:
+            corpus: Output of load_corpus()
+            latency_ms: Delay added to every response
+            jitter_ms: Random extra delay, uniform in [0, jitter_ms]
+            error_rate: Fraction of requests answered with error_status
+            error_status: HTTP status used for injected errors
+            retry_after: Retry-After value (seconds) sent with injected errors
+            pages_per_county: Search result pages served per county before "no results"
+            detail_padding_kb: Related-listing and script filler added below each detail page's fields
+        """
+        self.corpus = corpus
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.pages_per_county = pages_per_county
+        self.detail_padding = _detail_padding(detail_padding_kb)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.errors = 0
+        self.bytes_sent = 0
+
+        with_next = [body for name, body in corpus['search'] if b'Next' in body]
+        last = [body for name, body in corpus['search'] if b'Next' not in body and b'/listing/' in body]
+        empty = [body for name, body in corpus['search'] if b'/listing/' not in body]
+
+        server = self
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class(server))
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+        # Absolute links in the recorded pages must point back at this server
+        local = self.url.encode('ascii')
+        self.search_page = with_next[0].replace(LIVE_SITE, local)
+        self.last_search_page = (last[0] if last else with_next[0]).replace(LIVE_SITE, local)
+        self.empty_search_page = (empty[0] if empty else b'<html><body></body></html>').replace(LIVE_SITE, local)
+        self.search_page_size = len(set(LISTING_HREF_RE.findall(self.search_page)))
+        self.last_page_size = len(set(LISTING_HREF_RE.findall(self.last_search_page)))
+
+    def _handler_class(self, server):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # a streaming client hung up once it had what it needed
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def do_GET(self):
+                status, body = server.respond(self.path)
+                self.send_response(status)
+                if status != 200 and server.retry_after is not None:
+                    self.send_header('Retry-After', str(server.retry_after))
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def _search_body(self, path, page):
+        """A search page whose listing IDs are unique per county and page"""
+        if page > self.pages_per_county:
+            return self.empty_search_page
+        template = self.search_page if page < self.pages_per_county else self.last_search_page
+        county_offset = sum(path.encode('utf-8')) % 997
+        offset = (county_offset * 100 + page) * 1000
+
+        def renumber(match):
+            return b'/listing/%d/' % (int(match.group(1)) % 1000 + offset)
+        body = LISTING_HREF_RE.sub(renumber, template)
+        # The advertised result count matches the pages actually served
+        per_page = self.search_page_size
+        total = per_page * (self.pages_per_county - 1) + self.last_page_size
+        first = per_page * (page - 1) + 1
+        last = total if page == self.pages_per_county else first + per_page - 1
+        return RESULT_COUNT_RE.sub(b'Showing %d - %d of %d results' % (first, last, total), body)
+
+    def respond(self, raw_path):
+        with self.lock:
+            self.requests += 1
+            fail = self.random.random() < self.error_rate
+            delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        if fail:
+            with self.lock:
+                self.errors += 1
+            return self.error_status, b'<html><body>Service Unavailable</body></html>'
+
+        path, _, query = raw_path.partition('?')
+        page_match = re.search(r'(?:^|&)page=(\d+)', query)
+        page = int(page_match.group(1)) if page_match else 1
+
+        listing_match = LISTING_PATH_RE.match(path)
+        if listing_match:
+            details = self.corpus['detail']
+            body = details[int(listing_match.group(1)) % len(details)][1]
+            if self.detail_padding:
+                head, end_tag, tail = body.rpartition(b'</body>')
+                body = head + self.detail_padding + end_tag + tail if end_tag else body + self.detail_padding
+        elif SEARCH_PATH_RE.match(path):
+            body = self._search_body(path, page)
+        else:
+            body = b'<html><head><title>BizBuySell</title></head><body></body></html>'
+
+        with self.lock:
+            self.bytes_sent += len(body)
+        return 200, body
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = self.connections = self.errors = self.bytes_sent = 0
+
+
+class CountingSink:
+    """Counts records without keeping them, so memory reflects the crawl itself"""
+
+    def __init__(self):
+        self.count = 0
+
+    def write_batch(self, frame):
+        self.count += len(frame)
+
+    def close(self):
+        pass
+
+
+def _offline_config(requests_per_second):
+    """Point the scrapers at benchmark-friendly settings (no disk state, fast budget)"""
+    config.INCREMENTAL_CRAWL = False
+    config.HTTP_CACHE_ENABLED = False
+    # Stand-in pages must not reach the real archive (or re-extraction) and history
+    config.HTML_ARCHIVE_ENABLED = False
+    config.HISTORY_ENABLED = False
+    config.REQUESTS_PER_SECOND_PER_HOST = requests_per_second
+    config.MAX_REQUESTS_PER_SECOND = max(config.MAX_REQUESTS_PER_SECOND, requests_per_second)
+
+
+def _measure(server, flow, verbose):
+    server.reset_counters()
+    metrics.reset()
+    tracemalloc.start()
+    started = time.perf_counter()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        records = flow()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'records': records,
+        'requests': server.requests,
+        'connections_opened': server.connections,
+        'injected_errors': server.errors,
+        'bytes_transferred': server.bytes_sent,
+        # Detail-page bytes a streaming fetch did not download
+        'bytes_not_downloaded': metrics.counter_value('stream_bytes_saved_total'),
+        'end_to_end_s': round(elapsed, 3),
+        'pages_per_sec': round(server.requests / elapsed, 2) if elapsed else None,
+        'peak_memory_mb': round(peak / (1024 * 1024), 2),
+        # Seconds spent in each instrumented stage (summed over concurrent work)
+        'stage_seconds': {
+            name: round(sum(h['sum'] for h in series.values()), 3)
+            for name, series in metrics.summary()['histograms'].items()
+        },
+    }
+
+
+def bench_basic_scraper(server, verbose=False):
+    from bizbuysell_scraper import BizBuySellScraper
+    # Loaded lazily by the scraper; imported here so the import is not counted as run memory
+    import pipeline  # noqa: F401
+
+    scraper = BizBuySellScraper()
+    scraper.base_url = server.url
+
+    def flow():
+        sink = CountingSink()
+        scraper.stream_listings([sink])
+        return sink.count
+
+    return _measure(server, flow, verbose)
+
+
+def bench_improved_scraper(server, verbose=False):
+    from bizbuysell_scraper_improved import ImprovedBizBuySellScraper
+
+    scraper = ImprovedBizBuySellScraper()
+    scraper.base_url = server.url
+
+    def flow():
+        return len(scraper.scrape_all_counties())
+
+    return _measure(server, flow, verbose)
+
+
+def bench_parsing(corpus, iterations=20):
+    """Average parse time per page for every parser backend"""
+    from html_parsing import BACKENDS, parse_listing, parse_search_page
+
+    def parse(kind, name, body, backend):
+        if kind == 'search':
+            parse_search_page(body, 'https://www.bizbuysell.com', backend)
+        else:
+            parse_listing(body, f'https://www.bizbuysell.com/listing/{name}/', backend)
+
+    results = {}
+    for backend in BACKENDS:
+        timings = {}
+        for kind in ('search', 'detail'):
+            pages = corpus[kind]
+            for name, body in pages:  # warm-up pass, not timed
+                parse(kind, name, body, backend)
+            started = time.perf_counter()
+            for _ in range(iterations):
+                for name, body in pages:
+                    parse(kind, name, body, backend)
+            elapsed = time.perf_counter() - started
+            timings[f'{kind}_parse_ms_per_page'] = round(elapsed * 1000 / (iterations * len(pages)), 3)
+        results[backend] = timings
+    return results
+
+
+def bench_parse_scaling(corpus, pages=400):
+    """Detail-page parse throughput through the process pool at increasing worker counts"""
+    from concurrent.futures import ProcessPoolExecutor
+    from html_parsing import parse_listing
+
+    details = corpus['detail']
+    work = [details[i % len(details)] for i in range(pages)]
+    contents = [body for _, body in work]
+    urls = [f'https://www.bizbuysell.com/listing/{name}/' for name, _ in work]
+    backends = [config.PARSER_BACKEND] * pages
+
+    started = time.perf_counter()
+    for content, url in zip(contents, urls):
+        parse_listing(content, url, config.PARSER_BACKEND)
+    inline = pages / (time.perf_counter() - started)
+    results = {'cpu_count': os.cpu_count(), 'inline_pages_per_sec': round(inline, 1), 'workers': {}}
+
+    counts = sorted({1, 2, 4, 8, os.cpu_count() or 1})
+    for workers in [n for n in counts if n <= (os.cpu_count() or 1)]:
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(parse_listing, contents[:workers], urls[:workers], backends[:workers]))  # start workers
+            started = time.perf_counter()
+            list(pool.map(parse_listing, contents, urls, backends, chunksize=8))
+            rate = pages / (time.perf_counter() - started)
+        results['workers'][str(workers)] = {
+            'pages_per_sec': round(rate, 1),
+            'speedup_vs_inline': round(rate / inline, 2),
+        }
+    return results
+
+
+def compare(current, baseline, path=''):
+    """Print numeric changes between two result trees"""
+    for key, value in current.items():
+        if key not in baseline or key in ('settings', 'timestamp'):
+            continue
+        label = f"{path}{key}"
+        if isinstance(value, dict) and isinstance(baseline[key], dict):
+            compare(value, baseline[key], label + '.')
+        elif isinstance(value, (int, float)) and isinstance(baseline[key], (int, float)) and baseline[key]:
+            change = (value - baseline[key]) / baseline[key] * 100
+            print(f"  {label}: {baseline[key]} -> {value} ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline scraper benchmark")
+    parser.add_argument('--latency-ms', type=float, default=50, help="latency added to every response")
+    parser.add_argument('--jitter-ms', type=float, default=20, help="random extra latency per response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument('--error-status', type=int, default=503, help="status code for injected failures")
+    parser.add_argument('--retry-after', type=int, help="Retry-After seconds sent with injected failures")
+    parser.add_argument('--pages-per-county', type=int, default=3)
+    parser.add_argument('--detail-padding-kb', type=int, default=0,
+                        help="filler added below each detail page's fields")
+    parser.add_argument('--stream-details', action='store_true',
+                        help="stop downloading detail pages once every field has arrived")
+    parser.add_argument('--rps', type=float, default=50, help="politeness budget per host during the run")
+    parser.add_argument('--parse-iterations', type=int, default=20)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="previous results JSON to compare against")
+    parser.add_argument('--verbose', action='store_true', help="show scraper output")
+    args = parser.parse_args(argv)
+
+    _offline_config(args.rps)
+    config.STREAMING_DETAIL_FETCH = args.stream_details
+    corpus = load_corpus()
+    server = StandInServer(
+        corpus, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, error_status=args.error_status, retry_after=args.retry_after,
+        pages_per_county=args.pages_per_county, detail_padding_kb=args.detail_padding_kb
+    ).start()
+
+    try:
+        print("Benchmarking BizBuySellScraper...")
+        basic = bench_basic_scraper(server, args.verbose)
+        print("Benchmarking ImprovedBizBuySellScraper...")
+        improved = bench_improved_scraper(server, args.verbose)
+    finally:
+        server.stop()
+    print("Benchmarking parser backends...")
+    parsing = bench_parsing(corpus, args.parse_iterations)
+    print("Benchmarking parse scaling across worker processes...")
+    parse_scaling = bench_parse_scaling(corpus)
+
+    results = {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'settings': {
+            'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms,
+            'error_rate': args.error_rate, 'error_status': args.error_status,
+            'retry_after': args.retry_after,
+            'pages_per_county': args.pages_per_county, 'requests_per_second': args.rps,
+            'detail_padding_kb': args.detail_padding_kb, 'stream_details': args.stream_details,
+            'max_in_flight': config.MAX_CONCURRENT_REQUESTS, 'parser_backend': config.PARSER_BACKEND,
+            'parse_workers': config.PARSE_WORKERS,
+        },
+        'basic_scraper': basic,
+        'improved_scraper': improved,
+        'parsing': parsing,
+        'parse_scaling': parse_scaling,
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        print(f"\nChanges against {args.baseline}:")
+        compare(results, baseline)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,26 @@ BizBuySell Daily Scraper for North Carolina Counties
 Scrapes business listings and updates Google Sheets
 """
 
-import requests
-from bs4 import BeautifulSoup
-import json
-import time
-import pandas as pd
+import asyncio
+import os
 from datetime import datetime
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+from fetch_engine import FetchEngine
+from html_archive import open_archive
+from html_parsing import (DetailPageWatcher, parse_listing, parse_listing_detailed, parse_search_page,
+                          search_page_count, timed_parse)
+from http_cache import ResponseCache, page_kind
+from listing_extractor import DETAIL_SELECTORS
+from listing_record import LISTING_COLUMNS, Listing
+from listing_store import ListingStore
+from metrics import add_cli_arguments, metrics, profiled, write_outputs
+from rate_control import rate_options_from_config
+from run_journal import RunJournal
+from sharding import plan_units
+from transport import HttpTransport
 
 
 class BizBuySellScraper:
@@ -24,10 +35,8 @@ class BizBuySellScraper:
             sheet_name: Name of the Google Sheet to update
         """
         self.base_url = "https://www.bizbuysell.com"
-        self.counties = [
-            'iredell', 'cabarrus', 'rowan', 'catawba', 
-            'gaston', 'lincoln', 'mecklenburg'
-        ]
+        self.states = config.STATES
+        self.counties = list(config.COUNTIES)
         self.google_creds_file = google_creds_file
         self.sheet_name = sheet_name
         self.headers = {
@@ -35,271 +44,373 @@ class BizBuySellScraper:
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
         }
+        self.cache = None
+        if config.HTTP_CACHE_ENABLED:
+            self.cache = ResponseCache(
+                config.HTTP_CACHE_DIR, config.HTTP_CACHE_MAX_MB * 1024 * 1024, config.HTTP_CACHE_TTL
+            )
+        # Pooled keep-alive connections shared by every request of this scraper
+        # Raw pages are archived so extractor fixes can be backfilled offline
+        self.archive = open_archive()
+        self.transport = HttpTransport(cache=self.cache, archive=self.archive)
+        self.engine = FetchEngine(
+            self.fetch,
+            max_in_flight=config.MAX_CONCURRENT_REQUESTS,
+            requests_per_second=config.REQUESTS_PER_SECOND_PER_HOST,
+            cache=self.cache,
+            max_retries=config.MAX_FETCH_RETRIES,
+            rate_options=rate_options_from_config()
+        )
+        # Known listings are only re-fetched when new or due for a refresh
+        self.store = None
+        if config.INCREMENTAL_CRAWL:
+            self.store = ListingStore(config.LISTING_STORE_FILE, config.REFRESH_AFTER_DAYS)
+        # Checkpoints completed pages during run() so it can be resumed
+        self.journal = None
+        # HTML is parsed in worker processes so the event loop only waits on I/O
+        self.parse_workers = config.PARSE_WORKERS
+        if self.parse_workers is None:
+            self.parse_workers = os.cpu_count() or 1
+        self.parse_pool = None
+        self.extraction_sources = {}
+        # "state/county" regions whose search pages were not all fetched in the last crawl
+        self.incomplete_regions = set()
+        # URL frontier of the last crawl (every county each listing appeared in)
+        self.frontier = None
         
     def build_search_url(self, county, state='NC'):
         """Build search URL for a specific county"""
         # BizBuySell URL structure for location-based searches
         return f"{self.base_url}/businesses-for-sale/in/{state}/{county}-county/"
     
-    def scrape_listing_page(self, url):
-        """Scrape a single listing detail page"""
+    def fetch(self, url):
+        """Fetch a page, raising on HTTP errors (rate limiting is done by the engine)"""
+        # A detail page can stop downloading once every field it needs has arrived
+        watcher = None
+        if config.STREAMING_DETAIL_FETCH and page_kind(url) == 'detail':
+            watcher = DetailPageWatcher()
+        return self.transport.fetch(url, self.headers, watcher)
+    
+    def parse_listing_page(self, url, content):
+        """Extract listing fields from a detail page body"""
         try:
-            time.sleep(2)  # Be polite to the server
-            response = requests.get(url, headers=self.headers, timeout=30)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            listing_data = {
-                'url': url,
-                'scrape_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            
-            # Extract business type/category
-            category = soup.find('div', class_='category') or soup.find('span', class_='category')
-            listing_data['business_type'] = category.text.strip() if category else ''
-            
-            # Extract price
-            price_elem = soup.find('span', class_='price') or soup.find('div', class_='price')
-            if price_elem:
-                price_text = price_elem.text.strip()
-                listing_data['price'] = price_text
-            else:
-                listing_data['price'] = ''
-            
-            # Extract revenue
-            revenue_label = soup.find(text=re.compile(r'Revenue|Gross Sales', re.I))
-            if revenue_label:
-                revenue_elem = revenue_label.find_parent().find_next_sibling()
-                listing_data['revenue'] = revenue_elem.text.strip() if revenue_elem else ''
-            else:
-                listing_data['revenue'] = ''
-            
-            # Extract EBITDA / Cash Flow
-            ebitda_label = soup.find(text=re.compile(r'EBITDA|Cash Flow|Net Income', re.I))
-            if ebitda_label:
-                ebitda_elem = ebitda_label.find_parent().find_next_sibling()
-                listing_data['ebitda'] = ebitda_elem.text.strip() if ebitda_elem else ''
-            else:
-                listing_data['ebitda'] = ''
-            
-            # Extract franchise status
-            franchise_label = soup.find(text=re.compile(r'Franchise', re.I))
-            if franchise_label:
-                franchise_elem = franchise_label.find_parent().find_next_sibling()
-                franchise_text = franchise_elem.text.strip() if franchise_elem else ''
-                listing_data['franchise'] = 'Yes' if 'yes' in franchise_text.lower() else 'No'
-            else:
-                listing_data['franchise'] = 'No'
-            
-            # Extract established year
-            established_label = soup.find(text=re.compile(r'Established|Year Established', re.I))
-            if established_label:
-                established_elem = established_label.find_parent().find_next_sibling()
-                listing_data['established_year'] = established_elem.text.strip() if established_elem else ''
-            else:
-                listing_data['established_year'] = ''
-            
-            # Extract business description
-            description = soup.find('div', class_='description') or soup.find('div', id='description')
-            listing_data['description'] = description.text.strip() if description else ''
-            
-            # Extract business name/title
-            title = soup.find('h1') or soup.find('title')
-            listing_data['business_name'] = title.text.strip() if title else ''
-            
-            # Extract location details
-            location = soup.find('span', class_='location') or soup.find('div', class_='location')
-            listing_data['location'] = location.text.strip() if location else ''
-            
-            # Extract employees count
-            employees_label = soup.find(text=re.compile(r'Employees', re.I))
-            if employees_label:
-                employees_elem = employees_label.find_parent().find_next_sibling()
-                listing_data['employees'] = employees_elem.text.strip() if employees_elem else ''
-            else:
-                listing_data['employees'] = ''
-            
-            # Extract facilities info
-            facilities_label = soup.find(text=re.compile(r'Facilities|Real Estate', re.I))
-            if facilities_label:
-                facilities_elem = facilities_label.find_parent().find_next_sibling()
-                listing_data['facilities'] = facilities_elem.text.strip() if facilities_elem else ''
-            else:
-                listing_data['facilities'] = ''
-            
-            # Extract reason for selling
-            reason_label = soup.find(text=re.compile(r'Reason for Selling', re.I))
-            if reason_label:
-                reason_elem = reason_label.find_parent().find_next_sibling()
-                listing_data['reason_for_selling'] = reason_elem.text.strip() if reason_elem else ''
-            else:
-                listing_data['reason_for_selling'] = ''
-            
-            # Extract listing ID
-            listing_id_match = re.search(r'/listing/(\d+)', url)
-            listing_data['listing_id'] = listing_id_match.group(1) if listing_id_match else ''
-            
-            return listing_data
-            
+            with metrics.timer('parse_seconds', page='detail'):
+                return parse_listing(content, url)
         except Exception as e:
             print(f"Error scraping listing {url}: {str(e)}")
             return None
     
-    def scrape_search_results(self, county):
-        """Scrape all listings from a county search page"""
-        search_url = self.build_search_url(county)
-        all_listings = []
-        page = 1
+    async def parse_in_pool(self, page, func, *args):
+        """
+        Run a parse function in the parser process pool without blocking the event loop
         
-        print(f"Scraping {county.title()} County...")
+        Args:
+            page: Page kind for the parse_seconds metric ('search' or 'detail')
+            func: Picklable module-level parse function
+            *args: Its arguments (raw bytes and strings only)
+        """
+        if not self.parse_workers:
+            with metrics.timer('parse_seconds', page=page):
+                return func(*args)
+        if self.parse_pool is None:
+            self.parse_pool = ProcessPoolExecutor(self.parse_workers)
+        loop = asyncio.get_running_loop()
+        try:
+            result, seconds = await loop.run_in_executor(self.parse_pool, timed_parse, func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool for the next page
+            self.parse_pool = None
+            raise
+        metrics.observe('parse_seconds', seconds, page=page)
+        return result
+    
+    def close_parse_pool(self):
+        """Stop the parser worker processes"""
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
+            self.parse_pool = None
+    
+    async def scrape_listing_page_async(self, url):
+        """Fetch a single listing detail page through the fetch engine and parse it off the loop"""
+        response = await self.engine.fetch(url)
+        if response is None:
+            return None
+        try:
+            record, source, selectors = await self.parse_in_pool(
+                'detail', parse_listing_detailed, response.content, url, config.PARSER_BACKEND
+            )
+        except Exception as e:
+            print(f"Error scraping listing {url}: {str(e)}")
+            return None
+        # How often embedded structured data spared (part of) the DOM walk
+        self.extraction_sources[source] = self.extraction_sources.get(source, 0) + 1
+        metrics.inc('detail_extraction_total', source=source)
+        # Parsing may happen in a worker process, so the hit counts are kept here
+        DETAIL_SELECTORS.count(selectors)
+        return Listing.from_dict(record)
+    
+    def scrape_listing_page(self, url):
+        """Scrape a single listing detail page"""
+        return asyncio.run(self.scrape_listing_page_async(url))
+    
+    async def fetch_search_page(self, url, page):
+        """
+        Fetch and parse one search results page (or take it from the run journal)
+
+        Returns:
+            Dict with listing_urls, has_next, card_prices and page_count (the
+            last page number the page advertises, or None), or None if the
+            fetch failed
+        """
+        journaled = self.journal.lookup('search', url) if self.journal else None
+        if journaled is not None:
+            return {'card_prices': {}, 'page_count': None, **journaled}
+
+        print(f"  Fetching page {page}...")
+        response = await self.engine.fetch(url)
+        if response is None:
+            return None
+        # Only the listing links and the "Next" link are parsed
+        listing_urls, has_next, card_prices = await self.parse_in_pool(
+            'search', parse_search_page, response.content, self.base_url, config.PARSER_BACKEND
+        )
+        result = {
+            'listing_urls': listing_urls, 'has_next': has_next, 'card_prices': card_prices,
+            'page_count': search_page_count(response.content, page),
+        }
+        if self.journal:
+            self.journal.record('search', url, result)
+        return result
+
+    async def crawl_search_pages(self, county, state='NC', first_page=1, last_page=None):
+        """
+        Yield (listing_urls, card_prices) for each search results page of a county
+
+        The first page tells how many pages there are (result count or
+        pagination links); the rest are then requested together, within the
+        fetch engine's politeness budget, instead of one "Next" at a time.
+        Pages are still yielded in order, and the walk stops at the first page
+        whose listings were all seen on earlier pages of this county.
+
+        Raises SearchIncomplete (after yielding the pages before it) when a
+        page cannot be fetched, so the county is not treated as fully crawled.
+
+        Args:
+            county: County slug
+            state: State code
+            first_page: First search page to fetch
+            last_page: Last search page to fetch (defaults to config.MAX_PAGES_PER_COUNTY)
+        """
+        from pipeline import SearchIncomplete
+
+        search_url = self.build_search_url(county, state)
+        last_page = min(last_page or config.MAX_PAGES_PER_COUNTY, config.MAX_PAGES_PER_COUNTY)
+
+        def page_url(page):
+            return f"{search_url}?page={page}" if page > 1 else search_url
         
-        while True:
-            try:
-                # Build paginated URL
-                if page > 1:
-                    paginated_url = f"{search_url}?page={page}"
-                else:
-                    paginated_url = search_url
-                
-                print(f"  Fetching page {page}...")
-                time.sleep(2)  # Rate limiting
-                
-                response = requests.get(paginated_url, headers=self.headers, timeout=30)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Find all listing links
-                listing_links = soup.find_all('a', href=re.compile(r'/listing/'))
+        if first_page == 1 and last_page == config.MAX_PAGES_PER_COUNTY:
+            print(f"Scraping {county.title()} County, {state}...")
+        else:
+            print(f"Scraping {county.title()} County, {state} (pages {first_page}-{last_page})...")
+        
+        seen = set()
+        pending = {}
+        page = first_page
+        try:
+            while page <= last_page:
+                try:
+                    if page in pending:
+                        result = await pending.pop(page)
+                    else:
+                        result = await self.fetch_search_page(page_url(page), page)
+                except Exception as e:
+                    print(f"Error scraping search results for {county}: {str(e)}")
+                    raise SearchIncomplete(f"{state}/{county} page {page}") from e
+                if result is None:
+                    raise SearchIncomplete(f"{state}/{county} page {page}")
                 
-                if not listing_links:
+                listing_urls = result['listing_urls']
+                if not listing_urls:
                     print(f"  No more listings found on page {page}")
                     break
+                if seen.issuperset(listing_urls):
+                    # Past the real last page some sites repeat the final page
+                    print(f"  Page {page} only repeats listings already seen, stopping")
+                    metrics.inc('search_pages_early_stop_total')
+                    break
+                seen.update(listing_urls)
                 
-                # Get unique listing URLs
-                listing_urls = set()
-                for link in listing_links:
-                    href = link.get('href')
-                    if href and '/listing/' in href:
-                        full_url = href if href.startswith('http') else self.base_url + href
-                        listing_urls.add(full_url)
+                # Schedule every remaining page the site advertises at once
+                if not pending and result['page_count']:
+                    upto = min(result['page_count'], last_page)
+                    for later in range(page + 1, upto + 1):
+                        pending[later] = asyncio.ensure_future(self.fetch_search_page(page_url(later), later))
+                    if pending:
+                        metrics.inc('search_pages_prefetched_total', len(pending))
                 
                 print(f"  Found {len(listing_urls)} unique listings on page {page}")
+                yield listing_urls, result['card_prices']
                 
-                # Scrape each listing
-                for listing_url in listing_urls:
-                    listing_data = self.scrape_listing_page(listing_url)
-                    if listing_data:
-                        listing_data['county'] = county.title()
-                        all_listings.append(listing_data)
-                
-                # Check for next page
-                next_button = soup.find('a', text=re.compile(r'Next|›'))
-                if not next_button or page >= 20:  # Safety limit
+                # Check for next page (unless it is already on its way)
+                if page + 1 not in pending and not result['has_next']:
                     break
-                
                 page += 1
-                
-            except Exception as e:
-                print(f"Error scraping search results for {county}: {str(e)}")
-                break
-        
-        return all_listings
+        finally:
+            for task in pending.values():
+                if task.done() and not task.cancelled():
+                    task.exception()  # already failed; nothing left to report
+                else:
+                    task.cancel()
+    
+    def finish_crawl(self):
+        """Flag listings that disappeared and report listing store activity"""
+        if self.store:
+            # A county whose search pages failed part-way was not fully seen, so
+            # its missing listings are not evidence of removal
+            removed = self.store.mark_removed(self.incomplete_regions)
+            stats = self.store.stats
+            print(f"\nListing store: {stats['new']} new, {stats['refreshed']} refreshed, "
+                  f"{stats['reused']} reused without fetching, {stats['changed']} changed, "
+                  f"{len(removed)} removed since last run")
+            if self.incomplete_regions:
+                print(f"Removal check skipped for {len(self.incomplete_regions)} incompletely crawled "
+                      f"counties: {', '.join(sorted(self.incomplete_regions))}")
+    
+    def stream_listings(self, sinks, counties=None, units=None):
+        """
+        Crawl and hand each record to the sinks as soon as it is parsed
+
+        Args:
+            sinks: Objects with write_batch(frame) and close()
+            counties: NC counties to crawl (defaults to every county in config.STATES)
+            units: Explicit sharding.WorkUnit list; takes precedence over counties
+        """
+        # Imported here: the pipeline's normalize stage loads pandas
+        from pipeline import ListingPipeline
+
+        if units is None:
+            units = plan_units({'NC': counties} if counties else self.states)
+        self.extraction_sources = {}
+        DETAIL_SELECTORS.reset_counts()
+        pipeline = ListingPipeline(
+            self, sinks, units,
+            queue_size=config.PIPELINE_QUEUE_SIZE,
+            batch_size=config.PIPELINE_BATCH_SIZE,
+            flush_seconds=config.PIPELINE_FLUSH_SECONDS
+        )
+        try:
+            total = pipeline.run()
+        finally:
+            self.close_parse_pool()
+        self.incomplete_regions = {f"{unit.state}/{unit.county}" for unit in pipeline.incomplete_units}
+        self.frontier = pipeline.frontier
+        for county, count in pipeline.county_counts.items():
+            print(f"Collected {count} listings from {county} County")
+        if pipeline.frontier.duplicates:
+            print(f"{pipeline.frontier.duplicates} repeat sightings of {len(pipeline.frontier)} listings "
+                  f"were fetched only once")
+        if self.extraction_sources:
+            sources = self.extraction_sources
+            print(f"Detail pages: {sources.get('structured', 0)} from structured data alone, "
+                  f"{sources.get('mixed', 0)} structured + DOM, {sources.get('dom', 0)} DOM only")
+        DETAIL_SELECTORS.report("Detail page")
+        stopped = metrics.counter_value('stream_pages_total', result='stopped_early')
+        if stopped:
+            streamed = metrics.counter_value('stream_pages_total')
+            saved = metrics.counter_value('stream_bytes_saved_total')
+            print(f"Streaming: {stopped} of {streamed} detail pages stopped early, "
+                  f"{saved / 1024:.0f} KB not downloaded ({saved / stopped / 1024:.1f} KB per page)")
+        if pipeline.first_record_after is not None:
+            print(f"First record written after {pipeline.first_record_after:.1f} seconds")
+        if pipeline.skipped_by_card or pipeline.filtered_out:
+            print(f"Filters: {pipeline.skipped_by_card} detail pages skipped from search-card prices, "
+                  f"{pipeline.filtered_out} listings dropped after parsing")
+        print(f"\nTotal listings collected: {total}")
+        return total
+    
+    def scrape_search_results(self, county):
+        """Scrape all listings from a county search page"""
+        from pipeline import ListSink
+
+        sink = ListSink()
+        self.stream_listings([sink], counties=[county])
+        return sink.records
     
     def scrape_all_counties(self):
         """Scrape listings from all specified counties"""
-        all_listings = []
-        
-        for county in self.counties:
-            county_listings = self.scrape_search_results(county)
-            all_listings.extend(county_listings)
-            print(f"Collected {len(county_listings)} listings from {county.title()} County")
-        
-        print(f"\nTotal listings collected: {len(all_listings)}")
-        return all_listings
+        from pipeline import ListSink
+
+        sink = ListSink()
+        self.stream_listings([sink])
+        self.finish_crawl()
+        return sink.records
     
     def update_google_sheet(self, listings_data):
         """Update Google Sheet with scraped data"""
-        try:
-            # Define the scope
-            scope = ['https://spreadsheets.google.com/feeds',
-                    'https://www.googleapis.com/auth/drive']
-            
-            # Authenticate
-            creds = ServiceAccountCredentials.from_json_keyfile_name(
-                self.google_creds_file, scope)
-            client = gspread.authorize(creds)
-            
-            # Open the sheet
-            try:
-                sheet = client.open(self.sheet_name).sheet1
-            except:
-                # Create new spreadsheet if it doesn't exist
-                spreadsheet = client.create(self.sheet_name)
-                spreadsheet.share('', perm_type='anyone', role='reader')
-                sheet = spreadsheet.sheet1
-            
-            # Convert to DataFrame for easier manipulation
-            df = pd.DataFrame(listings_data)
-            
-            # Define column order
-            columns = [
-                'listing_id', 'county', 'business_name', 'business_type', 
-                'price', 'revenue', 'ebitda', 'franchise', 'established_year',
-                'location', 'employees', 'description', 'facilities', 
-                'reason_for_selling', 'url', 'scrape_date'
-            ]
-            
-            # Reorder columns (add missing ones with empty values)
-            for col in columns:
-                if col not in df.columns:
-                    df[col] = ''
-            
-            df = df[columns]
-            
-            # Clear existing data
-            sheet.clear()
-            
-            # Update with new data
-            sheet.update([df.columns.values.tolist()] + df.values.tolist())
-            
-            print(f"\nSuccessfully updated Google Sheet: {self.sheet_name}")
-            print(f"Total rows: {len(df) + 1}")  # +1 for header
-            
-            return True
-            
-        except Exception as e:
-            print(f"Error updating Google Sheet: {str(e)}")
-            return False
+        # Imported here so runs that never touch the sheet skip gspread / oauth2client
+        from sheet_sync import update_google_sheet
+        
+        return update_google_sheet(listings_data, LISTING_COLUMNS, self.google_creds_file, self.sheet_name)
     
     def save_to_csv(self, listings_data, filename='bizbuysell_listings.csv'):
-        """Save listings to CSV as backup"""
-        df = pd.DataFrame(listings_data)
+        """Save listings to CSV as backup (a DataFrame is written as-is, without another copy)"""
+        import pandas as pd
+
+        df = listings_data if isinstance(listings_data, pd.DataFrame) else pd.DataFrame(listings_data)
         df.to_csv(filename, index=False)
         print(f"Data saved to {filename}")
     
-    def run(self):
-        """Main execution method"""
+    def run(self, resume=False, sync_sheet=True):
+        """
+        Main execution method
+        
+        Args:
+            resume: Continue an interrupted run from the run journal instead of starting over
+            sync_sheet: Update the Google Sheet after the crawl (False for a crawl-only run)
+        """
         print("=" * 60)
         print("BizBuySell Scraper - North Carolina Counties")
         print("=" * 60)
         print(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"Counties: {', '.join([c.title() for c in self.counties])}")
+        for state, counties in self.states.items():
+            print(f"Counties ({state}): {', '.join([c.title() for c in counties])}")
         print("=" * 60)
         
-        # Scrape all listings
-        listings = self.scrape_all_counties()
-        
-        if not listings:
-            print("\nNo listings found!")
-            return
-        
-        # Save to CSV backup
-        self.save_to_csv(listings)
-        
-        # Update Google Sheet
-        self.update_google_sheet(listings)
+        import pandas as pd
+
+        from pipeline import CsvSink
+
+        self.journal = RunJournal(config.RUN_JOURNAL_FILE, resume=resume)
+        try:
+            # Scrape all listings, streaming each record to the CSV as it is parsed; the
+            # sink fills in counties and near-duplicate groups once every listing is known
+            sinks = [CsvSink(config.CSV_BACKUP_FILE, LISTING_COLUMNS, group_duplicates=True)]
+            if config.HISTORY_ENABLED:
+                # Imported here: pyarrow is only loaded when the history is kept
+                from history_store import HistorySink, open_history
+                history = open_history()
+                if history:
+                    sinks.append(HistorySink(history))
+            total = self.stream_listings(sinks)
+            self.finish_crawl()
+            
+            if not total:
+                print("\nNo listings found!")
+                self.journal.finish()
+                return
+            print(f"Data saved to {config.CSV_BACKUP_FILE}")
+            if self.journal.resumed:
+                print(f"Reused {self.journal.resumed} pages from the interrupted run")
+            
+            # Only the sheet sync needs every row at once, so only it reads the CSV back
+            if not sync_sheet or self.update_google_sheet(
+                    pd.read_csv(config.CSV_BACKUP_FILE, dtype=str, keep_default_na=False)):
+                self.journal.finish()
+            # Otherwise the journal stays open-ended so --resume can retry without re-crawling
+        finally:
+            self.journal.close()
+            self.journal = None
         
         print("=" * 60)
         print(f"End time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -307,9 +418,21 @@ class BizBuySellScraper:
 
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="BizBuySell scraper for North Carolina counties")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run from the run journal")
+    add_cli_arguments(parser)
+    args = parser.parse_args()
+    
     # Initialize and run scraper
     scraper = BizBuySellScraper(
         google_creds_file='credentials.json',
         sheet_name='BizBuySell NC Listings'
     )
-    scraper.run()
+    try:
+        with profiled(args.profile):
+            scraper.run(resume=args.resume)
+    finally:
+        write_outputs(args)
@@ -2,25 +2,54 @@
 Improved BizBuySell Scraper with Better Anti-Detection
 """
 
-import requests
-from bs4 import BeautifulSoup
-import json
-import time
-import pandas as pd
+import asyncio
 from datetime import datetime
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 import re
 import random
 
+import config
+from fetch_engine import FetchEngine
+from html_archive import open_archive
+from html_parsing import make_soup
+from http_cache import ResponseCache
+from listing_record import Listing, listings_frame
+from metrics import add_cli_arguments, metrics, profiled, write_outputs
+from rate_control import rate_options_from_config
+from run_journal import RunJournal
+from selector_registry import SelectorRegistry
+from url_frontier import UrlFrontier
+from transport import HttpTransport
+
+
+# Search-page layouts seen so far, best first
+LISTING_CARD_SELECTORS = SelectorRegistry({
+    'card': (
+        'a[href*="/businesses-for-sale/"]',
+        'div[class*="listing" i], div[class*="business-card" i]',
+        'article',
+    ),
+})
+
+# Fields inside one listing card
+CARD_FIELD_SELECTORS = SelectorRegistry({
+    'business_name': (
+        'h2',
+        'h3',
+        'a[class*="title" i], a[class*="name" i]',
+        'span[class*="title" i], span[class*="name" i]',
+    ),
+    'price': ('[class*="price" i]',),
+    'location': ('[class*="location" i], [class*="city" i]',),
+    'url': ('a[href*="/businesses-for-sale/"]',),
+})
+PRICE_TEXT_RE = re.compile(r'\$[\d,]+')
+
 
 class ImprovedBizBuySellScraper:
     def __init__(self, google_creds_file='credentials.json', sheet_name='BizBuySell NC Listings'):
         self.base_url = "https://www.bizbuysell.com"
-        self.counties = [
-            'iredell', 'cabarrus', 'rowan', 'catawba', 
-            'gaston', 'lincoln', 'mecklenburg'
-        ]
+        self.states = config.STATES
+        self.counties = list(config.COUNTIES)
         self.google_creds_file = google_creds_file
         self.sheet_name = sheet_name
         
@@ -33,8 +62,29 @@ class ImprovedBizBuySellScraper:
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.1 Safari/605.1.15'
         ]
         
-        # Create a session to persist cookies
-        self.session = requests.Session()
+        self.cache = None
+        if config.HTTP_CACHE_ENABLED:
+            self.cache = ResponseCache(
+                config.HTTP_CACHE_DIR, config.HTTP_CACHE_MAX_MB * 1024 * 1024, config.HTTP_CACHE_TTL
+            )
+        
+        # Pooled keep-alive client; its session persists cookies between requests
+        # Raw pages are archived so extractor fixes can be backfilled offline
+        self.archive = open_archive()
+        self.transport = HttpTransport(cache=self.cache, archive=self.archive)
+        
+        # Adaptive per-host rate and retries replace the random sleeps and fixed 403 backoff
+        self.engine = FetchEngine(
+            self.fetch,
+            max_in_flight=config.MAX_CONCURRENT_REQUESTS,
+            requests_per_second=config.REQUESTS_PER_SECOND_PER_HOST,
+            cache=self.cache,
+            max_retries=config.MAX_FETCH_RETRIES,
+            rate_options=rate_options_from_config()
+        )
+        
+        # Checkpoints completed county pages during run() so it can be resumed
+        self.journal = None
         
     def get_headers(self):
         """Get realistic headers with rotating user agent"""
@@ -42,8 +92,6 @@ class ImprovedBizBuySellScraper:
             'User-Agent': random.choice(self.user_agents),
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
             'Sec-Fetch-Dest': 'document',
             'Sec-Fetch-Mode': 'navigate',
@@ -58,111 +106,77 @@ class ImprovedBizBuySellScraper:
         # BizBuySell uses various URL patterns
         return f"{self.base_url}/businesses-for-sale/{state}/{county}-county/"
     
-    def scrape_with_retry(self, url, max_retries=3):
-        """Try to fetch URL with retries and exponential backoff"""
-        for attempt in range(max_retries):
-            try:
-                # Random delay between 3-7 seconds to appear more human
-                delay = random.uniform(3, 7)
-                print(f"  Waiting {delay:.1f} seconds...")
-                time.sleep(delay)
-                
-                response = self.session.get(
-                    url, 
-                    headers=self.get_headers(),
-                    timeout=30,
-                    allow_redirects=True
-                )
-                
-                # Check if we got a valid response
-                if response.status_code == 200:
-                    return response
-                elif response.status_code == 403:
-                    print(f"  Got 403 Forbidden on attempt {attempt + 1}/{max_retries}")
-                    if attempt < max_retries - 1:
-                        # Exponential backoff
-                        wait_time = (2 ** attempt) * 5
-                        print(f"  Waiting {wait_time} seconds before retry...")
-                        time.sleep(wait_time)
-                else:
-                    print(f"  Got status code {response.status_code}")
-                    return None
-                    
-            except Exception as e:
-                print(f"  Error on attempt {attempt + 1}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(5)
-        
-        return None
+    def fetch(self, url):
+        """Fetch a page, raising on HTTP errors (the engine retries and adapts the rate)"""
+        return self.transport.fetch(url, self.get_headers())
     
-    def scrape_search_results(self, county):
+    def scrape_search_results(self, county, state='NC'):
         """Scrape listings from county - simplified approach"""
-        search_url = self.build_search_url(county)
-        all_listings = []
-        
+        search_url = self.build_search_url(county, config.STATE_SLUGS[state])
         print(f"\nScraping {county.title()} County...")
         print(f"URL: {search_url}")
         
-        # Try to get the search page
-        response = self.scrape_with_retry(search_url)
-        
+        response = self.engine.fetch_all([search_url])[0]
+        return self.parse_search_results(county, response)
+    
+    def parse_search_results(self, county, response):
+        """Extract listing cards from a fetched county search page"""
         if not response:
             print(f"  Could not access {county} county page")
             return []
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        with metrics.timer('parse_seconds', page='search'):
+            return self._parse_search_cards(county, make_soup(response.content))
+    
+    def _parse_search_cards(self, county, soup):
+        """Pull business name, price, location and URL out of each listing card"""
+        all_listings = []
         
-        # Look for listing cards/links - BizBuySell uses various class names
-        # We'll try multiple selectors
-        listing_elements = (
-            soup.find_all('a', href=re.compile(r'/businesses-for-sale/')) or
-            soup.find_all('div', class_=re.compile(r'listing|business-card', re.I)) or
-            soup.find_all('article')
-        )
+        # Look for listing cards/links - BizBuySell uses various class names,
+        # so the layouts seen so far are tried in one pass over the page
+        cards, selectors = LISTING_CARD_SELECTORS.select_all(soup)
+        LISTING_CARD_SELECTORS.count(selectors)
+        listing_elements = cards['card']
         
         print(f"  Found {len(listing_elements)} potential listings")
         
         # Extract basic info from search results page
         for elem in listing_elements[:10]:  # Limit to first 10 to be respectful
             try:
-                listing_data = {
-                    'county': county.title(),
-                    'scrape_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                
-                # Try to extract title/business name
-                title_elem = (
-                    elem.find('h2') or elem.find('h3') or 
-                    elem.find('a', class_=re.compile(r'title|name', re.I)) or
-                    elem.find('span', class_=re.compile(r'title|name', re.I))
+                listing = Listing(
+                    county=county.title(),
+                    scrape_date=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 )
+                found, selectors = CARD_FIELD_SELECTORS.select(elem)
+                
+                title_elem = found['business_name']
                 if title_elem:
-                    listing_data['business_name'] = title_elem.get_text(strip=True)
+                    listing.business_name = title_elem.get_text(strip=True)
                 
-                # Try to extract price
-                price_elem = (
-                    elem.find(class_=re.compile(r'price', re.I)) or
-                    elem.find(text=re.compile(r'\$[\d,]+'))
-                )
+                # A card without a price element may still show the amount as plain text
+                price_elem = found['price']
+                if price_elem is None:
+                    price_elem = elem.find(string=PRICE_TEXT_RE)
+                    if price_elem is not None:
+                        selectors['price'] = 'text'
                 if price_elem:
                     if hasattr(price_elem, 'get_text'):
-                        listing_data['price'] = price_elem.get_text(strip=True)
+                        listing.price = price_elem.get_text(strip=True)
                     else:
-                        listing_data['price'] = str(price_elem).strip()
+                        listing.price = str(price_elem).strip()
                 
-                # Try to extract location
-                location_elem = elem.find(class_=re.compile(r'location|city', re.I))
+                location_elem = found['location']
                 if location_elem:
-                    listing_data['location'] = location_elem.get_text(strip=True)
+                    listing.location = location_elem.get_text(strip=True)
                 
-                # Try to find the listing URL
-                link = elem.find('a', href=re.compile(r'/businesses-for-sale/'))
+                link = found['url']
                 if link and link.get('href'):
                     href = link['href']
-                    listing_data['url'] = href if href.startswith('http') else self.base_url + href
+                    listing.url = href if href.startswith('http') else self.base_url + href
                 
-                if listing_data.get('business_name') or listing_data.get('price'):
-                    all_listings.append(listing_data)
+                CARD_FIELD_SELECTORS.count(selectors)
+                if listing.business_name or listing.price:
+                    all_listings.append(listing)
                     
             except Exception as e:
                 print(f"  Error parsing listing: {str(e)}")
@@ -175,102 +189,131 @@ class ImprovedBizBuySellScraper:
         """Scrape all counties"""
         all_listings = []
         
-        # Visit homepage first to get cookies
+        # Visit homepage first to get cookies; it goes through the engine (but not
+        # the cache), so the host's rate controller paces the search pages after it
         print("Initializing session...")
-        try:
-            self.session.get(self.base_url, headers=self.get_headers(), timeout=10)
-            time.sleep(2)
-        except:
+        def warm_up(url):
+            return self.transport.get(url, self.get_headers())
+        
+        if asyncio.run(self.engine.fetch(self.base_url, warm_up)) is None:
             print("Could not access homepage, continuing anyway...")
         
-        for county in self.counties:
-            county_listings = self.scrape_search_results(county)
-            all_listings.extend(county_listings)
-            
-            # Longer delay between counties
-            if county != self.counties[-1]:
-                delay = random.uniform(5, 10)
-                print(f"\nWaiting {delay:.1f} seconds before next county...")
-                time.sleep(delay)
+        LISTING_CARD_SELECTORS.reset_counts()
+        CARD_FIELD_SELECTORS.reset_counts()
         
+        # Counties finished by an interrupted run come straight from the journal
+        regions = [(state, county) for state, counties in self.states.items() for county in counties]
+        county_results = {}
+        pending = []
+        for state, county in regions:
+            search_url = self.build_search_url(county, config.STATE_SLUGS[state])
+            journaled = self.journal.lookup('search', search_url) if self.journal else None
+            if journaled is not None:
+                county_results[state, county] = [Listing.from_dict(item) for item in journaled]
+            else:
+                pending.append((state, county, search_url))
+        
+        # Fetch the remaining county pages concurrently within the politeness budget
+        print(f"Fetching {len(pending)} county pages...")
+        responses = self.engine.fetch_all([search_url for _, _, search_url in pending])
+        
+        for (state, county, search_url), response in zip(pending, responses):
+            county_results[state, county] = self.parse_search_results(county, response)
+            if response and self.journal:
+                self.journal.record('search', search_url, [item.to_dict() for item in county_results[state, county]])
+        
+        # A listing shown in several counties is kept once, tagged with all of them
+        frontier = UrlFrontier(self.base_url)
+        by_url = {}
+        for state, county in regions:
+            for listing in county_results[state, county]:
+                if not listing.url:
+                    all_listings.append(listing)
+                    continue
+                url = frontier.add(listing.url, county)
+                if url:
+                    listing.url = url
+                    by_url[url] = listing
+                    all_listings.append(listing)
+        for url, listing in by_url.items():
+            listing.county = frontier.county_label(url, listing.county)
+        if frontier.duplicates:
+            print(f"Merged {frontier.duplicates} listings that appeared in more than one county")
+        
+        LISTING_CARD_SELECTORS.report("Search page")
+        CARD_FIELD_SELECTORS.report("Listing card")
         print(f"\nTotal listings collected: {len(all_listings)}")
         return all_listings
     
     def update_google_sheet(self, listings_data):
         """Update Google Sheet with data"""
-        if not listings_data:
-            print("No data to update in Google Sheet")
-            return False
-            
-        try:
-            scope = ['https://spreadsheets.google.com/feeds',
-                    'https://www.googleapis.com/auth/drive']
-            
-            creds = ServiceAccountCredentials.from_json_keyfile_name(
-                self.google_creds_file, scope)
-            client = gspread.authorize(creds)
-            
-            try:
-                sheet = client.open(self.sheet_name).sheet1
-            except:
-                spreadsheet = client.create(self.sheet_name)
-                spreadsheet.share('', perm_type='anyone', role='reader')
-                sheet = spreadsheet.sheet1
-            
-            df = pd.DataFrame(listings_data)
-            
-            columns = [
-                'county', 'business_name', 'price', 'location', 
-                'url', 'scrape_date'
-            ]
-            
-            for col in columns:
-                if col not in df.columns:
-                    df[col] = ''
-            
-            df = df[columns]
-            
-            sheet.clear()
-            sheet.update([df.columns.values.tolist()] + df.values.tolist())
-            
-            print(f"\nSuccessfully updated Google Sheet: {self.sheet_name}")
-            print(f"Total rows: {len(df) + 1}")
-            return True
-            
-        except Exception as e:
-            print(f"Error updating Google Sheet: {str(e)}")
-            return False
+        # Imported here so runs that never touch the sheet skip gspread / oauth2client
+        from sheet_sync import update_google_sheet
+        
+        columns = [
+            'county', 'business_name', 'price', 'location', 
+            'url', 'scrape_date', 'duplicate_group'
+        ]
+        return update_google_sheet(listings_data, columns, self.google_creds_file, self.sheet_name)
     
     def save_to_csv(self, listings_data, filename='bizbuysell_listings.csv'):
-        """Save to CSV"""
-        if not listings_data:
+        """Save to CSV (a DataFrame is written as-is, without another copy)"""
+        import pandas as pd
+
+        if len(listings_data) == 0:
             print("No data to save to CSV")
             return
             
-        df = pd.DataFrame(listings_data)
+        df = listings_data if isinstance(listings_data, pd.DataFrame) else listings_frame(listings_data)
         df.to_csv(filename, index=False)
         print(f"Data saved to {filename}")
     
-    def run(self):
-        """Main execution"""
+    def run(self, resume=False, sync_sheet=True):
+        """Main execution (sync_sheet=False skips the Google Sheet update)"""
         print("=" * 60)
         print("Improved BizBuySell Scraper - North Carolina Counties")
         print("=" * 60)
         print(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("=" * 60)
         
-        listings = self.scrape_all_counties()
-        
-        if not listings:
-            print("\nNo listings found!")
-            print("This could mean:")
-            print("1. BizBuySell is still blocking automated access")
-            print("2. There are no active listings in these counties")
-            print("3. The website structure has changed significantly")
-            return
-        
-        self.save_to_csv(listings)
-        self.update_google_sheet(listings)
+        # pandas arrives with these; imported here so loading the module stays cheap
+        from dedup import assign_duplicate_groups
+        from normalize import filter_listings, normalize_money_columns
+
+        self.journal = RunJournal(config.RUN_JOURNAL_FILE, resume=resume)
+        try:
+            listings = self.scrape_all_counties()
+            
+            if not listings:
+                print("\nNo listings found!")
+                print("This could mean:")
+                print("1. BizBuySell is still blocking automated access")
+                print("2. There are no active listings in these counties")
+                print("3. The website structure has changed significantly")
+                self.journal.finish()
+                return
+            
+            # One columnar batch, built once: typed prices and config.py filters are
+            # applied to it and the CSV, history and sheet all read the same frame
+            with metrics.timer('normalize_seconds'):
+                listings = filter_listings(normalize_money_columns(listings_frame(listings)))
+            listings = assign_duplicate_groups(listings)
+            
+            with metrics.timer('sink_write_seconds', sink='csv'):
+                self.save_to_csv(listings)
+            if config.HISTORY_ENABLED:
+                # Imported here: pyarrow is only loaded when the history is kept
+                from history_store import open_history
+                history = open_history()
+                if history:
+                    with metrics.timer('sink_write_seconds', sink='history'):
+                        print(f"History: {history.append(listings)} listings added to {history.root}")
+            if not sync_sheet or self.update_google_sheet(listings):
+                self.journal.finish()
+            # Otherwise the journal stays open-ended so --resume can retry without re-crawling
+        finally:
+            self.journal.close()
+            self.journal = None
         
         print("=" * 60)
         print(f"End time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -278,8 +321,20 @@ class ImprovedBizBuySellScraper:
 
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Improved BizBuySell scraper for North Carolina counties")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted run from the run journal")
+    add_cli_arguments(parser)
+    args = parser.parse_args()
+    
     scraper = ImprovedBizBuySellScraper(
         google_creds_file='credentials.json',
         sheet_name='BizBuySell NC Listings'
     )
-    scraper.run()
+    try:
+        with profiled(args.profile):
+            scraper.run(resume=args.resume)
+    finally:
+        write_outputs(args)
@@ -0,0 +1,131 @@
+"""
+Single command-line entry point
+Each subcommand imports only what it needs, so a crawl-only run never loads
+gspread / oauth2client and export / sync-sheet never load the parsers or the
+HTTP stack. Settings come from config.py.
+
+Usage:
+    python cli.py crawl [--improved] [--resume] [--sync-sheet]
+    python cli.py sync-sheet [--csv bizbuysell_listings.csv]
+    python cli.py export --format xlsx --output listings.xlsx
+    python cli.py reextract --since 2025-01-01 --output reextracted.csv
+    python cli.py bench --latency-ms 20
+"""
+
+import argparse
+import sys
+
+import config
+from metrics import add_cli_arguments, profiled, write_outputs
+
+
+EXPORT_FORMATS = ('csv', 'xlsx', 'json', 'parquet')
+
+
+def crawl(args):
+    """Crawl the configured regions; the sheet is only updated with --sync-sheet"""
+    if args.improved:
+        from bizbuysell_scraper_improved import ImprovedBizBuySellScraper as Scraper
+    else:
+        from bizbuysell_scraper import BizBuySellScraper as Scraper
+
+    scraper = Scraper(google_creds_file=config.GOOGLE_CREDENTIALS_FILE, sheet_name=config.GOOGLE_SHEET_NAME)
+    try:
+        with profiled(args.profile):
+            scraper.run(resume=args.resume, sync_sheet=args.sync_sheet)
+    finally:
+        write_outputs(args)
+
+
+def sync_sheet(args):
+    """Push an existing listings CSV to the Google Sheet without crawling"""
+    import pandas as pd
+
+    from sheet_sync import update_google_sheet
+
+    listings = pd.read_csv(args.csv, dtype=str, keep_default_na=False)
+    # The CSV header is the sheet layout (both scrapers write their own columns)
+    ok = update_google_sheet(listings, list(listings.columns), config.GOOGLE_CREDENTIALS_FILE,
+                             config.GOOGLE_SHEET_NAME)
+    return 0 if ok else 1
+
+
+def export(args):
+    """Convert the listings CSV to another format"""
+    import pandas as pd
+
+    listings = pd.read_csv(args.csv, dtype=str, keep_default_na=False)
+    output = args.output or f"bizbuysell_listings.{args.format}"
+    if args.format == 'csv':
+        listings.to_csv(output, index=False)
+    elif args.format == 'xlsx':
+        listings.to_excel(output, index=False, sheet_name='Listings')
+    elif args.format == 'json':
+        listings.to_json(output, orient='records', indent=2)
+    else:
+        listings.to_parquet(output, index=False)
+    print(f"Exported {len(listings)} listings to {output}")
+    return 0
+
+
+def reextract(args, extra):
+    """Re-run the extractors over the HTML archive (options as in html_archive.py reextract)"""
+    from html_archive import main as archive_main
+
+    archive_main(['--archive-dir', args.archive_dir, 'reextract', *extra])
+    return 0
+
+
+def bench(args, extra):
+    """Offline benchmark (options as in benchmark.py)"""
+    from benchmark import main as bench_main
+
+    bench_main(extra)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="BizBuySell scraper")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('crawl', help="crawl listings to the CSV (and history / archive when enabled)")
+    run.add_argument('--improved', action='store_true', help="use the search-card scraper")
+    run.add_argument('--resume', action='store_true', help="continue an interrupted run from the run journal")
+    run.add_argument('--sync-sheet', action='store_true', help="update the Google Sheet after the crawl")
+    add_cli_arguments(run)
+
+    sync = commands.add_parser('sync-sheet', help="update the Google Sheet from an existing CSV")
+    sync.add_argument('--csv', default=config.CSV_BACKUP_FILE)
+
+    out = commands.add_parser('export', help="convert the listings CSV to another format")
+    out.add_argument('--format', choices=EXPORT_FORMATS, default='xlsx')
+    out.add_argument('--csv', default=config.CSV_BACKUP_FILE)
+    out.add_argument('--output')
+
+    again = commands.add_parser('reextract', help="re-run the extractors over archived pages (offline)",
+                                add_help=False)
+    again.add_argument('--archive-dir', default=config.HTML_ARCHIVE_DIR)
+
+    commands.add_parser('bench', help="offline benchmark against a local stand-in server", add_help=False)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    # reextract and bench hand their remaining options to the module they wrap
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'reextract':
+        return reextract(args, extra)
+    if args.command == 'bench':
+        return bench(args, extra)
+    if extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    if args.command == 'crawl':
+        return crawl(args)
+    if args.command == 'sync-sheet':
+        return sync_sheet(args)
+    return export(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
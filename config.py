@@ -16,16 +16,104 @@ COUNTIES = [
     "mecklenburg"
 ]
 
+# Regions crawled, by state code; add states (and their URL slugs) here
+STATES = {
+    "NC": COUNTIES,
+}
+STATE_SLUGS = {
+    "NC": "north-carolina",
+}
+
 # Scraping Configuration
 DELAY_BETWEEN_REQUESTS = 2  # seconds - be respectful to servers
 MAX_PAGES_PER_COUNTY = 20   # maximum pages to scrape per county
 REQUEST_TIMEOUT = 30         # seconds
+MAX_CONCURRENT_REQUESTS = 4  # maximum requests in flight at once
+REQUESTS_PER_SECOND_PER_HOST = 1 / DELAY_BETWEEN_REQUESTS  # starting politeness budget per host
+PIPELINE_QUEUE_SIZE = 100    # records buffered between crawl stages
+PIPELINE_BATCH_SIZE = 50     # records normalized and written per batch
+PIPELINE_FLUSH_SECONDS = 5   # write a partial batch once it is this old
+PARSER_BACKEND = "lxml-xpath"  # "html.parser", "lxml" or "lxml-xpath" (fastest)
+PARSE_WORKERS = None         # parser processes (None = one per CPU core, 0 = parse in-process)
+SELECTOR_DRIFT_SHARE = 0.5   # flag a field in the run summary when its first selector wins less often than this
+
+# HTTP Transport (shared by both scrapers)
+HTTP2_ENABLED = True        # use HTTP/2 when httpx + h2 are installed: pip install "httpx[http2]"
+HTTP_CONNECT_RETRIES = 2    # retries for failed connects (status retries are adaptive, see below)
+DNS_CACHE_SECONDS = 300     # reuse the transport's DNS lookups for this long (0 disables)
+
+# Streaming Detail Fetch
+# Detail pages are read in chunks and the connection is closed as soon as every
+# field the extractors read has arrived; truncated bodies are never cached or
+# archived. Embedded JSON state placed below those fields would be cut off, so
+# this is opt-in.
+STREAMING_DETAIL_FETCH = False
+STREAMING_CHUNK_KB = 16      # bytes read between checks
+STREAMING_MAX_CHECKS = 4     # parses of a partial page before it is simply read to the end
+
+# Sharding (python sharding.py work / static / merge)
+SHARD_QUEUE_FILE = "shard_queue.db"  # lease queue shared by the workers
+SHARD_OUTPUT_DIR = "shards"          # one CSV per worker or CI shard
+SHARD_PAGES_PER_UNIT = 10            # search pages per work unit
+SHARD_LEASE_SECONDS = 900            # a unit whose lease is not renewed for this long is retried
+
+# Adaptive Rate Control
+# The per-host rate rises while responses are healthy and is cut on
+# 403/429/5xx, dropped connections or rising latency; Retry-After is honored
+MIN_REQUESTS_PER_SECOND = 0.1   # never slower than this
+MAX_REQUESTS_PER_SECOND = 2.0   # never faster than this
+RATE_INCREASE_STEP = 0.05       # requests/second added per healthy response
+RATE_DECREASE_FACTOR = 0.5      # rate multiplier when the server pushes back
+RATE_LATENCY_FACTOR = 2.0       # latency this many times the best seen counts as pushback
+MAX_RETRY_AFTER = 600           # seconds - cap on a Retry-After pause
+MAX_FETCH_RETRIES = 3           # extra attempts for throttled or dropped requests
+
+# Incremental Crawl Configuration
+INCREMENTAL_CRAWL = True           # only fetch detail pages for new or stale listings
+LISTING_STORE_FILE = "listings.db"  # SQLite store of every listing seen
+REFRESH_AFTER_DAYS = 7             # re-fetch a known listing after this many days
+
+# Near-Duplicate Detection (duplicate_group column)
+DEDUP_ENABLED = True
+DEDUP_NUM_PERM = 128          # MinHash functions per listing
+DEDUP_BANDS = 32              # LSH bands (4 rows each); more bands catch weaker matches
+DEDUP_SIMILARITY = 0.5        # minimum estimated Jaccard similarity of name + description
+DEDUP_PRICE_TOLERANCE = 0.15  # asking prices may differ by at most this fraction
+
+# Listing History (Parquet, one partition per scrape date; needs pyarrow)
+HISTORY_ENABLED = True
+HISTORY_DIR = "history"
+
+# Raw HTML Archive (python html_archive.py reextract; needs zstandard)
+HTML_ARCHIVE_ENABLED = True
+HTML_ARCHIVE_DIR = "archive"
+HTML_ARCHIVE_SEGMENT_MB = 64  # start a new segment file past this size
+HTML_ARCHIVE_LEVEL = 10       # zstd level (1-22)
+
+# HTTP Response Cache
+HTTP_CACHE_ENABLED = True
+HTTP_CACHE_DIR = ".http_cache"
+HTTP_CACHE_MAX_MB = 200     # least recently used pages are evicted past this size
+HTTP_CACHE_TTL = {          # seconds a cached page is used without revalidating
+    "search": 6 * 3600,
+    "detail": 24 * 3600,
+}
+
+# Google Sheets Sync
+SHEET_SYNC_MODE = "diff"              # "diff" sends only changed rows, "replace" clears and rewrites
+SHEET_SYNC_CHUNK_ROWS = 500           # maximum rows per Sheets API request
+SHEETS_WRITE_REQUESTS_PER_MINUTE = 50  # stay under the per-user quota of 60
+
+# Run Journal (checkpoints for --resume)
+RUN_JOURNAL_FILE = "run_journal.jsonl"
 
 # Output Configuration
 CSV_BACKUP_FILE = "bizbuysell_listings.csv"
 SAVE_CSV_BACKUP = True
 
 # Optional Filters (leave empty for no filtering)
+# Price filters are checked on search-result cards, so filtered-out listings
+# are never fetched; listings with an undisclosed price or revenue are kept
 MIN_PRICE = None        # e.g., 50000 for $50,000 minimum
 MAX_PRICE = None        # e.g., 500000 for $500,000 maximum
 MIN_REVENUE = None      # e.g., 100000 for $100,000 minimum revenue
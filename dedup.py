@@ -0,0 +1,212 @@
+"""
+Near-duplicate listing detection
+The same business is often listed under several IDs (relisted, or listed by
+more than one broker). MinHash signatures over the business name and
+description are bucketed with LSH banding, so only listings that share a band
+are ever compared; candidates must also agree on price and location. Matches
+are grouped with union-find and every row gets a duplicate_group ID, in
+roughly linear time.
+"""
+
+import re
+import zlib
+
+import numpy as np
+
+import config
+from normalize import parse_money
+
+
+MERSENNE_PRIME = (1 << 31) - 1
+# Columns DuplicateFinder reads
+INPUT_COLUMNS = ('business_name', 'description', 'price', 'location', 'county', 'listing_id', 'url')
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def shingles(text, size=3):
+    """Hashed word n-grams of a text (the whole text when it is shorter than size)"""
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {zlib.crc32(' '.join(words).encode('utf-8'))} if words else set()
+    return {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    def __init__(self, num_perm=128, seed=1):
+        """
+        Args:
+            num_perm: Hash functions per signature
+            seed: Fixed so signatures are comparable between runs
+        """
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, MERSENNE_PRIME, num_perm).astype(np.uint64)
+        self.b = rng.randint(0, MERSENNE_PRIME, num_perm).astype(np.uint64)
+
+    def signature(self, hashed_shingles):
+        """MinHash signature of a set of shingle hashes (None for an empty set)"""
+        if not hashed_shingles:
+            return None
+        values = np.fromiter(hashed_shingles, dtype=np.uint64, count=len(hashed_shingles)) % MERSENNE_PRIME
+        # (a * x + b) mod p for every hash function and shingle at once
+        return ((np.outer(values, self.a) + self.b) % MERSENNE_PRIME).min(axis=0)
+
+
+class UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def _prices_match(a, b, tolerance):
+    if a is None or b is None:
+        return True  # an undisclosed price cannot rule a match out
+    return abs(a - b) <= tolerance * max(a, b)
+
+
+def _places(location, county):
+    """Lower-cased city and county names a listing is tied to"""
+    places = set()
+    if location:
+        places.add(location.split(',')[0].strip().lower())
+    places.update(c.strip().lower() for c in county.split(',') if c.strip())
+    return places
+
+
+class DuplicateFinder:
+    def __init__(self, num_perm=None, bands=None, threshold=None, price_tolerance=None, max_bucket=100):
+        """
+        Cluster near-duplicate listings fed in batches
+
+        Only each row's MinHash signature, price, places and IDs are kept, not
+        its text, so a large result can be read a chunk at a time.
+
+        Args:
+            num_perm: MinHash functions (defaults to config.DEDUP_NUM_PERM)
+            bands: LSH bands; num_perm / bands rows each (defaults to config.DEDUP_BANDS)
+            threshold: Minimum estimated Jaccard similarity (defaults to config.DEDUP_SIMILARITY)
+            price_tolerance: Largest relative asking-price difference (defaults to config.DEDUP_PRICE_TOLERANCE)
+            max_bucket: Members of one LSH bucket compared pairwise; past this, only with the first
+        """
+        self.num_perm = num_perm or config.DEDUP_NUM_PERM
+        self.bands = bands or config.DEDUP_BANDS
+        self.threshold = config.DEDUP_SIMILARITY if threshold is None else threshold
+        self.price_tolerance = config.DEDUP_PRICE_TOLERANCE if price_tolerance is None else price_tolerance
+        self.max_bucket = max_bucket
+        self.hasher = MinHasher(self.num_perm)
+        self.signatures = []
+        self.prices = []
+        self.places = []
+        self.listing_ids = []
+        self.urls = []
+        self.buckets = {}
+
+    def add(self, frame):
+        """Take the next rows (business_name, description, price, location, county, listing_id, url)"""
+        columns = {c: (frame[c].fillna('').astype(str).tolist() if c in frame.columns else [''] * len(frame))
+                   for c in INPUT_COLUMNS if c != 'price'}
+        rows = self.num_perm // self.bands
+        for name, description in zip(columns['business_name'], columns['description']):
+            signature = self.hasher.signature(shingles(f"{name} {description}"))
+            if signature is not None:
+                for band in range(self.bands):
+                    key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+                    self.buckets.setdefault(key, []).append(len(self.signatures))
+            self.signatures.append(signature)
+        self.prices.extend(parse_money(p) if str(p) not in ('', '<NA>', 'nan') else None
+                           for p in (frame['price'].tolist() if 'price' in frame.columns else [None] * len(frame)))
+        self.places.extend(_places(location, county) for location, county in zip(columns['location'], columns['county']))
+        self.listing_ids.extend(columns['listing_id'])
+        self.urls.extend(columns['url'])
+
+    def labels(self):
+        """
+        Returns:
+            List with a group ID per row added: the smallest listing ID in the
+            row's cluster, or '' for a listing with no near-duplicates
+        """
+        signatures, listing_ids = self.signatures, self.listing_ids
+        groups = UnionFind(len(signatures))
+        compared = set()
+        for members in self.buckets.values():
+            if len(members) < 2:
+                continue
+            pairs = ((a, b) for n, b in enumerate(members) for a in members[:min(n, self.max_bucket)])
+            for a, b in pairs:
+                if (a, b) in compared or groups.find(a) == groups.find(b):
+                    continue
+                compared.add((a, b))
+                if listing_ids[a] and listing_ids[a] == listing_ids[b]:
+                    continue
+                similarity = np.count_nonzero(signatures[a] == signatures[b]) / self.num_perm
+                if similarity < self.threshold or not _prices_match(self.prices[a], self.prices[b],
+                                                                    self.price_tolerance):
+                    continue
+                places_a, places_b = self.places[a], self.places[b]
+                if places_a and places_b and not places_a & places_b:
+                    continue
+                groups.union(a, b)
+
+        members = {}
+        for i in range(len(signatures)):
+            members.setdefault(groups.find(i), []).append(i)
+        labels = [''] * len(signatures)
+        for cluster in members.values():
+            if len(cluster) < 2:
+                continue
+            ids = [listing_ids[i] or self.urls[i] for i in cluster]
+            label = min(ids, key=lambda value: (not value.isdigit(), int(value) if value.isdigit() else 0, value))
+            for i in cluster:
+                labels[i] = label
+        return labels
+
+
+def find_duplicate_groups(frame, num_perm=None, bands=None, threshold=None, price_tolerance=None,
+                          max_bucket=100):
+    """
+    Cluster near-duplicate listings
+
+    Args:
+        frame: Listings DataFrame (business_name, description, price, location, county, listing_id)
+        Others: As for DuplicateFinder
+
+    Returns:
+        List with a group ID per row: the smallest listing ID in the row's
+        cluster, or '' for a listing with no near-duplicates
+    """
+    finder = DuplicateFinder(num_perm, bands, threshold, price_tolerance, max_bucket)
+    finder.add(frame)
+    return finder.labels()
+
+
+def report_duplicate_groups(labels):
+    """Print how many listings were grouped as near-duplicates"""
+    grouped = [label for label in labels if label]
+    if grouped:
+        print(f"Near-duplicates: {len(grouped)} listings in {len(set(grouped))} groups")
+
+
+def assign_duplicate_groups(frame):
+    """
+    Add the duplicate_group column to a listings DataFrame
+
+    Returns:
+        The same DataFrame, for chaining
+    """
+    if not config.DEDUP_ENABLED or frame is None or len(frame) == 0:
+        return frame
+    frame['duplicate_group'] = find_duplicate_groups(frame)
+    report_duplicate_groups(frame['duplicate_group'])
+    return frame
@@ -0,0 +1,108 @@
+"""
+Asyncio fetch engine with an adaptive per-host politeness budget
+Keeps a bounded number of requests in flight instead of sleeping between them,
+and retries throttled requests once the host's rate controller allows
+"""
+
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from metrics import metrics
+from rate_control import THROTTLE_STATUSES, AimdRateController
+
+
+class FetchEngine:
+    def __init__(self, fetch_func, max_in_flight=4, requests_per_second=0.5, cache=None,
+                 max_retries=3, rate_options=None):
+        """
+        Initialize the fetch engine
+
+        Args:
+            fetch_func: Blocking callable that takes a URL and returns a response, raising
+                requests.HTTPError (with .response) on error statuses
+            max_in_flight: Maximum number of requests running at the same time
+            requests_per_second: Starting politeness budget, applied to each host separately
+            cache: Optional ResponseCache; fresh hits skip the politeness budget
+            max_retries: Extra attempts for throttled (403/429/5xx) or failed connections
+            rate_options: Keyword arguments for each host's AimdRateController
+        """
+        self.fetch_func = fetch_func
+        self.cache = cache
+        self.max_in_flight = max_in_flight
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.rate_options = rate_options or {}
+        self._limiters = {}
+        self._semaphore = None
+        self._loop = None
+
+    def limiter_for(self, url):
+        """Get (or create) the rate controller for the URL's host"""
+        host = urlsplit(url).netloc.lower()
+        if host not in self._limiters:
+            self._limiters[host] = AimdRateController(
+                host, initial_rate=self.requests_per_second, **self.rate_options
+            )
+        return self._limiters[host]
+
+    def _get_semaphore(self):
+        # asyncio primitives are bound to one event loop, so rebuild per loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
+
+    async def fetch(self, url, fetch_func=None):
+        """
+        Fetch a single URL within the in-flight and per-host limits, retrying pushback
+
+        Args:
+            url: URL to fetch
+            fetch_func: Used instead of the engine's fetch function for this request;
+                the response cache is not consulted
+        """
+        if fetch_func is None and self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get_fresh, url)
+            if cached is not None:
+                return cached
+        limiter = self.limiter_for(url)
+        for attempt in range(self.max_retries + 1):
+            queued = time.perf_counter()
+            async with self._get_semaphore():
+                metrics.observe('fetch_queue_wait_seconds', time.perf_counter() - queued)
+                metrics.observe('politeness_wait_seconds', await limiter.acquire())
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.to_thread(fetch_func or self.fetch_func, url)
+                    error = None
+                except Exception as e:
+                    response = getattr(e, 'response', None)
+                    error = e
+                latency = time.perf_counter() - started
+                metrics.observe('fetch_seconds', latency)
+
+            status = response.status_code if response is not None else None
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            limiter.record(status, latency, retry_after)
+            if error is None:
+                return response
+
+            metrics.inc('fetch_errors_total', error=type(error).__name__)
+            # Throttling and dropped connections are worth another try; a 404 is not
+            retryable = status in THROTTLE_STATUSES or (status is None and isinstance(error, OSError))
+            if not retryable or attempt == self.max_retries:
+                print(f"  Error fetching {url}: {str(error)}")
+                return None
+            metrics.inc('http_retries_total', reason=str(status or type(error).__name__))
+            print(f"  {status or type(error).__name__} on attempt {attempt + 1}, "
+                  f"retrying at {limiter.rate:.2f} requests/second...")
+
+    async def fetch_many(self, urls):
+        """Fetch several URLs concurrently, returning responses in input order"""
+        return await asyncio.gather(*(self.fetch(url) for url in urls))
+
+    def fetch_all(self, urls):
+        """Blocking wrapper around fetch_many for synchronous callers"""
+        return asyncio.run(self.fetch_many(list(urls)))
@@ -0,0 +1,341 @@
+"""
+Columnar listing history
+Every run's listings are appended to a Parquet dataset partitioned by
+scrape_date (history/scrape_date=YYYY-MM-DD/*.parquet) with typed columns, so
+price changes survive the daily CSV being overwritten. A small listing_id ->
+scrape_date index lets a single listing's history open only the partitions it
+appears in; queries read just the columns they need through memory-mapped files.
+
+Needs pyarrow (pip install pyarrow).
+
+Usage:
+    python history_store.py add bizbuysell_listings.csv --date 2025-01-31   # backfill
+    python history_store.py history 2250990
+    python history_store.py drops --days 7
+"""
+
+import argparse
+import os
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import config
+from dedup import INPUT_COLUMNS, assign_duplicate_groups
+from listing_record import LISTING_COLUMNS
+from normalize import normalize_money_columns
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow.fs import LocalFileSystem
+except ImportError:
+    pa = None
+
+
+PARTITION_PREFIX = 'scrape_date='
+INDEX_FILE = '_listing_index.parquet'
+
+
+def history_schema():
+    """Column types of the stored snapshots (scrape_date is the partition key)"""
+    types = {
+        'price': pa.int64(), 'revenue': pa.int64(), 'ebitda': pa.int64(),
+        'franchise': pa.bool_(), 'established_year': pa.int16(),
+        'scraped_at': pa.timestamp('s'),
+    }
+    columns = [c for c in LISTING_COLUMNS if c != 'scrape_date'] + ['scraped_at']
+    return pa.schema([(c, types.get(c, pa.string())) for c in columns])
+
+
+def _typed_frame(frame):
+    """Convert a listings DataFrame (raw or normalized) to the history column types"""
+    frame = normalize_money_columns(frame.reindex(columns=LISTING_COLUMNS).copy())
+    frame['franchise'] = frame['franchise'].map({'Yes': True, 'No': False}).astype('boolean')
+    frame['established_year'] = pd.to_numeric(frame['established_year'], errors='coerce').astype('Int16')
+    frame['scraped_at'] = pd.to_datetime(frame.pop('scrape_date'), errors='coerce')
+    text = [c for c in frame.columns if c not in ('price', 'revenue', 'ebitda', 'franchise',
+                                                   'established_year', 'scraped_at')]
+    frame[text] = frame[text].fillna('').astype(str)
+    return frame.sort_values('listing_id', kind='stable')
+
+
+class HistoryStore:
+    def __init__(self, root=None):
+        """
+        Open (or create) the history dataset
+
+        Args:
+            root: Dataset directory (defaults to config.HISTORY_DIR)
+        """
+        if pa is None:
+            raise ImportError("the listing history needs pyarrow: pip install pyarrow")
+        self.root = root or config.HISTORY_DIR
+        self.schema = history_schema()
+        self.filesystem = LocalFileSystem(use_mmap=True)
+        os.makedirs(self.root, exist_ok=True)
+
+    def partitions(self):
+        """Snapshot dates in the store, oldest first"""
+        return sorted(
+            entry.name[len(PARTITION_PREFIX):] for entry in os.scandir(self.root)
+            if entry.is_dir() and entry.name.startswith(PARTITION_PREFIX)
+        )
+
+    def _dataset(self, dates=None):
+        """Dataset over every partition, or only the given snapshot dates"""
+        partitioning = ds.partitioning(pa.schema([('scrape_date', pa.string())]), flavor='hive')
+        if dates is None:
+            source = self.root
+        else:
+            source = [
+                os.path.join(self.root, PARTITION_PREFIX + day, name)
+                for day in sorted(dates)
+                if os.path.isdir(os.path.join(self.root, PARTITION_PREFIX + day))
+                for name in sorted(os.listdir(os.path.join(self.root, PARTITION_PREFIX + day)))
+                if name.endswith('.parquet')
+            ]
+        # An explicit schema lets files written before a column was added be read as nulls
+        schema = self.schema.append(pa.field('scrape_date', pa.string()))
+        return ds.dataset(source, schema=schema, format='parquet', partitioning=partitioning,
+                          partition_base_dir=self.root, filesystem=self.filesystem)
+
+    def new_file(self, snapshot_date, hidden=False):
+        """
+        Path for a new file in a day's partition
+
+        Args:
+            snapshot_date: 'YYYY-MM-DD' partition
+            hidden: Start the name with '.', so dataset scans skip it while it is written
+        """
+        directory = os.path.join(self.root, PARTITION_PREFIX + snapshot_date)
+        os.makedirs(directory, exist_ok=True)
+        # The random part keeps two files written in the same second from colliding
+        name = f"part-{datetime.now().strftime('%H%M%S')}-{uuid.uuid4().hex[:12]}.parquet"
+        return os.path.join(directory, '.' + name if hidden else name)
+
+    def append(self, frame, snapshot_date=None):
+        """
+        Store one run's listings as a new file in that day's partition
+
+        Args:
+            frame: Listings DataFrame with the LISTING_COLUMNS
+            snapshot_date: 'YYYY-MM-DD' the listings were seen on (defaults to today);
+                a record reused from the listing store keeps its older scraped_at
+
+        Returns:
+            Number of rows written
+        """
+        if frame is None or len(frame) == 0:
+            return 0
+        snapshot_date = snapshot_date or date.today().isoformat()
+        table = pa.Table.from_pandas(_typed_frame(frame), schema=self.schema, preserve_index=False)
+        pq.write_table(table, self.new_file(snapshot_date), compression='zstd')
+        self._update_index(table.column('listing_id'), snapshot_date)
+        return table.num_rows
+
+    def _update_index(self, listing_ids, snapshot_date):
+        path = os.path.join(self.root, INDEX_FILE)
+        added = pa.table({
+            'listing_id': pc.unique(listing_ids).cast(pa.string()),
+        })
+        added = added.append_column('scrape_date', pa.array([snapshot_date] * added.num_rows, pa.string()))
+        if os.path.exists(path):
+            added = pa.concat_tables([pq.read_table(path, memory_map=True), added])
+        # One row per (listing, day), sorted so lookups can skip row groups by their statistics
+        index = added.group_by(['listing_id', 'scrape_date']).aggregate([])
+        index = index.sort_by([('listing_id', 'ascending'), ('scrape_date', 'ascending')])
+        tmp = path + '.tmp'
+        pq.write_table(index, tmp, row_group_size=64 * 1024)
+        os.replace(tmp, path)
+
+    def dates_for(self, listing_id):
+        """Snapshot dates a listing appears in, from the listing_id index"""
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path):
+            return []
+        index = pq.read_table(path, columns=['scrape_date'], memory_map=True,
+                              filters=[('listing_id', '=', str(listing_id))])
+        return sorted(index.column('scrape_date').to_pylist())
+
+    def price_history(self, listing_id, columns=('price', 'revenue', 'ebitda')):
+        """
+        One listing's values over time
+
+        Args:
+            listing_id: BizBuySell listing ID
+            columns: Columns to return besides scrape_date / scraped_at
+
+        Returns:
+            DataFrame with one row per snapshot day, oldest first
+        """
+        dates = self.dates_for(listing_id)
+        wanted = ['scrape_date', 'scraped_at', *columns]
+        if not dates:
+            return pd.DataFrame(columns=wanted)
+        table = self._dataset(dates).to_table(
+            columns=wanted, filter=ds.field('listing_id') == str(listing_id)
+        )
+        history = table.to_pandas().sort_values(['scrape_date', 'scraped_at'])
+        # A day that was crawled twice keeps its last snapshot
+        return history.drop_duplicates('scrape_date', keep='last').reset_index(drop=True)
+
+    def price_drops(self, days=7, today=None):
+        """
+        Listings whose asking price dropped within the last `days` days
+
+        The last snapshot before the window is read too, so a drop on the
+        window's first day is caught.
+
+        Returns:
+            DataFrame (listing_id, business_name, county, url, old_price, new_price,
+            drop, drop_pct, first_date, last_date), biggest drop first
+        """
+        today = today or date.today().isoformat()
+        since = (date.fromisoformat(today) - timedelta(days=days)).isoformat()
+        partitions = self.partitions()
+        window = [d for d in partitions if since <= d <= today]
+        before = [d for d in partitions if d < since]
+        dates = window + before[-1:]
+        result = ['listing_id', 'business_name', 'county', 'url', 'old_price', 'new_price',
+                  'drop', 'drop_pct', 'first_date', 'last_date']
+        if not window:
+            return pd.DataFrame(columns=result)
+
+        table = self._dataset(dates).to_table(
+            columns=['listing_id', 'scrape_date', 'scraped_at', 'price', 'business_name', 'county', 'url'],
+            filter=ds.field('price').is_valid() & (ds.field('listing_id') != '')
+        )
+        frame = table.to_pandas().sort_values(['listing_id', 'scrape_date', 'scraped_at'])
+        grouped = frame.groupby('listing_id', sort=False)
+        changes = grouped.agg(
+            old_price=('price', 'first'), new_price=('price', 'last'),
+            first_date=('scrape_date', 'first'), last_date=('scrape_date', 'last'),
+            business_name=('business_name', 'last'), county=('county', 'last'), url=('url', 'last'),
+        )
+        drops = changes[(changes['new_price'] < changes['old_price']) & (changes['last_date'] >= since)].copy()
+        drops['drop'] = drops['old_price'] - drops['new_price']
+        drops['drop_pct'] = (100 * drops['drop'] / drops['old_price']).round(1)
+        drops = drops.reset_index().sort_values('drop', ascending=False)
+        return drops[result].reset_index(drop=True)
+
+
+class HistorySink:
+    """
+    Pipeline sink that streams the run's batches into one history file
+
+    Each batch is written as a row group of a hidden file as it arrives, so the
+    run is never held in memory. Once the run has finished, only the columns
+    near-duplicate grouping needs are read back; the row groups are then copied
+    into the final file with the run-wide county and duplicate_group columns.
+    A run that fails or is cancelled leaves no snapshot behind.
+    """
+
+    def __init__(self, store, snapshot_date=None):
+        self.store = store
+        self.snapshot_date = snapshot_date or date.today().isoformat()
+        self._path = None
+        self._writer = None
+
+    def write_batch(self, frame):
+        if len(frame) == 0:
+            return
+        if self._writer is None:
+            self._path = self.store.new_file(self.snapshot_date, hidden=True)
+            self._writer = pq.ParquetWriter(self._path, self.store.schema, compression='zstd')
+        self._writer.write_table(pa.Table.from_pandas(_typed_frame(frame), schema=self.store.schema,
+                                                      preserve_index=False))
+
+    def finish(self, frontier):
+        """
+        Turn the staged batches into the day's history file
+
+        Called only once the run has written every record, so counties come
+        from the complete frontier; a run that fails never reaches this.
+        """
+        if self._writer is None:
+            return
+        started = time.perf_counter()
+        self._writer.close()
+        self._writer = None
+        staged = pq.ParquetFile(self._path, memory_map=True)
+        keys = staged.read(columns=list(INPUT_COLUMNS)).to_pandas()
+        keys['county'] = [frontier.county_label(url, county) for url, county in zip(keys['url'], keys['county'])]
+        keys = assign_duplicate_groups(keys)
+        schema = self.store.schema
+        replaced = [column for column in ('county', 'duplicate_group') if column in keys.columns]
+
+        # One file per run keeps the partitions from filling up with tiny files
+        path = self.store.new_file(self.snapshot_date)
+        offset = 0
+        with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+            for i in range(staged.num_row_groups):
+                group = staged.read_row_group(i)
+                for column in replaced:
+                    values = keys[column].iloc[offset:offset + group.num_rows].fillna('').astype(str)
+                    group = group.set_column(schema.get_field_index(column), column,
+                                             pa.array(values.tolist(), pa.string()))
+                # Parquet stores scraped_at in milliseconds; cast back to the store's types
+                writer.write_table(group.cast(schema))
+                offset += group.num_rows
+        os.remove(self._path)
+        self._path = None
+        self.store._update_index(pa.array(keys['listing_id'].astype(str).tolist(), pa.string()),
+                                 self.snapshot_date)
+        print(f"History: {offset} listings added to {self.store.root} in {time.perf_counter() - started:.2f}s")
+
+    def close(self):
+        """Discard the staged batches of a run that did not finish"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._path is not None:
+            os.remove(self._path)
+            self._path = None
+            print("History: run did not finish, nothing added")
+
+
+def open_history():
+    """The configured history store, or None when disabled or pyarrow is missing"""
+    if not config.HISTORY_ENABLED:
+        return None
+    try:
+        return HistoryStore(config.HISTORY_DIR)
+    except ImportError as e:
+        print(f"Listing history disabled: {str(e)}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or backfill the listing history")
+    parser.add_argument('--root', default=config.HISTORY_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help="append a listings CSV as one day's snapshot")
+    add.add_argument('csv')
+    add.add_argument('--date', help="snapshot date YYYY-MM-DD (default: today)")
+
+    history = commands.add_parser('history', help="price history of one listing")
+    history.add_argument('listing_id')
+
+    drops = commands.add_parser('drops', help="listings whose asking price dropped recently")
+    drops.add_argument('--days', type=int, default=7)
+
+    args = parser.parse_args()
+    store = HistoryStore(args.root)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        if args.command == 'add':
+            frame = pd.read_csv(args.csv, dtype=str, keep_default_na=False)
+            print(f"Added {store.append(frame, args.date)} listings")
+        elif args.command == 'history':
+            print(store.price_history(args.listing_id).to_string(index=False))
+        else:
+            print(store.price_drops(args.days).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
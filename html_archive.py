@@ -0,0 +1,333 @@
+"""
+Raw HTML archive with offline re-extraction
+Every page body fetched from the network is appended to a WARC-like segment
+file, one zstd frame per record, and indexed by URL and fetch time in SQLite.
+When the site's markup changes, `reextract` re-runs the current extractors
+over the archived detail pages in parallel, with no network access.
+
+Needs zstandard (pip install zstandard).
+
+Usage:
+    python html_archive.py stats
+    python html_archive.py reextract --since 2025-01-01 --output reextracted.csv
+"""
+
+import argparse
+import csv
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import config
+from http_cache import canonical_url, page_kind
+from metrics import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id          INTEGER PRIMARY KEY,
+    url         TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    fetched_at  TEXT NOT NULL,
+    status      INTEGER NOT NULL,
+    digest      TEXT NOT NULL,
+    segment     TEXT NOT NULL,
+    offset      INTEGER NOT NULL,
+    length      INTEGER NOT NULL,
+    raw_length  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS listing_counties (
+    url         TEXT PRIMARY KEY,
+    county      TEXT NOT NULL
+)
+"""
+
+
+def _record_bytes(url, fetched_at, response, body):
+    """A WARC/1.0 response record (HTTP headers summarized as WARC fields)"""
+    fields = [
+        'WARC/1.0',
+        'WARC-Type: response',
+        f'WARC-Target-URI: {url}',
+        f'WARC-Date: {fetched_at}',
+        f'WARC-Payload-Digest: sha1:{hashlib.sha1(body).hexdigest()}',
+        f'HTTP-Status: {response.status_code}',
+        f"Content-Type: {response.headers.get('Content-Type', 'text/html')}",
+        f'Content-Length: {len(body)}',
+    ]
+    return '\r\n'.join(fields).encode('utf-8') + b'\r\n\r\n' + body + b'\r\n\r\n'
+
+
+def _split_record(data):
+    """(fields, body) of a decompressed record"""
+    head, _, rest = data.partition(b'\r\n\r\n')
+    fields = dict(
+        line.split(': ', 1) for line in head.decode('utf-8').split('\r\n')[1:] if ': ' in line
+    )
+    return fields, rest[:int(fields['Content-Length'])]
+
+
+class HtmlArchive:
+    def __init__(self, archive_dir=None, segment_bytes=None, level=None):
+        """
+        Open (or create) the archive
+
+        Args:
+            archive_dir: Directory holding the segments and index.db (defaults to config.HTML_ARCHIVE_DIR)
+            segment_bytes: Start a new segment once the current one is this big
+            level: zstd compression level
+        """
+        if zstandard is None:
+            raise ImportError("the HTML archive needs zstandard: pip install zstandard")
+        self.archive_dir = archive_dir or config.HTML_ARCHIVE_DIR
+        self.segment_bytes = segment_bytes or config.HTML_ARCHIVE_SEGMENT_MB * 1024 * 1024
+        self.level = level or config.HTML_ARCHIVE_LEVEL
+        os.makedirs(self.archive_dir, exist_ok=True)
+        # Pages arrive from the fetch engine's worker threads
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.archive_dir, 'index.db'),
+                                    timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # Sharded workers append to their own segments but share the index
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS records_url ON records (url, fetched_at)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS records_fetched ON records (fetched_at)")
+        self.conn.commit()
+        self._compressor = zstandard.ZstdCompressor(level=self.level)
+        self._segment = None
+        self._segment_name = None
+
+    def _open_segment(self):
+        if self._segment is not None and self._segment.tell() < self.segment_bytes:
+            return
+        if self._segment is not None:
+            self._segment.close()
+        self._segment_name = f"segment-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.warc.zst"
+        self._segment = open(os.path.join(self.archive_dir, self._segment_name), 'ab')
+
+    def add(self, url, response):
+        """
+        Archive one fetched page
+
+        A body identical to the latest archived copy of the same URL is only
+        counted, not stored again.
+
+        Returns:
+            True if the body was stored
+        """
+        body = response.content
+        if not body:
+            return False
+        url = canonical_url(url)
+        digest = hashlib.sha1(body).hexdigest()
+        fetched_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            latest = self.conn.execute(
+                "SELECT digest FROM records WHERE url = ? ORDER BY fetched_at DESC, id DESC LIMIT 1", (url,)
+            ).fetchone()
+            if latest and latest['digest'] == digest:
+                metrics.inc('html_archive_records_total', result='unchanged')
+                return False
+            # Each record is its own zstd frame, so any one can be read by offset
+            frame = self._compressor.compress(_record_bytes(url, fetched_at, response, body))
+            self._open_segment()
+            offset = self._segment.tell()
+            self._segment.write(frame)
+            self._segment.flush()
+            self.conn.execute(
+                "INSERT INTO records (url, kind, fetched_at, status, digest, segment, offset, length, raw_length) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, page_kind(url), fetched_at, response.status_code, digest,
+                 self._segment_name, offset, len(frame), len(body))
+            )
+            self.conn.commit()
+        metrics.inc('html_archive_records_total', result='stored')
+        metrics.inc('html_archive_bytes_total', len(frame))
+        return True
+
+    def set_counties(self, labels):
+        """
+        Remember which counties' search results listed each page
+
+        Args:
+            labels: (URL, county label) pairs from the crawl's frontier; the
+                latest crawl's label replaces an older one
+        """
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO listing_counties (url, county) VALUES (?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET county = excluded.county",
+                [(canonical_url(url), county) for url, county in labels]
+            )
+            self.conn.commit()
+
+    def entries(self, kind='detail', since=None, until=None, latest_only=False):
+        """Index rows for archived pages (plus their county label, if known), grouped by segment and in file order"""
+        query = ("SELECT records.*, listing_counties.county FROM records "
+                 "LEFT JOIN listing_counties USING (url) WHERE kind = ?")
+        params = [kind]
+        if since:
+            query += " AND fetched_at >= ?"
+            params.append(since)
+        if until:
+            query += " AND fetched_at < ?"
+            params.append(until)
+        if latest_only:
+            query += " AND id IN (SELECT MAX(id) FROM records GROUP BY url)"
+        query += " ORDER BY segment, offset"
+        return self.conn.execute(query, params).fetchall()
+
+    def read(self, entry):
+        """Body of one archived page"""
+        with open(os.path.join(self.archive_dir, entry['segment']), 'rb') as f:
+            f.seek(entry['offset'])
+            frame = f.read(entry['length'])
+        return _split_record(zstandard.ZstdDecompressor().decompress(frame))[1]
+
+    def stats(self):
+        row = self.conn.execute(
+            "SELECT COUNT(*) AS records, COUNT(DISTINCT url) AS urls, COUNT(DISTINCT segment) AS segments, "
+            "COALESCE(SUM(length), 0) AS stored, COALESCE(SUM(raw_length), 0) AS raw, "
+            "MIN(fetched_at) AS first, MAX(fetched_at) AS last FROM records"
+        ).fetchone()
+        return dict(row)
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            self.conn.close()
+
+
+def open_archive():
+    """The configured archive, or None when disabled or zstandard is missing"""
+    if not config.HTML_ARCHIVE_ENABLED:
+        return None
+    try:
+        return HtmlArchive(config.HTML_ARCHIVE_DIR)
+    except ImportError as e:
+        print(f"HTML archive disabled: {str(e)}")
+        return None
+
+
+def _reextract_batch(archive_dir, segment, entries, backend):
+    """Worker: decompress and parse one segment's share of the archived pages"""
+    from html_parsing import parse_listing_detailed
+
+    decompressor = zstandard.ZstdDecompressor()
+    records = []
+    sources = {}
+    with open(os.path.join(archive_dir, segment), 'rb') as f:
+        for url, fetched_at, county, offset, length in entries:
+            f.seek(offset)
+            _, body = _split_record(decompressor.decompress(f.read(length)))
+            try:
+                record, source, _ = parse_listing_detailed(body, url, backend)
+            except Exception as e:
+                print(f"Error re-extracting {url} ({fetched_at}): {str(e)}")
+                continue
+            # The record describes the page as it was when it was fetched
+            record['scrape_date'] = fetched_at
+            record['county'] = county or ''
+            records.append(record)
+            sources[source] = sources.get(source, 0) + 1
+    return records, sources
+
+
+def reextract(archive, output, since=None, until=None, latest_only=False, workers=None,
+              backend=None, batch_size=200):
+    """
+    Re-run the current detail-page extractors over archived pages
+
+    Args:
+        archive: HtmlArchive to read
+        output: CSV file for the re-extracted records
+        since / until: Fetch-time range ('YYYY-MM-DD' or full timestamps)
+        latest_only: Only the newest copy of each URL
+        workers: Parser processes (defaults to config.PARSE_WORKERS or one per CPU)
+        backend: Parser backend (defaults to config.PARSER_BACKEND)
+        batch_size: Pages per worker task
+
+    Returns:
+        Number of records written
+    """
+    from listing_record import LISTING_COLUMNS
+
+    workers = workers or config.PARSE_WORKERS or os.cpu_count() or 1
+    backend = backend or config.PARSER_BACKEND
+    tasks = []
+    for entry in archive.entries('detail', since, until, latest_only):
+        item = (entry['url'], entry['fetched_at'], entry['county'], entry['offset'], entry['length'])
+        if tasks and tasks[-1][0] == entry['segment'] and len(tasks[-1][1]) < batch_size:
+            tasks[-1][1].append(item)
+        else:
+            tasks.append((entry['segment'], [item]))
+
+    started = time.perf_counter()
+    records = []
+    sources = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_reextract_batch, archive.archive_dir, segment, entries, backend)
+                   for segment, entries in tasks]
+        for future in futures:
+            batch, batch_sources = future.result()
+            records.extend(batch)
+            for source, count in batch_sources.items():
+                sources[source] = sources.get(source, 0) + count
+    elapsed = time.perf_counter() - started
+
+    # Plain csv keeps pandas out of the offline path
+    with open(output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, LISTING_COLUMNS, restval='', extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(records)
+    print(f"Re-extracted {len(records)} pages with {workers} workers in {elapsed:.1f}s -> {output}")
+    if sources:
+        print(f"Sources: {sources.get('structured', 0)} structured, {sources.get('mixed', 0)} mixed, "
+              f"{sources.get('dom', 0)} DOM only")
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the HTML archive or re-extract listings from it")
+    parser.add_argument('--archive-dir', default=config.HTML_ARCHIVE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('stats', help="archive size and coverage")
+
+    run = commands.add_parser('reextract', help="re-run the extractors over archived detail pages (offline)")
+    run.add_argument('--since', help="fetched on or after (YYYY-MM-DD)")
+    run.add_argument('--until', help="fetched before (YYYY-MM-DD)")
+    run.add_argument('--latest', action='store_true', help="only the newest copy of each listing")
+    run.add_argument('--workers', type=int)
+    run.add_argument('--backend', choices=['html.parser', 'lxml', 'lxml-xpath'])
+    run.add_argument('--output', default='reextracted_listings.csv')
+
+    args = parser.parse_args(argv)
+    archive = HtmlArchive(args.archive_dir)
+    try:
+        if args.command == 'stats':
+            stats = archive.stats()
+            ratio = stats['raw'] / stats['stored'] if stats['stored'] else 0
+            print(f"{stats['records']} pages ({stats['urls']} URLs) in {stats['segments']} segments, "
+                  f"{stats['stored'] / 1024 / 1024:.1f} MB stored, {ratio:.1f}x compression, "
+                  f"{stats['first']} .. {stats['last']}")
+        else:
+            reextract(archive, args.output, args.since, args.until, args.latest, args.workers, args.backend)
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+"""
+Pluggable HTML parser backends for search and listing pages
+
+Backends:
+    html.parser  - BeautifulSoup with the pure-Python parser (reference output)
+    lxml         - BeautifulSoup with the lxml tree builder
+    lxml-xpath   - lxml.html + XPath directly, no BeautifulSoup objects at all
+
+Search pages are parsed through a SoupStrainer so only <a> tags are built.
+Listing pages are checked for embedded structured data (structured_data.py)
+before any DOM is built. DetailPageWatcher tells the transport when a detail
+page that is still downloading already holds every field, so the rest can be skipped.
+Run `python html_parsing.py fixtures` to check every backend against the
+html.parser reference output on the fixture corpus.
+"""
+
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+import lxml.html
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree
+
+import config
+from listing_extractor import DETAIL_SELECTORS, FIELD_LABELS, LISTING_ID_RE, extract_listing_detailed
+from structured_data import STRUCTURED_FIELDS, extract_structured
+
+
+BACKENDS = ('html.parser', 'lxml', 'lxml-xpath')
+
+LISTING_HREF_RE = re.compile(r'/listing/')
+NEXT_LINK_RE = re.compile(r'Next|›')
+# Asking price shown inside a listing card's link text
+CARD_PRICE_RE = re.compile(r'\$\s*\d[\d,]*(?:\.\d+)?(?:\s*[KkMm]\b)?')
+
+# "Showing 1 - 25 of 212 results" and the numbered pagination links
+RESULT_COUNT_RE = re.compile(rb'Showing\s+([\d,]+)\s*(?:-|\xe2\x80\x93)\s*([\d,]+)\s+of\s+([\d,]+)\s+results', re.I)
+PAGE_LINK_RE = re.compile(rb'href=["\'][^"\']*[?&]page=(\d+)')
+
+# Only anchors matter on search pages: listing links and the "Next" link
+SEARCH_PAGE_STRAINER = SoupStrainer('a')
+
+# Tags whose strings BeautifulSoup leaves out of Tag.text
+_NON_TEXT_TAGS = {'script', 'style', 'template', 'rt', 'rp'}
+
+# Tags inside which BeautifulSoup keeps whitespace-only strings verbatim
+_PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown parser backend {backend!r}, expected one of {BACKENDS}")
+
+
+def make_soup(content, backend=None, parse_only=None):
+    """Build a BeautifulSoup tree; lxml-xpath falls back to the lxml tree builder"""
+    backend = backend or config.PARSER_BACKEND
+    _check_backend(backend)
+    features = 'html.parser' if backend == 'html.parser' else 'lxml'
+    return BeautifulSoup(content, features, parse_only=parse_only)
+
+
+def _absolute_url(href, base_url):
+    return href if href.startswith('http') else base_url + href
+
+
+def parse_search_page(content, base_url, backend=None):
+    """
+    Parse a search results page
+
+    Returns:
+        (listing_urls, has_next, card_prices) where listing_urls are unique absolute
+        URLs in page order and card_prices maps a URL to the price text shown in
+        its card link (only for cards that show one)
+    """
+    backend = backend or config.PARSER_BACKEND
+    _check_backend(backend)
+    if backend == 'lxml-xpath':
+        return _parse_search_page_xpath(content, base_url)
+
+    soup = make_soup(content, backend, parse_only=SEARCH_PAGE_STRAINER)
+    listing_urls = {}
+    card_prices = {}
+    for link in soup.find_all('a', href=LISTING_HREF_RE):
+        href = link.get('href')
+        if href and '/listing/' in href:
+            url = _absolute_url(href, base_url)
+            listing_urls[url] = None
+            _add_card_price(card_prices, url, link.text)
+    has_next = soup.find('a', string=NEXT_LINK_RE) is not None
+    return list(listing_urls), has_next, card_prices
+
+
+def search_page_count(content, page=1):
+    """
+    Number of the last search results page, read from a single page
+
+    The result count ("Showing 1 - 25 of 212 results") is used when present,
+    otherwise the highest numbered pagination link (which may only be a lower
+    bound when the site windows its pagination). A regex over the raw bytes is
+    enough, so no tree is built.
+
+    Args:
+        content: Page body (bytes or str)
+        page: Number of the page the body belongs to
+
+    Returns:
+        Last page number, or None if the page shows neither
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    match = RESULT_COUNT_RE.search(content)
+    if match:
+        first, last, total = (int(group.replace(b',', b'')) for group in match.groups())
+        if total == 0:
+            return 0
+        if last >= total or first > last:
+            return page
+        per_page = last - first + 1
+        return -(-total // per_page)
+    numbers = [int(number) for number in PAGE_LINK_RE.findall(content)]
+    return max(numbers + [page]) if numbers else None
+
+
+def _add_card_price(card_prices, url, link_text):
+    if url not in card_prices:
+        match = CARD_PRICE_RE.search(link_text)
+        if match:
+            card_prices[url] = match.group(0)
+
+
+def parse_listing(content, url, backend=None):
+    """Parse a listing detail page into a record dict"""
+    return parse_listing_detailed(content, url, backend)[0]
+
+
+def parse_listing_detailed(content, url, backend=None):
+    """
+    Parse a listing detail page, structured data first
+
+    Returns:
+        (record, source, selectors) where source is 'structured' (no DOM was
+        built), 'mixed' (structured data plus DOM) or 'dom', and selectors maps
+        each field read through DETAIL_SELECTORS to the selector that found it
+        ('' if none did)
+    """
+    backend = backend or config.PARSER_BACKEND
+    _check_backend(backend)
+    structured, named = extract_structured(content, url)
+    if all(field in named for field in STRUCTURED_FIELDS):
+        listing_id_match = LISTING_ID_RE.search(url)
+        record = {'url': url, 'scrape_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+        record.update((field, structured[field]) for field in STRUCTURED_FIELDS)
+        record['listing_id'] = listing_id_match.group(1) if listing_id_match else ''
+        return record, 'structured', {}
+
+    if backend == 'lxml-xpath':
+        record, selectors = _parse_listing_xpath(content, url)
+    else:
+        record, selectors = extract_listing_detailed(make_soup(content, backend), url)
+    # Data naming this listing wins over the DOM; the rest only fills its gaps
+    used = [field for field, value in structured.items() if field in named or not record.get(field)]
+    record.update((field, structured[field]) for field in used)
+    # Fields the structured data supplied say nothing about the selectors
+    selectors = {field: selector for field, selector in selectors.items() if field not in used}
+    return record, 'mixed' if used else 'dom', selectors
+
+
+def timed_parse(func, *args):
+    """
+    Run a parse function and report how long it took
+
+    Used as the process-pool entry point, so parse time can be recorded by the
+    parent process (returns (result, seconds)).
+    """
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+# ---------------------------------------------------------------------------
+# lxml.html / XPath fast path
+#
+# These helpers mirror the BeautifulSoup semantics used by listing_extractor
+# (Tag.text, Tag.string, find_next_sibling) so all backends agree.
+# ---------------------------------------------------------------------------
+
+def _lxml_document(content):
+    return lxml.html.document_fromstring(content)
+
+
+def _is_element(node):
+    return isinstance(node.tag, str)
+
+
+def _string(text, preserve=False):
+    """Collapse whitespace-only strings the way BeautifulSoup's tree builder does"""
+    if not text or preserve or not text.isspace():
+        return text or ''
+    return '\n' if '\n' in text else ' '
+
+
+def _text(el, preserve=False):
+    """Equivalent of bs4 Tag.text: all strings except comments, scripts and styles"""
+    inner = preserve or el.tag in _PRESERVE_WHITESPACE_TAGS
+    parts = [_string(el.text, inner)]
+    for child in el:
+        if _is_element(child) and child.tag not in _NON_TEXT_TAGS:
+            parts.append(_text(child, inner))
+        parts.append(_string(child.tail, inner))
+    return ''.join(parts)
+
+
+def _single_string(el):
+    """Equivalent of bs4 Tag.string: the text of an element with exactly one child"""
+    if len(el) == 0:
+        return el.text
+    if len(el) == 1 and not el.text and not el[0].tail and _is_element(el[0]):
+        return _single_string(el[0])
+    return None
+
+
+def _next_element_sibling(el):
+    sibling = el.getnext()
+    while sibling is not None and not _is_element(sibling):
+        sibling = sibling.getnext()
+    return sibling
+
+
+def _parse_search_page_xpath(content, base_url):
+    root = _lxml_document(content)
+    listing_urls = {}
+    card_prices = {}
+    for link in root.xpath("//a[contains(@href, '/listing/')]"):
+        url = _absolute_url(link.get('href'), base_url)
+        listing_urls[url] = None
+        _add_card_price(card_prices, url, _text(link))
+    has_next = any(
+        NEXT_LINK_RE.search(_single_string(a) or '') for a in root.iter('a')
+    )
+    return list(listing_urls), has_next, card_prices
+
+
+def _build_label_index_xpath(root):
+    """lxml counterpart of listing_extractor.build_label_index"""
+    index = {}
+
+    def add(text, parent):
+        label = text.strip() if text else ''
+        if label and label not in index:
+            index[label] = parent
+
+    for event, el in etree.iterwalk(root, events=('start', 'end')):
+        if event == 'start':
+            # Comment text belongs to the enclosing element, like a bs4 Comment
+            add(el.text, el if _is_element(el) else el.getparent())
+        else:
+            add(el.tail, el.getparent())
+    return index
+
+
+def _labelled_value(index, pattern):
+    for label, parent in index.items():
+        if pattern.search(label):
+            value_elem = _next_element_sibling(parent) if parent is not None else None
+            return _text(value_elem).strip() if value_elem is not None else ''
+    return ''
+
+
+def _parse_listing_xpath(content, url):
+    """lxml counterpart of listing_extractor.extract_listing_detailed"""
+    root = _lxml_document(content)
+    record = {'url': url, 'scrape_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+
+    elements, selectors = DETAIL_SELECTORS.select(root)
+    for name, el in elements.items():
+        record[name] = _text(el).strip() if el is not None else ''
+
+    index = _build_label_index_xpath(root)
+    fields = {name: _labelled_value(index, pattern) for name, pattern in FIELD_LABELS.items()}
+    fields['franchise'] = 'Yes' if 'yes' in fields['franchise'].lower() else 'No'
+    record.update(fields)
+
+    listing_id_match = LISTING_ID_RE.search(url)
+    record['listing_id'] = listing_id_match.group(1) if listing_id_match else ''
+    return record, selectors
+
+
+# Raw text any selector of a DETAIL_SELECTORS field needs before it can match: a tag opener, or a class / id
+_SELECTOR_HINTS = {
+    field: sorted({f'<{part.tag}' if part.tag else (part.classes + part.ids + [''])[0]
+                   for selector in chain for part in selector.parts})
+    for field, chain in DETAIL_SELECTORS.chains.items()
+}
+# Closing tags that can complete a field no selector has matched yet ('</' when a part has no tag)
+_SELECTOR_CLOSERS = {
+    field: sorted({f'</{part.tag}' if part.tag else '</' for selector in chain for part in selector.parts})
+    for field, chain in DETAIL_SELECTORS.chains.items()
+}
+# FIELD_LABELS patterns for lowercased text (much cheaper than re.I on every chunk)
+_LABEL_HINTS = {field: re.compile(pattern.pattern.lower()) for field, pattern in FIELD_LABELS.items()}
+_NO_LABEL = object()
+_SCRIPT_TAG_RE = re.compile(rb'<(/?)script\b', re.I)
+
+
+def _followed(el):
+    """True when the parsed prefix continues past el's end, so el is complete"""
+    while el is not None:
+        if el.tail is not None or el.getnext() is not None:
+            return True
+        el = el.getparent()
+    return False
+
+
+def _closers(el):
+    """Closing tags after which an unfinished element (or its parent) may be followed"""
+    if el is None:
+        return {'</'}
+    tags = {el.tag}
+    if el.getparent() is not None:
+        tags.add(el.getparent().tag)
+    return {f'</{tag}' for tag in tags if isinstance(tag, str)} or {'</'}
+
+
+class DetailPageWatcher:
+    """
+    Decides when a detail page that is still downloading holds every field
+
+    feed() keeps the chunks and scans their raw text until every FIELD_LABELS
+    label and some DETAIL_SELECTORS selector of every field has shown up. The
+    bytes received so far are then parsed and checked: each field's element
+    (the winner of its selector chain, or a label's value element) must be
+    followed by more content. A failed check notes the closing tags the missing
+    fields are waiting for, and the prefix is parsed again only once one of
+    them arrives, at most config.STREAMING_MAX_CHECKS times per page; after
+    that the page is simply read to the end. It never stops inside a <script>.
+    Content below the fields is not seen: structured data, or a higher-priority
+    selector matching only after a fallback already did (hence
+    config.STREAMING_DETAIL_FETCH is opt-in).
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._text_tail = ''
+        self._waiting = {**{field: [pattern] for field, pattern in _LABEL_HINTS.items()},
+                         **{f'selector:{field}': hints for field, hints in _SELECTOR_HINTS.items()}}
+        # Closing tags that make another check worthwhile (None: check as soon as the gate passes)
+        self._closers = None
+        self._check_due = False
+        self.checks = 0
+        self.complete = False
+        self.gave_up = False
+
+    def feed(self, chunk):
+        """Take the next chunk; True once every field is complete"""
+        if self.complete or self.gave_up:
+            return self.complete
+        self._chunks.append(chunk)
+        # Cheap gates on the raw text before anything is parsed
+        lowered = self._text_tail + chunk.decode('utf-8', 'replace').lower()
+        for key, needles in list(self._waiting.items()):
+            if any(needle.search(lowered) if hasattr(needle, 'search') else needle in lowered for needle in needles):
+                del self._waiting[key]
+        self._text_tail = lowered[-64:]
+        if self._waiting:
+            return False
+        if self._closers is None or any(closer in lowered for closer in self._closers):
+            self._check_due = True
+        if not self._check_due:
+            return False
+        body = b''.join(self._chunks)
+        # Never stop inside a script, which may be structured data the parser reads
+        last_script_tag = None
+        for last_script_tag in _SCRIPT_TAG_RE.finditer(body):
+            pass
+        if last_script_tag is not None and not last_script_tag.group(1):
+            return False
+        self.checks += 1
+        self._check_due = False
+        self._closers = self._missing(_lxml_document(body))
+        self.complete = not self._closers
+        if not self.complete and self.checks >= config.STREAMING_MAX_CHECKS:
+            # Not worth another parse: let the rest of the page arrive
+            self.gave_up = True
+            self._chunks = []
+        return self.complete
+
+    def _missing(self, root):
+        """Closing tags the incomplete fields are waiting for (empty once every field is complete)"""
+        closers = set()
+        elements, _ = DETAIL_SELECTORS.select(root)
+        for field, el in elements.items():
+            if el is None:
+                closers.update(_SELECTOR_CLOSERS[field])
+            elif not _followed(el):
+                closers.update(_closers(el))
+        index = _build_label_index_xpath(root)
+        for pattern in FIELD_LABELS.values():
+            # Same lookup as _labelled_value: the first label in document order wins
+            parent = next((parent for label, parent in index.items() if pattern.search(label)), _NO_LABEL)
+            if parent is _NO_LABEL:
+                closers.add('</')
+            elif parent is None:
+                continue
+            else:
+                value = _next_element_sibling(parent)
+                if value is None:
+                    # No value yet: final only once the label's parent has been closed without one
+                    if not _followed(parent.getparent()):
+                        closers.update(_closers(parent.getparent()))
+                elif not _followed(value):
+                    closers.update(_closers(value))
+        return closers
+
+
+def verify_backends(fixture_dir):
+    """
+    Parse every fixture with every backend and compare against html.parser
+
+    Search fixtures live in <fixture_dir>/search, detail fixtures in
+    <fixture_dir>/detail. Returns a list of mismatch descriptions (empty if all agree).
+    """
+    base_url = 'https://www.bizbuysell.com'
+    mismatches = []
+
+    for kind in ('search', 'detail'):
+        kind_dir = os.path.join(fixture_dir, kind)
+        for name in sorted(os.listdir(kind_dir)):
+            with open(os.path.join(kind_dir, name), 'rb') as f:
+                content = f.read()
+            url = f"{base_url}/listing/{os.path.splitext(name)[0]}/"
+
+            outputs = {}
+            for backend in BACKENDS:
+                if kind == 'search':
+                    outputs[backend] = parse_search_page(content, base_url, backend)
+                else:
+                    record = parse_listing(content, url, backend)
+                    record.pop('scrape_date')
+                    outputs[backend] = list(record.items())
+
+            reference = outputs['html.parser']
+            differing = [b for b in BACKENDS[1:] if outputs[b] != reference]
+            for backend in differing:
+                mismatches.append(
+                    f"{kind}/{name}: {backend} differs\n"
+                    f"  html.parser: {reference}\n  {backend}: {outputs[backend]}"
+                )
+            print(f"  {kind}/{name}: {'MISMATCH' if differing else 'OK'}")
+
+    return mismatches
+
+
+if __name__ == "__main__":
+    fixture_dir = sys.argv[1] if len(sys.argv) > 1 else 'fixtures'
+    problems = verify_backends(fixture_dir)
+    if problems:
+        print("\n".join(problems))
+        sys.exit(1)
+    print(f"All backends ({', '.join(BACKENDS)}) agree on the fixture corpus")
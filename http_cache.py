@@ -0,0 +1,217 @@
+"""
+On-disk HTTP response cache
+Bodies are stored gzip-compressed next to a SQLite index; entries expire per
+page type, are revalidated with ETag / Last-Modified, and the oldest-used
+entries are evicted once the cache grows past its size cap
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from metrics import metrics
+
+
+# Response headers kept with a cached body
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key         TEXT PRIMARY KEY,
+    url         TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    headers     TEXT NOT NULL,
+    stored_at   REAL NOT NULL,
+    last_access REAL NOT NULL,
+    size        INTEGER NOT NULL
+)
+"""
+
+
+def canonical_url(url):
+    """Normalize a URL so equivalent spellings share one cache entry"""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(':', 1)[-1]) in (('http', '80'), ('https', '443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, netloc, parts.path or '/', query, ''))
+
+
+def page_kind(url):
+    """Classify a URL as a 'detail' (listing) page or a 'search' page"""
+    return 'detail' if '/listing/' in url else 'search'
+
+
+class ResponseCache:
+    def __init__(self, cache_dir='.http_cache', max_bytes=200 * 1024 * 1024, ttl=None):
+        """
+        Open (or create) the response cache
+
+        Args:
+            cache_dir: Directory holding the index and compressed bodies
+            max_bytes: Size cap for stored (compressed) bodies
+            ttl: Seconds an entry stays fresh, per page kind ('search' / 'detail')
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl or {'search': 6 * 3600, 'detail': 24 * 3600}
+        os.makedirs(cache_dir, exist_ok=True)
+        # The fetch engine calls in from worker threads
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'index.db'), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(SCHEMA)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        self.conn.commit()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'evictions': 0}
+
+    def _body_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.gz')
+
+    def _lookup(self, key):
+        with self._lock:
+            return self.conn.execute("SELECT * FROM entries WHERE key = ?", (key,)).fetchone()
+
+    def _read_body(self, key):
+        try:
+            with open(self._body_path(key), 'rb') as f:
+                return gzip.decompress(f.read())
+        except OSError:
+            return None
+
+    def _touch(self, key, revalidated=False):
+        now = time.time()
+        with self._lock:
+            if revalidated:
+                self.conn.execute(
+                    "UPDATE entries SET last_access = ?, stored_at = ? WHERE key = ?", (now, now, key)
+                )
+            else:
+                self.conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+
+    def _store(self, key, url, kind, response):
+        path = self._body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent readers never see a partial body
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(gzip.compress(response.content, compresslevel=6))
+        os.replace(tmp_path, path)
+        headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, kind, json.dumps(headers), now, now, os.path.getsize(path))
+            )
+            self.conn.commit()
+        self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits under max_bytes"""
+        with self._lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for row in self.conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                if total <= self.max_bytes:
+                    break
+                victims.append(row['key'])
+                total -= row['size']
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in victims])
+            self.conn.commit()
+            self.stats['evictions'] += len(victims)
+        metrics.inc('http_cache_events_total', len(victims), event='evictions')
+        for key in victims:
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+
+    @staticmethod
+    def _build_response(url, body, headers):
+        # Imported here so the URL helpers (used by the offline tools) do not load requests
+        from requests.models import Response
+        from requests.structures import CaseInsensitiveDict
+
+        response = Response()
+        response.status_code = 200
+        response._content = body
+        response.headers = CaseInsensitiveDict(headers)
+        response.url = url
+        response.from_cache = True
+        return response
+
+    def _count(self, stat, amount=1):
+        with self._lock:
+            self.stats[stat] += amount
+        metrics.inc('http_cache_events_total', amount, event=stat)
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha256(canonical_url(url).encode('utf-8')).hexdigest()
+
+    def _is_fresh(self, entry):
+        return time.time() - entry['stored_at'] < self.ttl[entry['kind']]
+
+    def get_fresh(self, url):
+        """Return a cached response if one exists and has not expired, else None"""
+        key = self._key(url)
+        entry = self._lookup(key)
+        if not entry or not self._is_fresh(entry):
+            return None
+        body = self._read_body(key)
+        if body is None:
+            return None
+        self._count('hits')
+        self._touch(key)
+        return self._build_response(url, body, json.loads(entry['headers']))
+
+    def fetch(self, url, send):
+        """
+        Return a response for url, from the cache when possible
+
+        Args:
+            url: URL being requested
+            send: Callable taking a dict of extra request headers and performing the request
+        """
+        cached = self.get_fresh(url)
+        if cached is not None:
+            return cached
+
+        key = self._key(url)
+        entry = self._lookup(key)
+        body = self._read_body(key) if entry else None
+
+        extra_headers = {}
+        if entry and body is not None:
+            headers = json.loads(entry['headers'])
+            if 'ETag' in headers:
+                extra_headers['If-None-Match'] = headers['ETag']
+            if 'Last-Modified' in headers:
+                extra_headers['If-Modified-Since'] = headers['Last-Modified']
+
+        response = send(extra_headers)
+
+        if response is not None and response.status_code == 304 and extra_headers:
+            self._count('revalidated')
+            self._touch(key, revalidated=True)
+            return self._build_response(url, body, headers)
+
+        self._count('misses')
+        # A body the transport stopped reading early is never stored
+        if response is not None and response.status_code == 200 and not getattr(response, 'truncated', False):
+            self._store(key, url, page_kind(url), response)
+        return response
+
+    def close(self):
+        self.conn.close()
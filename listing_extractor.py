@@ -0,0 +1,106 @@
+"""
+Single-pass extraction of listing detail fields
+Walks the page once to index every "label / sibling value" pair, then reads
+the financial fields from that index instead of re-scanning the document
+"""
+
+import re
+from datetime import datetime
+
+from bs4 import NavigableString
+
+from selector_registry import SelectorRegistry
+
+
+# Field -> label pattern, declared once and compiled at import time.
+# Order matters only for readability; each field takes the first label
+# in document order that matches its pattern.
+FIELD_LABELS = {
+    'revenue': re.compile(r'Revenue|Gross Sales', re.I),
+    'ebitda': re.compile(r'EBITDA|Cash Flow|Net Income', re.I),
+    'franchise': re.compile(r'Franchise', re.I),
+    'established_year': re.compile(r'Established|Year Established', re.I),
+    'employees': re.compile(r'Employees', re.I),
+    'facilities': re.compile(r'Facilities|Real Estate', re.I),
+    'reason_for_selling': re.compile(r'Reason for Selling', re.I),
+}
+
+LISTING_ID_RE = re.compile(r'/listing/(\d+)')
+
+# Field -> selectors in priority order; every backend resolves them the same way
+DETAIL_SELECTORS = SelectorRegistry({
+    'business_type': ('div.category', 'span.category'),
+    'price': ('span.price', 'div.price'),
+    'description': ('div.description', 'div#description'),
+    'business_name': ('h1', 'title'),
+    'location': ('span.location', 'div.location'),
+})
+
+
+def build_label_index(soup):
+    """
+    Walk the document once and map each text label to the element that follows it
+
+    The value for a label is the next sibling tag of the label's parent, which is
+    how the detail pages lay out "Revenue: / $1,000,000" style pairs. The index
+    stores the parent and the sibling is resolved only for labels that are read.
+    The first occurrence of a label wins.
+    """
+    index = {}
+    for node in soup.descendants:
+        if not isinstance(node, NavigableString):
+            continue
+        label = node.strip()
+        if label and label not in index:
+            index[label] = node.parent
+    return index
+
+
+def lookup_label(index, pattern):
+    """Return the stripped value text for the first label matching pattern ('' if none)"""
+    for label, parent in index.items():
+        if pattern.search(label):
+            value_elem = parent.find_next_sibling() if parent is not None else None
+            return value_elem.text.strip() if value_elem else ''
+    return ''
+
+
+def extract_labelled_fields(index):
+    """Read every FIELD_LABELS field from a label index"""
+    fields = {name: lookup_label(index, pattern) for name, pattern in FIELD_LABELS.items()}
+    fields['franchise'] = 'Yes' if 'yes' in fields['franchise'].lower() else 'No'
+    return fields
+
+
+def extract_listing(soup, url):
+    """Extract a listing record from a parsed detail page"""
+    return extract_listing_detailed(soup, url)[0]
+
+
+def extract_listing_detailed(soup, url):
+    """
+    Extract a listing record and report which selector found each field
+
+    Returns:
+        (record, selectors) where selectors maps each DETAIL_SELECTORS field to
+        the winning selector ('' if none matched)
+    """
+    listing_data = {
+        'url': url,
+        'scrape_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+    # One pass over the document finds every selector-based field
+    elements, selectors = DETAIL_SELECTORS.select(soup)
+    for name, elem in elements.items():
+        listing_data[name] = elem.text.strip() if elem else ''
+
+    fields = extract_labelled_fields(build_label_index(soup))
+    for name in ('revenue', 'ebitda', 'franchise', 'established_year',
+                 'employees', 'facilities', 'reason_for_selling'):
+        listing_data[name] = fields[name]
+
+    listing_id_match = LISTING_ID_RE.search(url)
+    listing_data['listing_id'] = listing_id_match.group(1) if listing_id_match else ''
+
+    return listing_data, selectors
@@ -0,0 +1,63 @@
+"""
+Typed listing record shared by both scrapers
+A slotted dataclass holds one listing in a fraction of the memory of a
+17-key dict, and listings_frame() turns a list of them into one columnar
+DataFrame that every sink reads, instead of each sink rebuilding its own
+"""
+
+from dataclasses import dataclass, fields
+from operator import attrgetter
+
+
+@dataclass(slots=True)
+class Listing:
+    listing_id: str = ''
+    county: str = ''
+    business_name: str = ''
+    business_type: str = ''
+    price: str = ''
+    revenue: str = ''
+    ebitda: str = ''
+    franchise: str = ''
+    established_year: str = ''
+    location: str = ''
+    employees: str = ''
+    description: str = ''
+    facilities: str = ''
+    reason_for_selling: str = ''
+    url: str = ''
+    scrape_date: str = ''
+    duplicate_group: str = ''
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a parser / store / journal dict (unknown keys are ignored)"""
+        return cls(**{name: '' if value is None else value
+                      for name, value in data.items() if name in _FIELD_NAMES})
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in LISTING_COLUMNS}
+
+
+# Output column order shared by the CSV and the Google Sheet
+LISTING_COLUMNS = [field.name for field in fields(Listing)]
+_FIELD_NAMES = frozenset(LISTING_COLUMNS)
+
+
+def listings_frame(listings, columns=None):
+    """
+    One columnar DataFrame for a batch of Listing records
+
+    Each column is gathered straight from the records, without building an
+    intermediate dict per row. Sinks receive this frame as-is and must not
+    modify it.
+    """
+    import numpy as np
+    import pandas as pd
+
+    columns = columns or LISTING_COLUMNS
+    # Filled column by column into one 2-D block, which pandas adopts without copying
+    values = np.empty((len(listings), len(columns)), dtype=object)
+    for i, name in enumerate(columns):
+        values[:, i] = list(map(attrgetter(name), listings))
+    return pd.DataFrame(values, columns=columns, copy=False)
@@ -0,0 +1,171 @@
+"""
+Persistent listing store for incremental crawls
+Remembers every listing seen so detail pages are only fetched when new or stale
+"""
+
+import hashlib
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+from listing_extractor import LISTING_ID_RE
+
+
+# Fields that change on every fetch and must not affect the fingerprint
+VOLATILE_FIELDS = ('scrape_date', 'county')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    listing_id   TEXT PRIMARY KEY,
+    url          TEXT NOT NULL,
+    first_seen   TEXT NOT NULL,
+    last_seen    TEXT NOT NULL,
+    last_fetched TEXT,
+    fingerprint  TEXT,
+    removed_at   TEXT,
+    record       TEXT,
+    region       TEXT
+)
+"""
+
+
+def listing_id_from_url(url):
+    """Return the numeric listing ID from a listing URL ('' if there is none)"""
+    match = LISTING_ID_RE.search(url)
+    return match.group(1) if match else ''
+
+
+def fingerprint_record(record):
+    """Stable hash of a record's content, ignoring volatile fields"""
+    content = {k: v for k, v in record.items() if k not in VOLATILE_FIELDS}
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ListingStore:
+    def __init__(self, path='listings.db', refresh_after_days=7):
+        """
+        Open (or create) the listing store
+
+        Args:
+            path: SQLite database file
+            refresh_after_days: Re-fetch a known listing once its data is this old
+        """
+        self.path = path
+        self.refresh_after = timedelta(days=refresh_after_days)
+        # Several shard workers on one machine may share the store: WAL lets
+        # readers run alongside a writer, and writers wait for each other
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(SCHEMA)
+        columns = [row['name'] for row in self.conn.execute("PRAGMA table_info(listings)")]
+        if 'region' not in columns:
+            # Stores created before regions were tracked
+            self.conn.execute("ALTER TABLE listings ADD COLUMN region TEXT")
+        self.conn.commit()
+        self.run_started = self._now()
+        self.stats = {'new': 0, 'refreshed': 0, 'reused': 0, 'changed': 0}
+
+    @staticmethod
+    def _now():
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def plan(self, listing_urls, region=None):
+        """
+        Record a search-page sighting and decide which detail pages to fetch
+
+        Args:
+            listing_urls: Listing URLs found on a search page
+            region: Search region the page belongs to ("state/county"), used by mark_removed
+
+        Returns:
+            (urls_to_fetch, cached_records) - cached records are reused as-is
+        """
+        now = self._now()
+        stale_before = (datetime.now() - self.refresh_after).strftime('%Y-%m-%d %H:%M:%S')
+        urls_to_fetch = []
+        cached_records = []
+
+        for url in listing_urls:
+            listing_id = listing_id_from_url(url)
+            if not listing_id:
+                urls_to_fetch.append(url)
+                continue
+
+            row = self.conn.execute(
+                "SELECT last_fetched, record FROM listings WHERE listing_id = ?", (listing_id,)
+            ).fetchone()
+
+            if row is None:
+                self.conn.execute(
+                    "INSERT INTO listings (listing_id, url, first_seen, last_seen, region) VALUES (?, ?, ?, ?, ?)",
+                    (listing_id, url, now, now, region)
+                )
+                self.stats['new'] += 1
+                urls_to_fetch.append(url)
+                continue
+
+            self.conn.execute(
+                "UPDATE listings SET url = ?, last_seen = ?, removed_at = NULL, region = COALESCE(?, region) "
+                "WHERE listing_id = ?",
+                (url, now, region, listing_id)
+            )
+            if row['record'] is None or row['last_fetched'] is None or row['last_fetched'] < stale_before:
+                self.stats['refreshed'] += 1
+                urls_to_fetch.append(url)
+            else:
+                self.stats['reused'] += 1
+                cached_records.append(json.loads(row['record']))
+
+        self.conn.commit()
+        return urls_to_fetch, cached_records
+
+    def save(self, record):
+        """Store a freshly fetched record and its fingerprint"""
+        listing_id = record.get('listing_id')
+        if not listing_id:
+            return
+        fingerprint = fingerprint_record(record)
+        row = self.conn.execute(
+            "SELECT fingerprint FROM listings WHERE listing_id = ?", (listing_id,)
+        ).fetchone()
+        if row is not None and row['fingerprint'] and row['fingerprint'] != fingerprint:
+            self.stats['changed'] += 1
+
+        stored = {k: v for k, v in record.items() if k != 'county'}
+        now = self._now()
+        self.conn.execute(
+            """INSERT INTO listings (listing_id, url, first_seen, last_seen, last_fetched, fingerprint, record)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(listing_id) DO UPDATE SET
+                   last_fetched = excluded.last_fetched,
+                   fingerprint = excluded.fingerprint,
+                   record = excluded.record""",
+            (listing_id, record.get('url', ''), now, now, now, fingerprint, json.dumps(stored))
+        )
+        self.conn.commit()
+
+    def mark_removed(self, skip_regions=()):
+        """
+        Flag listings that were not seen during this run; returns their IDs
+
+        Args:
+            skip_regions: Regions whose search pages were not all fetched this run;
+                their listings (and any whose region is unknown) are left alone
+        """
+        query = "SELECT listing_id FROM listings WHERE last_seen < ? AND removed_at IS NULL"
+        params = [self.run_started]
+        skip_regions = sorted(skip_regions)
+        if skip_regions:
+            query += f" AND region IS NOT NULL AND region NOT IN ({', '.join('?' * len(skip_regions))})"
+            params += skip_regions
+        removed = [row['listing_id'] for row in self.conn.execute(query, params)]
+        now = self._now()
+        self.conn.executemany(
+            "UPDATE listings SET removed_at = ? WHERE listing_id = ?", [(now, listing_id) for listing_id in removed]
+        )
+        self.conn.commit()
+        return removed
+
+    def close(self):
+        self.conn.close()
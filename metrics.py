@@ -0,0 +1,274 @@
+"""
+Run metrics: counters, latency histograms and stage timers
+Fetch, parse, normalize, sink and Sheets stages record into one process-wide
+registry, which is written out as a JSON run summary and/or a Prometheus
+textfile (for node_exporter's textfile collector)
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+PROM_PREFIX = 'bizbuysell_'
+
+# Upper bounds (seconds) shared by every latency histogram
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _label_value(value):
+    """Escape a label value for the exposition format (selectors, for one, contain quotes)"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(key):
+    if not key:
+        return ''
+    return '{' + ','.join(f'{k}="{_label_value(v)}"' for k, v in key) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """Estimate a quantile from the buckets (upper bound of the bucket it falls in)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return round(min(bound, self.max), 6)
+        return round(self.max, 6)
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'max': round(self.max, 6),
+        }
+
+
+class Metrics:
+    """Thread-safe registry (fetches run on worker threads)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+            self.started = time.monotonic()
+            self.started_at = datetime.now()
+
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        """Set a value that goes up and down (e.g. the current request rate)"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        """Record one value (seconds) in a histogram"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Time a block into a histogram"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def record_response(self, response):
+        """Count the status code and body size of a network response"""
+        self.inc('http_responses_total', status=response.status_code)
+        self.inc('http_bytes_total', len(response.content))
+
+    def counter_value(self, name, **labels):
+        """Total of a counter, summed over any labels not given"""
+        wanted = set(_label_key(labels))
+        with self._lock:
+            return sum(value for (n, key), value in self.counters.items()
+                       if n == name and wanted <= set(key))
+
+    def summary(self):
+        """JSON-friendly snapshot of everything recorded so far"""
+        with self._lock:
+            counters = {}
+            for (name, key), value in sorted(self.counters.items()):
+                counters.setdefault(name, {})[_label_text(key) or 'total'] = value
+            gauges = {}
+            for (name, key), value in sorted(self.gauges.items()):
+                gauges.setdefault(name, {})[_label_text(key) or 'value'] = value
+            histograms = {}
+            for (name, key), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                histograms.setdefault(name, {})[_label_text(key) or 'all'] = histogram.summary()
+
+        summary = {
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'wall_seconds': round(time.monotonic() - self.started, 3),
+            'counters': counters,
+            'gauges': gauges,
+            'histograms': histograms,
+        }
+        cache_lookups = self.counter_value('http_cache_events_total') - self.counter_value(
+            'http_cache_events_total', event='evictions')
+        if cache_lookups:
+            hits = self.counter_value('http_cache_events_total', event='hits')
+            summary['cache_hit_rate'] = round(hits / cache_lookups, 4)
+        return summary
+
+    def prometheus_text(self):
+        """Render the registry in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counter_names = sorted({name for name, _ in self.counters})
+            for name in counter_names:
+                lines.append(f"# TYPE {PROM_PREFIX}{name} counter")
+                for (n, key), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f"{PROM_PREFIX}{name}{_label_text(key)} {value}")
+            for name in sorted({name for name, _ in self.gauges}):
+                lines.append(f"# TYPE {PROM_PREFIX}{name} gauge")
+                for (n, key), value in sorted(self.gauges.items()):
+                    if n == name:
+                        lines.append(f"{PROM_PREFIX}{name}{_label_text(key)} {value}")
+            histogram_names = sorted({name for name, _ in self.histograms})
+            for name in histogram_names:
+                lines.append(f"# TYPE {PROM_PREFIX}{name} histogram")
+                for (n, key), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if n != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le_key = key + (('le', repr(bound)),)
+                        lines.append(f"{PROM_PREFIX}{name}_bucket{_label_text(le_key)} {cumulative}")
+                    lines.append(f"{PROM_PREFIX}{name}_bucket{_label_text(key + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{PROM_PREFIX}{name}_sum{_label_text(key)} {histogram.sum}")
+                    lines.append(f"{PROM_PREFIX}{name}_count{_label_text(key)} {histogram.count}")
+        lines.append(f"# TYPE {PROM_PREFIX}last_run_timestamp_seconds gauge")
+        lines.append(f"{PROM_PREFIX}last_run_timestamp_seconds {int(time.time())}")
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        print(f"Run metrics saved to {path}")
+
+    def write_prometheus(self, path):
+        # Write then rename, so the textfile collector never reads a partial file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        print(f"Prometheus metrics saved to {path}")
+
+
+# Process-wide registry used by every stage
+metrics = Metrics()
+
+
+@contextlib.contextmanager
+def profiled(mode, output=None):
+    """
+    Profile a block with cProfile or pyinstrument
+
+    Args:
+        mode: None (no profiling), 'cprofile' or 'pyinstrument'
+        output: File for the profile (.prof stats or .html report); defaults by mode
+    """
+    if mode is None:
+        yield
+        return
+
+    if mode == 'cprofile':
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            output = output or 'profile.prof'
+            profiler.dump_stats(output)
+            print(f"\ncProfile stats saved to {output}; top functions by cumulative time:")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+    elif mode == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("pyinstrument is not installed (pip install pyinstrument)")
+
+        profiler = Profiler(async_mode='enabled')
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            output = output or 'profile.html'
+            with open(output, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            print(f"\npyinstrument report saved to {output}")
+            print(profiler.output_text(unicode=True))
+    else:
+        raise ValueError(f"Unknown profiler: {mode}")
+
+
+def add_cli_arguments(parser):
+    """Add --metrics-json / --prom-file / --profile to a scraper's argument parser"""
+    parser.add_argument('--metrics-json', metavar='PATH',
+                        help="write a JSON run summary (stage timings, status codes, cache hit rate)")
+    parser.add_argument('--prom-file', metavar='PATH',
+                        help="write metrics as a Prometheus textfile")
+    parser.add_argument('--profile', choices=('cprofile', 'pyinstrument'),
+                        help="profile the whole run")
+
+
+def write_outputs(args):
+    """Write the metrics files requested on the command line"""
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.prom_file:
+        metrics.write_prometheus(args.prom_file)
@@ -0,0 +1,81 @@
+"""
+Typed numeric normalization and config.py filters
+Turns money strings like "$1,250,000", "$1.2M" or "Not Disclosed" into
+integers / nulls, and applies MIN_PRICE, MAX_PRICE, MIN_REVENUE and
+FRANCHISE_ONLY as early as the data allows
+"""
+
+import re
+
+import pandas as pd
+
+import config
+
+
+MONEY_COLUMNS = ('price', 'revenue', 'ebitda')
+
+# "$1,250,000", "1250000", "$1.2M", "$850K", "$1.2 Million" - the first amount
+# in the text wins; the number is never cut short to fit a multiplier
+MONEY_PATTERN = r'(?i)\$?\s*(\d[\d,]*(?:\.\d+)?)(?![.,]?\d)(?:\s*(million|thousand|mil|mm|m|k)\b)?'
+MONEY_RE = re.compile(MONEY_PATTERN)
+MULTIPLIERS = {'k': 1_000, 'thousand': 1_000, 'm': 1_000_000, 'mm': 1_000_000, 'mil': 1_000_000,
+               'million': 1_000_000}
+
+
+def parse_money(text):
+    """Parse a single money string into an int, or None when no amount is given"""
+    if text is None:
+        return None
+    match = MONEY_RE.search(str(text))
+    if not match:
+        return None
+    amount = float(match.group(1).replace(',', ''))
+    return int(round(amount * MULTIPLIERS.get((match.group(2) or '').lower(), 1)))
+
+
+def normalize_money_columns(df, columns=MONEY_COLUMNS):
+    """Convert money columns of a DataFrame to nullable integers in one vectorized pass"""
+    for col in columns:
+        if col not in df.columns:
+            continue
+        parts = df[col].astype('string').str.extract(MONEY_PATTERN)
+        amounts = pd.to_numeric(parts[0].str.replace(',', '', regex=False), errors='coerce')
+        multipliers = parts[1].str.lower().map(MULTIPLIERS).fillna(1).astype(float)
+        df[col] = (amounts * multipliers).round().astype('Int64')
+    return df
+
+
+def price_allowed(price):
+    """Card-level check: can a listing with this asking price pass the price filters?"""
+    if price is None:
+        return True  # unknown until the detail page says otherwise
+    if config.MIN_PRICE is not None and price < config.MIN_PRICE:
+        return False
+    if config.MAX_PRICE is not None and price > config.MAX_PRICE:
+        return False
+    return True
+
+
+def filter_listings(df):
+    """
+    Apply the config.py filters to a normalized DataFrame
+
+    Listings with an undisclosed price or revenue are kept, since they cannot
+    be ruled out.
+    """
+    keep = pd.Series(True, index=df.index)
+    if 'price' in df.columns:
+        if config.MIN_PRICE is not None:
+            keep &= ~(df['price'] < config.MIN_PRICE).fillna(False)
+        if config.MAX_PRICE is not None:
+            keep &= ~(df['price'] > config.MAX_PRICE).fillna(False)
+    if config.MIN_REVENUE is not None and 'revenue' in df.columns:
+        keep &= ~(df['revenue'] < config.MIN_REVENUE).fillna(False)
+    if config.FRANCHISE_ONLY and 'franchise' in df.columns:
+        keep &= df['franchise'] == 'Yes'
+    return df[keep]
+
+
+def filters_active():
+    return (config.MIN_PRICE is not None or config.MAX_PRICE is not None
+            or config.MIN_REVENUE is not None or config.FRANCHISE_ONLY)
@@ -0,0 +1,313 @@
+"""
+Streaming crawl pipeline
+search-page producers -> detail-fetch workers -> normalize/filter -> sinks,
+connected by bounded queues so records reach the sinks as soon as they are
+parsed. Records are written in small batches that are normalized once and
+shared by every sink.
+"""
+
+import asyncio
+import os
+import time
+
+import pandas as pd
+
+import config
+from dedup import INPUT_COLUMNS, DuplicateFinder, report_duplicate_groups
+from listing_record import Listing, listings_frame
+from metrics import metrics
+from normalize import filter_listings, normalize_money_columns, parse_money, price_allowed
+from url_frontier import UrlFrontier
+
+
+# Marks the end of a queue's input
+_DONE = object()
+# Rows read back at a time when CsvSink.finish() rewrites its file
+REWRITE_CHUNK_ROWS = 5000
+
+
+class SearchIncomplete(Exception):
+    """Raised by a search crawl that had to stop before its last page"""
+
+
+class CsvSink:
+    """Appends each batch to a CSV file as it arrives"""
+
+    def __init__(self, filename, columns, append=False, group_duplicates=False):
+        """
+        Args:
+            filename: CSV to write
+            columns: Header row, in file order
+            append: Add to the rows already in the file instead of starting over
+            group_duplicates: Fill duplicate_group once the run is done (config.DEDUP_ENABLED permitting)
+        """
+        self.filename = filename
+        self.columns = columns
+        self.group_duplicates = group_duplicates
+        has_rows = append and os.path.exists(filename) and os.path.getsize(filename) > 0
+        self._file = open(filename, 'a' if append else 'w', newline='', encoding='utf-8')
+        if not has_rows:
+            pd.DataFrame(columns=columns).to_csv(self._file, index=False)
+
+    def write_batch(self, frame):
+        if list(frame.columns) != list(self.columns):
+            frame = frame.reindex(columns=self.columns)
+        frame.to_csv(self._file, header=False, index=False)
+        self._file.flush()
+
+    def finish(self, frontier):
+        """
+        Re-derive counties from the whole run's frontier and group near-duplicates
+
+        The file is read back a chunk at a time: once for the counties and the
+        dedup signatures, and, only if anything changed, again to rewrite it.
+        """
+        self._file.close()
+
+        def counties(chunk):
+            return [frontier.county_label(url, county) for url, county in zip(chunk['url'], chunk['county'])]
+
+        def chunks(columns=None):
+            return pd.read_csv(self.filename, dtype=str, keep_default_na=False, usecols=columns,
+                               chunksize=REWRITE_CHUNK_ROWS)
+
+        finder = DuplicateFinder() if self.group_duplicates and config.DEDUP_ENABLED else None
+        relabeled = False
+        for chunk in chunks(list(INPUT_COLUMNS) if finder else ['url', 'county']):
+            labels = counties(chunk)
+            relabeled = relabeled or labels != chunk['county'].tolist()
+            chunk['county'] = labels
+            if finder:
+                finder.add(chunk)
+        groups = finder.labels() if finder else []
+        report_duplicate_groups(groups)
+        if not relabeled and not any(groups):
+            return
+
+        staging = self.filename + '.tmp'
+        with open(staging, 'w', newline='', encoding='utf-8') as out:
+            offset = 0
+            for chunk in chunks():
+                chunk['county'] = counties(chunk)
+                if groups:
+                    chunk['duplicate_group'] = groups[offset:offset + len(chunk)]
+                chunk.to_csv(out, header=offset == 0, index=False)
+                offset += len(chunk)
+        os.replace(staging, self.filename)
+
+    def close(self):
+        self._file.close()
+
+
+class ListSink:
+    """Collects records in memory (for callers that want the whole list back)"""
+
+    def __init__(self):
+        self.records = []
+
+    def write_batch(self, frame):
+        self.records.extend(frame.astype(object).where(frame.notna(), None).to_dict('records'))
+
+    def finish(self, frontier):
+        for record in self.records:
+            record['county'] = frontier.county_label(record['url'], record['county'])
+
+    def close(self):
+        pass
+
+
+class ListingPipeline:
+    def __init__(self, scraper, sinks, units, queue_size=100, detail_workers=None,
+                 batch_size=50, flush_seconds=5):
+        """
+        Wire a scraper's search and detail stages to a set of sinks
+
+        Args:
+            scraper: BizBuySellScraper providing crawl_search_pages / scrape_listing_page_async
+            sinks: Objects with write_batch(frame) and close(); a sink may also
+                have finish(frontier), called only after a successful run once
+                every record is written, to re-derive counties from the complete
+                frontier and finalize its output (close() is always called)
+            units: sharding.WorkUnit (state, county, page range) items to crawl
+            queue_size: Capacity of each stage queue; producers wait when it is full
+            detail_workers: Concurrent detail-page workers (defaults to the engine's in-flight limit)
+            batch_size: Records normalized and written together
+            flush_seconds: Write a partial batch once its oldest record is this old
+        """
+        self.scraper = scraper
+        self.sinks = sinks
+        self.units = units
+        self.queue_size = queue_size
+        self.detail_workers = detail_workers or scraper.engine.max_in_flight
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.county_counts = {}
+        # One frontier per run: each listing is fetched once, whichever counties list it
+        self.frontier = UrlFrontier(scraper.base_url)
+        # Units whose search pages could not all be fetched
+        self.incomplete_units = []
+        self.records_written = 0
+        self.skipped_by_card = 0
+        self.filtered_out = 0
+        self.first_record_after = None
+
+    async def _produce(self, unit, detail_queue, record_queue):
+        """Walk a unit's search pages and queue every listing found"""
+        try:
+            await self._produce_pages(unit, detail_queue, record_queue)
+        except SearchIncomplete:
+            self.incomplete_units.append(unit)
+
+    async def _produce_pages(self, unit, detail_queue, record_queue):
+        store = self.scraper.store
+        county = unit.county
+        pages = self.scraper.crawl_search_pages(county, unit.state, unit.first_page, unit.last_page)
+        async for listing_urls, card_prices in pages:
+            first_seen = {}
+            for url in listing_urls:
+                canonical = self.frontier.add(url, county)
+                if canonical:
+                    first_seen[canonical] = card_prices.get(url)
+            metrics.inc('listing_duplicates_total', len(listing_urls) - len(first_seen))
+            listing_urls, card_prices = list(first_seen), first_seen
+            cached_records = []
+            if store:
+                listing_urls, cached_records = store.plan(listing_urls, f"{unit.state}/{county}")
+            # Filter push-down: skip detail pages whose card price already rules them out
+            allowed = [url for url in listing_urls if price_allowed(parse_money(card_prices.get(url)))]
+            self.skipped_by_card += len(listing_urls) - len(allowed)
+            metrics.inc('detail_pages_skipped_total', len(listing_urls) - len(allowed), reason='card_price')
+            listing_urls = allowed
+            for record in cached_records:
+                record = Listing.from_dict(record)
+                record.county = county.title()
+                await record_queue.put(record)
+            for url in listing_urls:
+                await detail_queue.put((url, county))
+
+    async def _fetch_details(self, detail_queue, record_queue):
+        """Fetch and parse detail pages until the producers are done"""
+        store = self.scraper.store
+        journal = self.scraper.journal
+        while True:
+            item = await detail_queue.get()
+            if item is _DONE:
+                return
+            url, county = item
+            journaled = journal.lookup('detail', url) if journal else None
+            if journaled is not None:
+                record = Listing.from_dict(journaled)
+            else:
+                record = await self.scraper.scrape_listing_page_async(url)
+                if record is None:
+                    continue
+                if store or journal:
+                    stored = record.to_dict()
+                    if store:
+                        store.save(stored)
+                    if journal:
+                        journal.record('detail', url, stored)
+            record.county = county.title()
+            await record_queue.put(record)
+
+    def _flush(self, batch, started):
+        """Normalize and filter a batch once, then give the same frame to every sink"""
+        for record in batch:
+            # Counties are resolved as late as possible; a county whose search
+            # pages list the listing only after it was written is added by the
+            # sinks' finish()
+            record.county = self.frontier.county_label(record.url, record.county)
+        with metrics.timer('normalize_seconds'):
+            frame = filter_listings(normalize_money_columns(listings_frame(batch)))
+        self.filtered_out += len(batch) - len(frame)
+        metrics.inc('records_filtered_total', len(batch) - len(frame))
+        if frame.empty:
+            return
+        if self.first_record_after is None:
+            self.first_record_after = time.monotonic() - started
+        for sink in self.sinks:
+            with metrics.timer('sink_write_seconds', sink=type(sink).__name__):
+                sink.write_batch(frame)
+        self.records_written += len(frame)
+        metrics.inc('records_written_total', len(frame))
+        for county, count in frame['county'].str.split(', ').explode().value_counts(sort=False).items():
+            self.county_counts[county] = self.county_counts.get(county, 0) + count
+
+    async def _drain(self, record_queue, started):
+        """Batch finished records and hand them to the sinks"""
+        batch = []
+        batch_started = None
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(0.0, batch_started + self.flush_seconds - time.monotonic())
+            try:
+                record = await asyncio.wait_for(record_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                record = None
+            if record is _DONE:
+                break
+            if record is not None:
+                if not batch:
+                    batch_started = time.monotonic()
+                batch.append(record)
+            if batch and (len(batch) >= self.batch_size or record is None):
+                self._flush(batch, started)
+                batch = []
+        if batch:
+            self._flush(batch, started)
+
+    async def _produce_all(self, detail_queue, record_queue):
+        """Run every unit's producer, then tell the detail workers to stop"""
+        await asyncio.gather(*(self._produce(unit, detail_queue, record_queue) for unit in self.units))
+        for _ in range(self.detail_workers):
+            await detail_queue.put(_DONE)
+
+    @staticmethod
+    async def _close_records(workers, record_queue):
+        """Tell the drainer to stop once every detail worker has finished"""
+        await asyncio.wait(workers)
+        await record_queue.put(_DONE)
+
+    async def run_async(self):
+        started = time.monotonic()
+        detail_queue = asyncio.Queue(self.queue_size)
+        record_queue = asyncio.Queue(self.queue_size)
+
+        workers = [
+            asyncio.create_task(self._fetch_details(detail_queue, record_queue))
+            for _ in range(self.detail_workers)
+        ]
+        tasks = [
+            asyncio.create_task(self._produce_all(detail_queue, record_queue)),
+            *workers,
+            asyncio.create_task(self._close_records(workers, record_queue)),
+            asyncio.create_task(self._drain(record_queue, started)),
+        ]
+        try:
+            # A failing stage (e.g. a sink that raises) stops the run instead of
+            # leaving the other stages blocked on a queue nobody empties
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    task.result()
+            for sink in self.sinks:
+                if hasattr(sink, 'finish'):
+                    sink.finish(self.frontier)
+            # Archived pages keep their counties, so re-extracted records get them too
+            archive = getattr(self.scraper, 'archive', None)
+            if archive is not None:
+                archive.set_counties(self.frontier.labels())
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for sink in self.sinks:
+                sink.close()
+
+        return self.records_written
+
+    def run(self):
+        """Run the whole pipeline; returns the number of records written"""
+        return asyncio.run(self.run_async())
@@ -0,0 +1,143 @@
+"""
+Adaptive per-host request rate (AIMD)
+The rate grows additively while responses are healthy and is cut
+multiplicatively on 403/429/5xx responses, connection errors or rising
+latency. Retry-After headers pause the host for as long as the server asks.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import config
+from metrics import metrics
+
+
+# Responses that mean "slow down" rather than "this page is broken"
+THROTTLE_STATUSES = {403, 429, 500, 502, 503, 504}
+
+# Latency must also rise by at least this many seconds to count as pushback,
+# so jitter on very fast responses is not mistaken for congestion
+MIN_LATENCY_RISE = 0.25
+
+
+def parse_retry_after(value, now=None):
+    """
+    Seconds to wait according to a Retry-After header (delay-seconds or HTTP-date)
+
+    Returns None when the header is missing or malformed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+
+def rate_options_from_config():
+    """AimdRateController settings from config.py"""
+    return {
+        'min_rate': config.MIN_REQUESTS_PER_SECOND,
+        'max_rate': config.MAX_REQUESTS_PER_SECOND,
+        'increase': config.RATE_INCREASE_STEP,
+        'decrease': config.RATE_DECREASE_FACTOR,
+        'latency_factor': config.RATE_LATENCY_FACTOR,
+        'max_retry_after': config.MAX_RETRY_AFTER,
+    }
+
+
+class AimdRateController:
+    """Hands out request slots for one host at a rate that adapts to its responses"""
+
+    def __init__(self, host, initial_rate=0.5, min_rate=0.1, max_rate=4.0, increase=0.05,
+                 decrease=0.5, latency_factor=2.0, max_retry_after=600):
+        """
+        Args:
+            host: Host name (used as the metric label)
+            initial_rate: Starting requests per second
+            min_rate: Never go slower than this
+            max_rate: Never go faster than this
+            increase: Requests/second added after each healthy response
+            decrease: Factor the rate is multiplied by when the server pushes back
+            latency_factor: Treat latency above this multiple of the best seen as pushback
+            max_retry_after: Upper bound (seconds) on a Retry-After pause
+        """
+        self.host = host
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(initial_rate, min_rate), max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.max_retry_after = max_retry_after
+        self.latency = None
+        self.best_latency = None
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._last_cut = 0.0
+        self._publish()
+
+    def _publish(self):
+        metrics.set_gauge('request_rate_per_second', round(self.rate, 4), host=self.host)
+
+    def reserve(self):
+        """Reserve the next free slot and return how long to wait for it"""
+        now = time.monotonic()
+        slot = max(now, self._next_slot, self._paused_until)
+        self._next_slot = slot + 1.0 / self.rate
+        return slot - now
+
+    async def acquire(self):
+        """Wait until this host's current rate allows another request"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def _cut(self, sent_at, reason):
+        # Responses to requests sent before the last cut already reflect the
+        # old rate; cutting again for each of them would collapse the rate
+        if sent_at < self._last_cut:
+            return
+        self._last_cut = time.monotonic()
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        metrics.inc('rate_decreases_total', host=self.host, reason=reason)
+        self._publish()
+
+    def record(self, status, latency, retry_after=None):
+        """
+        Feed back the outcome of one request
+
+        Args:
+            status: HTTP status code, or None when the request failed without a response
+            latency: Seconds the request took
+            retry_after: Raw Retry-After header value, if the response had one
+        """
+        sent_at = time.monotonic() - latency
+        pause = parse_retry_after(retry_after)
+        if pause is not None:
+            pause = min(pause, self.max_retry_after)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            metrics.observe('retry_after_seconds', pause, host=self.host)
+
+        if status is None or status in THROTTLE_STATUSES:
+            self._cut(sent_at, 'error' if status is None else str(status))
+            return
+
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        self.best_latency = self.latency if self.best_latency is None else min(self.best_latency, self.latency)
+        threshold = max(self.best_latency * self.latency_factor, self.best_latency + MIN_LATENCY_RISE)
+        if self.latency > threshold:
+            self._cut(sent_at, 'latency')
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            self._publish()
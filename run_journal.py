@@ -0,0 +1,90 @@
+"""
+Append-only run journal for resuming interrupted crawls
+Every completed search page and detail page is written as one JSON line, so a
+run that is killed partway through can pick up where it stopped
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+class RunJournal:
+    def __init__(self, path='run_journal.jsonl', resume=False, max_age_hours=24):
+        """
+        Open the journal for a new run
+
+        Args:
+            path: JSON-lines journal file
+            resume: Reuse the entries of an unfinished previous run instead of starting over
+            max_age_hours: Never resume a run that started longer ago than this
+        """
+        self.path = path
+        self.max_age = timedelta(hours=max_age_hours)
+        self.entries = {}
+        self.resumed = 0
+
+        previous_complete = True
+        if resume and os.path.exists(path):
+            previous_complete = self._load()
+
+        if resume and not previous_complete:
+            print(f"Resuming from {path}: {len(self.entries)} completed pages on record")
+            self._file = open(path, 'a', encoding='utf-8')
+            if self._file.tell() and not _ends_with_newline(path):
+                self._file.write('\n')
+        else:
+            if resume:
+                print("No unfinished run to resume, starting a new one")
+            self.entries = {}
+            self._file = open(path, 'w', encoding='utf-8')
+            self._append({'type': 'run_start'})
+
+    def _load(self):
+        """Read a previous journal; returns True if that run finished (or is too old to resume)"""
+        complete = False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn line from a killed process
+                if entry['type'] == 'run_start':
+                    started = datetime.strptime(entry['at'], '%Y-%m-%d %H:%M:%S')
+                    complete = datetime.now() - started > self.max_age
+                elif entry['type'] == 'run_complete':
+                    complete = True
+                elif entry['type'] == 'page':
+                    self.entries[(entry['kind'], entry['url'])] = entry['data']
+        return complete
+
+    def _append(self, entry):
+        entry['at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def lookup(self, kind, url):
+        """Return the data recorded for a completed page, or None"""
+        data = self.entries.get((kind, url))
+        if data is not None:
+            self.resumed += 1
+        return data
+
+    def record(self, kind, url, data):
+        """Checkpoint a completed page ('search' or 'detail') and what was extracted from it"""
+        self.entries[(kind, url)] = data
+        self._append({'type': 'page', 'kind': kind, 'url': url, 'data': data})
+
+    def finish(self):
+        """Mark the run as complete so the next --resume starts fresh"""
+        self._append({'type': 'run_complete'})
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
@@ -0,0 +1,212 @@
+"""
+Declarative selector fallback chains
+Each field lists its selectors in priority order, like the `a or b` chains
+they replace. All of a registry's selectors are compiled into one combined
+query (an XPath union for lxml, a single walk filtered by tag name for
+BeautifulSoup), so an element is scanned once for every field instead of once
+per miss, and the matches are then sorted back into the chains. The selector that won a field last time is tested first.
+Callers count the winners per selector, so a redesign that moves a field onto
+its fallback (or loses it) shows up in the run summary.
+
+Selectors use a small CSS subset: tag, .class, #id and [attr*="text"] (add i
+for case-insensitive). A comma-separated group counts as one alternative.
+"""
+
+import re
+
+from bs4 import Tag
+from lxml import etree
+
+import config
+from metrics import metrics
+
+
+COMPOUND_RE = re.compile(r'^(\*|[a-zA-Z][\w-]*)?((?:\.[\w-]+|#[\w-]+|\[[\w-]+\*="[^"]*"(?:\s+i)?\])*)$')
+CONDITION_RE = re.compile(r'\.([\w-]+)|#([\w-]+)|\[([\w-]+)\*="([^"]*)"(\s+i)?\]')
+
+_UPPER = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_LOWER = _UPPER.lower()
+
+
+def _attribute(attrs, name):
+    """Attribute value as one string (bs4 keeps class as a list)"""
+    value = attrs.get(name)
+    if isinstance(value, list):
+        return ' '.join(value)
+    return value
+
+
+class _Compound:
+    """One compound selector such as div.price or a[href*="/listing/"]"""
+
+    def __init__(self, text):
+        match = COMPOUND_RE.match(text)
+        if not match or not text:
+            raise ValueError(f"Unsupported selector {text!r} (tag, .class, #id and [attr*=\"text\"] only)")
+        self.text = text
+        self.tag = None if match.group(1) in (None, '*') else match.group(1).lower()
+        self.classes = []
+        self.ids = []
+        self.contains = []
+        for class_name, id_value, attr, value, flag in CONDITION_RE.findall(match.group(2)):
+            if class_name:
+                self.classes.append(class_name)
+            elif id_value:
+                self.ids.append(id_value)
+            else:
+                self.contains.append((attr, value.lower() if flag else value, bool(flag)))
+
+    def xpath(self):
+        predicates = [f"contains(concat(' ', normalize-space(@class), ' '), ' {c} ')" for c in self.classes]
+        predicates += [f'@id="{i}"' for i in self.ids]
+        for attr, value, ignore_case in self.contains:
+            subject = f"translate(@{attr}, '{_UPPER}', '{_LOWER}')" if ignore_case else f'@{attr}'
+            predicates.append(f'contains({subject}, "{value}")')
+        return f"descendant::{self.tag or '*'}" + ''.join(f'[{p}]' for p in predicates)
+
+    def matches(self, tag, attrs):
+        if self.tag is not None and tag != self.tag:
+            return False
+        if self.classes:
+            classes = (_attribute(attrs, 'class') or '').split()
+            if any(c not in classes for c in self.classes):
+                return False
+        if any(attrs.get('id') != i for i in self.ids):
+            return False
+        for attr, value, ignore_case in self.contains:
+            actual = _attribute(attrs, attr)
+            if actual is None:
+                return False
+            if value not in (actual.lower() if ignore_case else actual):
+                return False
+        return True
+
+
+class Selector:
+    """One alternative of a chain: a compound selector or a comma-separated group of them"""
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = [_Compound(part.strip()) for part in text.split(',')]
+
+    def matches(self, tag, attrs):
+        return any(part.matches(tag, attrs) for part in self.parts)
+
+    def xpath(self):
+        """XPath for this alternative on its own (elements in document order)"""
+        return ' | '.join(part.xpath() for part in self.parts)
+
+
+class SelectorRegistry:
+    def __init__(self, chains):
+        """
+        Args:
+            chains: Field -> selectors in priority order (first match wins, as in `a or b or c`)
+        """
+        self.chains = {field: [Selector(text) for text in selectors] for field, selectors in chains.items()}
+        parts = {}
+        for chain in self.chains.values():
+            for selector in chain:
+                for part in selector.parts:
+                    parts.setdefault(part.text, part)
+        # One query for every selector of every field
+        self._xpath = etree.XPath(' | '.join(part.xpath() for part in parts.values()))
+        tags = {part.tag for part in parts.values()}
+        self._tags = None if None in tags else frozenset(tags)
+        # Field -> index of the selector that won the last lookup
+        self.winners = {}
+        # Field -> {selector text or '': lookups it won}, filled by count()
+        self.counts = {}
+
+    def select(self, node):
+        """
+        First element per field, in the priority order of each chain
+
+        Args:
+            node: BeautifulSoup tag / document or lxml element to search below
+
+        Returns:
+            (elements, selectors): field -> element (None if no selector matched)
+            and field -> text of the winning selector ('' if none matched)
+        """
+        found, selectors = self._resolve(node, first_only=True)
+        return {field: (nodes[0] if nodes else None) for field, nodes in found.items()}, selectors
+
+    def select_all(self, node):
+        """Like select(), but every element the winning selector matched, in document order"""
+        return self._resolve(node, first_only=False)
+
+    def _resolve(self, node, first_only):
+        if isinstance(node, Tag):
+            tags = self._tags
+            matched = [element for element in node.descendants
+                       if isinstance(element, Tag) and (tags is None or element.name in tags)]
+        else:
+            matched = self._xpath(node)
+        best = {field: (len(chain), []) for field, chain in self.chains.items()}
+        for element in matched:
+            if isinstance(element, Tag):
+                tag, attrs = element.name, element.attrs
+            else:
+                tag, attrs = element.tag, element.attrib
+            for field in self.chains:
+                index, nodes = best[field]
+                # A first-only lookup cannot be improved by a selector that is not strictly better
+                lowest = self._lowest_match(field, tag, attrs, index - 1 if first_only else index)
+                if lowest is None:
+                    continue
+                if lowest < index:
+                    best[field] = (lowest, [element])
+                elif not first_only:
+                    nodes.append(element)
+
+        found = {}
+        selectors = {}
+        for field, (index, nodes) in best.items():
+            found[field] = nodes
+            if nodes:
+                self.winners[field] = index
+                selectors[field] = self.chains[field][index].text
+            else:
+                selectors[field] = ''
+        return found, selectors
+
+    def _lowest_match(self, field, tag, attrs, limit):
+        """Index of the highest-priority selector (at most limit) matching an element, last winner first"""
+        chain = self.chains[field]
+        limit = min(limit, len(chain) - 1)
+        lowest = None
+        winner = self.winners.get(field)
+        if winner is not None and winner <= limit and chain[winner].matches(tag, attrs):
+            # Only a selector ahead of the winner can still beat it
+            lowest, limit = winner, winner - 1
+        for index in range(limit + 1):
+            if index != winner and chain[index].matches(tag, attrs):
+                return index
+        return lowest
+
+    def reset_counts(self):
+        self.counts = {}
+
+    def count(self, selectors):
+        """Record which selector won each field of one lookup (also as the selector_matches_total metric)"""
+        for field, selector in selectors.items():
+            field_counts = self.counts.setdefault(field, {})
+            field_counts[selector] = field_counts.get(selector, 0) + 1
+            metrics.inc('selector_matches_total', field=field, selector=selector or 'none')
+
+    def report(self, title):
+        """Print each field's hit rate per selector; fields whose first choice is losing are flagged"""
+        if not self.counts:
+            return
+        print(f"{title} selector hit rates:")
+        for field, field_counts in self.counts.items():
+            lookups = sum(field_counts.values())
+            shares = ', '.join(
+                f"{selector or 'no match'} {100 * count / lookups:.0f}%"
+                for selector, count in sorted(field_counts.items(), key=lambda item: -item[1])
+            )
+            chain = self.chains.get(field)
+            primary = field_counts.get(chain[0].text, 0) if chain else 0
+            flag = '  <- check selectors' if primary / lookups < config.SELECTOR_DRIFT_SHARE else ''
+            print(f"  {field}: {shares}{flag}")
@@ -0,0 +1,370 @@
+"""
+Horizontal sharding of the crawl
+Splits the configured regions into (state, county, page range) work units and
+spreads them over worker processes or CI matrix jobs:
+
+    lease mode   workers claim units from a shared SQLite queue; a lease that
+                 is not renewed (crashed worker) expires and the unit is retried
+    static mode  --shard-index / --shard-count pick a fixed slice of the units,
+                 for CI matrix jobs that share nothing
+
+Each worker writes its own CSV; `merge` combines them into one result,
+deduplicated by listing ID.
+
+Usage:
+    python sharding.py work --workers 4            # local coordinator + 4 workers
+    python sharding.py static --shard-index 0 --shard-count 4
+    python sharding.py merge shards/*.csv --sync-sheet
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import config
+
+
+WorkUnit = namedtuple('WorkUnit', 'state county first_page last_page')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    unit_key      TEXT PRIMARY KEY,
+    state         TEXT NOT NULL,
+    county        TEXT NOT NULL,
+    first_page    INTEGER NOT NULL,
+    last_page     INTEGER NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'pending',
+    owner         TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def unit_key(unit):
+    return f"{unit.state}/{unit.county}/{unit.first_page}-{unit.last_page}"
+
+
+def plan_units(states=None, pages_per_unit=None, max_pages=None):
+    """
+    Split regions into work units
+
+    Args:
+        states: {state code: [counties]} (defaults to config.STATES)
+        pages_per_unit: Search pages per unit (default: a whole county per unit);
+            a county with fewer pages simply ends early
+        max_pages: Page limit per county (defaults to config.MAX_PAGES_PER_COUNTY)
+    """
+    states = states or config.STATES
+    max_pages = max_pages or config.MAX_PAGES_PER_COUNTY
+    pages_per_unit = pages_per_unit or max_pages
+    units = []
+    for state, counties in states.items():
+        for county in counties:
+            for first in range(1, max_pages + 1, pages_per_unit):
+                units.append(WorkUnit(state, county, first, min(first + pages_per_unit - 1, max_pages)))
+    return units
+
+
+def static_shard(units, shard_index, shard_count):
+    """The units owned by one of shard_count independent jobs (round-robin)"""
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"shard index {shard_index} is outside 0..{shard_count - 1}")
+    return units[shard_index::shard_count]
+
+
+class LeaseQueue:
+    def __init__(self, path='shard_queue.db', lease_seconds=900, max_attempts=3):
+        """
+        Open (or create) the shared work queue
+
+        Args:
+            path: SQLite file shared by the coordinator and every worker
+            lease_seconds: How long a claim lasts without being renewed
+            max_attempts: Give up on a unit after this many expired or failed leases
+        """
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # isolation_level=None: transactions are managed explicitly below
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(SCHEMA)
+
+    def populate(self, units):
+        """Add units that are not queued yet; returns how many were added"""
+        self.conn.execute('BEGIN IMMEDIATE')
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO units (unit_key, state, county, first_page, last_page) VALUES (?, ?, ?, ?, ?)",
+            [(unit_key(u),) + tuple(u) for u in units]
+        )
+        self.conn.execute('COMMIT')
+        return self.conn.total_changes - before
+
+    def reset(self):
+        self.conn.execute("DELETE FROM units")
+
+    def claim(self, owner):
+        """Lease the next pending (or abandoned) unit; returns None when none are left"""
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute(
+                "SELECT * FROM units WHERE attempts < ? AND "
+                "(status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+                "ORDER BY attempts, rowid LIMIT 1",
+                (self.max_attempts, now)
+            ).fetchone()
+            if row is None:
+                self.conn.execute('COMMIT')
+                return None
+            self.conn.execute(
+                "UPDATE units SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE unit_key = ?",
+                (owner, now + self.lease_seconds, row['unit_key'])
+            )
+            self.conn.execute('COMMIT')
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        return WorkUnit(row['state'], row['county'], row['first_page'], row['last_page'])
+
+    def renew(self, unit, owner):
+        """Extend a lease; returns False if the unit was taken over by someone else"""
+        cursor = self.conn.execute(
+            "UPDATE units SET lease_expires = ? WHERE unit_key = ? AND owner = ? AND status = 'leased'",
+            (time.time() + self.lease_seconds, unit_key(unit), owner)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, unit, owner):
+        self.conn.execute(
+            "UPDATE units SET status = 'done', lease_expires = NULL WHERE unit_key = ? AND owner = ?",
+            (unit_key(unit), owner)
+        )
+
+    def release(self, unit, owner):
+        """Hand a unit back after a failure so another worker can retry it"""
+        self.conn.execute(
+            "UPDATE units SET status = 'pending', owner = NULL, lease_expires = NULL "
+            "WHERE unit_key = ? AND owner = ?",
+            (unit_key(unit), owner)
+        )
+
+    def counts(self):
+        rows = self.conn.execute("SELECT status, COUNT(*) AS n FROM units GROUP BY status")
+        return {row['status']: row['n'] for row in rows}
+
+    def close(self):
+        self.conn.close()
+
+
+class _LeaseKeeper:
+    """Renews a lease in the background while its unit is being crawled"""
+
+    def __init__(self, queue_path, unit, owner, lease_seconds):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(queue_path, unit, owner, lease_seconds), daemon=True
+        )
+
+    def _run(self, queue_path, unit, owner, lease_seconds):
+        queue = LeaseQueue(queue_path, lease_seconds)  # sqlite connections stay on their own thread
+        while not self._stop.wait(lease_seconds / 3):
+            queue.renew(unit, owner)
+        queue.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _shard_scraper():
+    # Imported here so the coordinator and merge step do not pay for the scraper's imports
+    from bizbuysell_scraper import BizBuySellScraper
+
+    # Shards run without a run journal, and the listing store's removal sweep
+    # (finish_crawl) is skipped: no single shard sees every listing
+    return BizBuySellScraper()
+
+
+def _crawl_units(scraper, units, output):
+    from listing_record import LISTING_COLUMNS
+    from pipeline import CsvSink
+
+    sink = CsvSink(output, LISTING_COLUMNS, append=True)
+    return scraper.stream_listings([sink], units=units)
+
+
+def worker_main(queue_path, owner, output_dir):
+    """Claim units from the lease queue until it is empty"""
+    os.makedirs(output_dir, exist_ok=True)
+    output = os.path.join(output_dir, f"{owner}.csv")
+    queue = LeaseQueue(queue_path, config.SHARD_LEASE_SECONDS)
+    scraper = _shard_scraper()
+    finished = 0
+    while True:
+        unit = queue.claim(owner)
+        if unit is None:
+            break
+        print(f"[{owner}] {unit_key(unit)}")
+        try:
+            with _LeaseKeeper(queue_path, unit, owner, config.SHARD_LEASE_SECONDS):
+                _crawl_units(scraper, [unit], output)
+        except Exception as e:
+            print(f"[{owner}] {unit_key(unit)} failed: {str(e)}")
+            queue.release(unit, owner)
+            continue
+        if f"{unit.state}/{unit.county}" in scraper.incomplete_regions:
+            # Some search pages failed: retry the unit rather than mark it done half-crawled
+            print(f"[{owner}] {unit_key(unit)} incomplete, released for retry")
+            queue.release(unit, owner)
+            continue
+        queue.complete(unit, owner)
+        finished += 1
+    queue.close()
+    print(f"[{owner}] done, {finished} units")
+
+
+def run_workers(workers, queue_path=None, output_dir=None, fresh=False):
+    """
+    Coordinator: queue every unit, then run workers until the queue is drained
+
+    Args:
+        workers: Number of worker processes on this machine
+        queue_path: Shared SQLite queue (other machines may work the same file)
+        output_dir: Directory for the per-worker CSV files
+        fresh: Forget finished units from an earlier run and start over
+    """
+    queue_path = queue_path or config.SHARD_QUEUE_FILE
+    output_dir = output_dir or config.SHARD_OUTPUT_DIR
+    queue = LeaseQueue(queue_path, config.SHARD_LEASE_SECONDS)
+    if fresh:
+        queue.reset()
+    added = queue.populate(plan_units(pages_per_unit=config.SHARD_PAGES_PER_UNIT))
+    print(f"Queued {added} new units ({queue.counts()})")
+
+    host = socket.gethostname()
+    processes = [
+        multiprocessing.Process(target=worker_main, args=(queue_path, f"{host}-{os.getpid()}-w{i}", output_dir))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    counts = queue.counts()
+    queue.close()
+    print(f"Queue: {counts}")
+    return counts
+
+
+def run_static_shard(shard_index, shard_count, output_dir=None):
+    """
+    Crawl the fixed slice of units owned by one CI matrix job
+
+    Returns:
+        Regions ('NC/rowan') whose search pages could not all be fetched; the shard failed if any
+    """
+    output_dir = output_dir or config.SHARD_OUTPUT_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    units = static_shard(plan_units(pages_per_unit=config.SHARD_PAGES_PER_UNIT), shard_index, shard_count)
+    print(f"Shard {shard_index + 1}/{shard_count}: {len(units)} units")
+    output = os.path.join(output_dir, f"shard-{shard_index}-of-{shard_count}.csv")
+    if os.path.exists(output):
+        os.remove(output)
+    scraper = _shard_scraper()
+    _crawl_units(scraper, units, output)
+    if scraper.incomplete_regions:
+        print(f"Shard {shard_index + 1}/{shard_count} incomplete: "
+              f"{', '.join(sorted(scraper.incomplete_regions))}")
+    return sorted(scraper.incomplete_regions)
+
+
+def merge_shards(paths, output):
+    """
+    Combine shard CSVs into one result, one row per listing
+
+    A listing found by several shards keeps its most recent row, tagged with
+    every county any shard saw it in.
+
+    Returns:
+        The merged DataFrame
+    """
+    import pandas as pd
+
+    from dedup import assign_duplicate_groups
+    from listing_record import LISTING_COLUMNS
+
+    frames = [pd.read_csv(path, dtype=str, keep_default_na=False) for path in paths if os.path.getsize(path)]
+    if not frames:
+        merged = pd.DataFrame(columns=LISTING_COLUMNS)
+    else:
+        rows = pd.concat(frames, ignore_index=True)
+        rows['_key'] = rows['listing_id'].where(rows['listing_id'] != '', rows['url'])
+        counties = rows.groupby('_key', sort=False)['county'].agg(
+            lambda values: ', '.join(dict.fromkeys(c for v in values for c in v.split(', ') if c))
+        )
+        # Stable, so rows with the same scrape_date keep their file order
+        merged = rows.sort_values('scrape_date', kind='stable').drop_duplicates('_key', keep='last')
+        merged['county'] = merged['_key'].map(counties)
+        merged = merged.drop(columns='_key').reindex(columns=LISTING_COLUMNS)
+        # Near-duplicates are grouped across shards, now that every listing is in one frame
+        merged = assign_duplicate_groups(merged)
+    merged.to_csv(output, index=False)
+    print(f"Merged {len(paths)} shard files into {len(merged)} listings -> {output}")
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded crawl: lease-based workers, static CI shards, merge")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    work = commands.add_parser('work', help="queue all units and run local workers against the lease queue")
+    work.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    work.add_argument('--queue', default=config.SHARD_QUEUE_FILE)
+    work.add_argument('--output-dir', default=config.SHARD_OUTPUT_DIR)
+    work.add_argument('--fresh', action='store_true', help="start over instead of finishing the queue")
+
+    static = commands.add_parser('static', help="crawl a fixed slice of the units (CI matrix job)")
+    static.add_argument('--shard-index', type=int, required=True)
+    static.add_argument('--shard-count', type=int, required=True)
+    static.add_argument('--output-dir', default=config.SHARD_OUTPUT_DIR)
+
+    merge = commands.add_parser('merge', help="combine shard CSVs into one deduplicated CSV")
+    merge.add_argument('paths', nargs='*', help="shard CSVs (default: every CSV in the output dir)")
+    merge.add_argument('--output', default=config.CSV_BACKUP_FILE)
+    merge.add_argument('--sync-sheet', action='store_true', help="update the Google Sheet with the result")
+
+    args = parser.parse_args()
+    if args.command == 'work':
+        run_workers(args.workers, args.queue, args.output_dir, args.fresh)
+    elif args.command == 'static':
+        if run_static_shard(args.shard_index, args.shard_count, args.output_dir):
+            sys.exit(1)
+    else:
+        paths = args.paths or sorted(glob.glob(os.path.join(config.SHARD_OUTPUT_DIR, '*.csv')))
+        merged = merge_shards(paths, args.output)
+        from history_store import open_history
+        history = open_history()
+        if history:
+            print(f"History: {history.append(merged)} listings added to {history.root}")
+        if args.sync_sheet:
+            _shard_scraper().update_google_sheet(merged)
+
+
+if __name__ == "__main__":
+    main()
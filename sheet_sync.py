@@ -0,0 +1,254 @@
+"""
+Diff-based Google Sheets sync
+Reads the sheet once, compares it to the new rows by listing key and sends
+only the inserted, changed and removed rows as chunked batch requests.
+Imported lazily by the scrapers, so runs that never touch the sheet do not
+load gspread / oauth2client.
+"""
+
+import random
+import time
+
+import gspread
+import pandas as pd
+from gspread.exceptions import APIError
+from gspread.utils import rowcol_to_a1
+from oauth2client.service_account import ServiceAccountCredentials
+
+import config
+from metrics import metrics
+
+
+class QuotaThrottle:
+    """Spaces write requests to stay under the Sheets API per-minute quota"""
+
+    def __init__(self, requests_per_minute=50, max_retries=6):
+        self.interval = 60.0 / requests_per_minute
+        self.max_retries = max_retries
+        self._last_call = 0.0
+
+    def call(self, func, *args, **kwargs):
+        """Run one API call, waiting for quota and backing off on 429 responses"""
+        for attempt in range(self.max_retries):
+            wait = self._last_call + self.interval - time.monotonic()
+            if wait > 0:
+                metrics.observe('sheets_throttle_wait_seconds', wait)
+                time.sleep(wait)
+            self._last_call = time.monotonic()
+            metrics.inc('sheets_api_calls_total', method=getattr(func, '__name__', 'call'))
+            try:
+                return func(*args, **kwargs)
+            except APIError as e:
+                if e.response.status_code != 429 or attempt == self.max_retries - 1:
+                    raise
+                backoff = min(64, 2 ** attempt) + random.uniform(0, 1)
+                metrics.inc('sheets_quota_retries_total')
+                print(f"  Sheets API quota hit, retrying in {backoff:.1f} seconds...")
+                time.sleep(backoff)
+
+
+def _cell_text(value):
+    """Render a value the way the sheet reports it back"""
+    if value is None or (not isinstance(value, (list, tuple)) and pd.isna(value)):
+        return ''
+    return str(value)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _update_batches(updates, chunk_rows):
+    """Group range updates so no request carries more than chunk_rows rows"""
+    batch, batch_rows = [], 0
+    for update in updates:
+        if batch and batch_rows + len(update['values']) > chunk_rows:
+            yield batch
+            batch, batch_rows = [], 0
+        batch.append(update)
+        batch_rows += len(update['values'])
+    if batch:
+        yield batch
+
+
+def _row_key(row, key_indexes):
+    for i in key_indexes:
+        if i < len(row) and row[i]:
+            return row[i]
+    return ''
+
+
+def _contiguous_ranges(row_numbers):
+    """Group sorted row numbers into (first, last) runs, highest run first"""
+    ranges = []
+    for number in sorted(row_numbers):
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return [tuple(r) for r in reversed(ranges)]
+
+
+def sync_rows(sheet, columns, rows, key_columns=('listing_id', 'url'),
+              ignore_columns=('scrape_date',), chunk_rows=500, throttle=None):
+    """
+    Bring a worksheet in line with rows, touching only what changed
+
+    Args:
+        sheet: gspread Worksheet
+        columns: Header row, in sheet order
+        rows: New data rows (lists aligned with columns)
+        key_columns: Columns identifying a listing; the first non-empty one is used
+        ignore_columns: Columns that do not count as a change on their own
+        chunk_rows: Maximum rows per API request
+        throttle: QuotaThrottle shared across calls
+
+    Returns:
+        Dict with inserted / updated / removed / unchanged counts
+    """
+    throttle = throttle or QuotaThrottle()
+    rows = [[_cell_text(v) for v in row] for row in rows]
+    existing = throttle.call(sheet.get_all_values)
+
+    last_col = rowcol_to_a1(1, len(columns)).rstrip('0123456789')
+    key_indexes = [columns.index(c) for c in key_columns if c in columns]
+    compare_indexes = [i for i, c in enumerate(columns) if c not in ignore_columns]
+
+    def compared(row):
+        padded = row + [''] * (len(columns) - len(row))
+        return [padded[i] for i in compare_indexes]
+
+    def row_key(row):
+        # A row without a listing ID or URL is identified by its content, so a
+        # changed keyless row is replaced rather than matched to another one
+        return _row_key(row, key_indexes) or ('content',) + tuple(compared(row))
+
+    updates = []
+    removed_rows = []
+    inserts = []
+    unchanged = 0
+
+    if existing and existing[0] == columns:
+        sheet_rows = {}
+        for row_number, row in enumerate(existing[1:], start=2):
+            key = row_key(row)
+            if key in sheet_rows:
+                removed_rows.append(row_number)  # duplicate left by an older run
+            else:
+                sheet_rows[key] = (row_number, row)
+
+        seen = set()
+        for row in rows:
+            key = row_key(row)
+            if key in seen:
+                continue
+            seen.add(key)
+            if key not in sheet_rows:
+                inserts.append(row)
+                continue
+            row_number, current = sheet_rows[key]
+            if compared(current) != compared(row):
+                updates.append({'range': f"A{row_number}:{last_col}{row_number}", 'values': [row]})
+            else:
+                unchanged += 1
+        removed_rows.extend(number for key, (number, _) in sheet_rows.items() if key not in seen)
+        changed = len(updates)
+    else:
+        # Header changed (or empty sheet): overwrite in place and trim the
+        # leftovers, so the sheet is never left empty if a call fails
+        all_rows = [columns] + rows
+        for start in range(0, len(all_rows), chunk_rows):
+            block = all_rows[start:start + chunk_rows]
+            first = start + 1
+            updates.append({'range': f"A{first}:{last_col}{first + len(block) - 1}", 'values': block})
+        removed_rows = list(range(len(all_rows) + 1, len(existing) + 1))
+        changed = len(rows)
+
+    # Update in place first, then delete bottom-up, then append, so row numbers stay valid
+    for batch in _update_batches(updates, chunk_rows):
+        throttle.call(sheet.batch_update, batch, value_input_option='RAW')
+
+    delete_requests = [
+        {'deleteDimension': {'range': {
+            'sheetId': sheet.id, 'dimension': 'ROWS',
+            'startIndex': first - 1, 'endIndex': last,
+        }}}
+        for first, last in _contiguous_ranges(removed_rows)
+    ]
+    for batch in _chunks(delete_requests, chunk_rows):
+        throttle.call(sheet.spreadsheet.batch_update, {'requests': batch})
+
+    for batch in _chunks(inserts, chunk_rows):
+        throttle.call(sheet.append_rows, batch, value_input_option='RAW')
+
+    return {
+        'inserted': len(inserts),
+        'updated': changed,
+        'removed': len(removed_rows),
+        'unchanged': unchanged,
+    }
+
+
+def update_google_sheet(listings_data, columns, creds_file, sheet_name):
+    """
+    Authorize, open (or create) the sheet and sync listings into it
+
+    Args:
+        listings_data: DataFrame or list of listing dicts
+        columns: Sheet columns, in order
+        creds_file: Google service account credentials JSON
+        sheet_name: Name of the Google Sheet to update
+
+    Returns:
+        True on success
+    """
+    if len(listings_data) == 0:
+        print("No data to update in Google Sheet")
+        return False
+
+    try:
+        # Define the scope
+        scope = ['https://spreadsheets.google.com/feeds',
+                 'https://www.googleapis.com/auth/drive']
+
+        # Authenticate
+        creds = ServiceAccountCredentials.from_json_keyfile_name(creds_file, scope)
+        client = gspread.authorize(creds)
+
+        # Open the sheet
+        try:
+            sheet = client.open(sheet_name).sheet1
+        except Exception:
+            # Create new spreadsheet if it doesn't exist
+            spreadsheet = client.create(sheet_name)
+            spreadsheet.share('', perm_type='anyone', role='reader')
+            sheet = spreadsheet.sheet1
+
+        # Reorder columns (missing ones come back empty) in one vectorized step
+        df = listings_data if isinstance(listings_data, pd.DataFrame) else pd.DataFrame(listings_data)
+        if list(df.columns) != list(columns):
+            df = df.reindex(columns=columns, fill_value='')
+
+        sync_started = time.perf_counter()
+        if config.SHEET_SYNC_MODE == 'diff':
+            # Send only inserted, changed and removed rows
+            stats = sync_rows(
+                sheet, columns, df.values.tolist(),
+                chunk_rows=config.SHEET_SYNC_CHUNK_ROWS,
+                throttle=QuotaThrottle(config.SHEETS_WRITE_REQUESTS_PER_MINUTE)
+            )
+            print(f"Sheet sync: {stats['inserted']} inserted, {stats['updated']} updated, "
+                  f"{stats['removed']} removed, {stats['unchanged']} unchanged")
+        else:
+            sheet.clear()
+            sheet.update([df.columns.values.tolist()] + df.values.tolist())
+        metrics.observe('sheet_sync_seconds', time.perf_counter() - sync_started)
+
+        print(f"\nSuccessfully updated Google Sheet: {sheet_name}")
+        print(f"Total rows: {len(df) + 1}")  # +1 for header
+        return True
+
+    except Exception as e:
+        print(f"Error updating Google Sheet: {str(e)}")
+        return False
@@ -0,0 +1,307 @@
+"""
+Structured-data fast path for listing pages
+Scans the raw page bytes for JSON-LD blocks and embedded JSON state blobs
+(window.__INITIAL_STATE__ and friends) with regexes, without building a DOM,
+and maps what they hold onto listing fields. DOM extraction only has to fill
+in whatever is missing.
+
+Only data that describes this listing is used: schema.org Product / Offer
+nodes (never the site's Organization / publisher nodes) and the listing
+object of a state blob. A node whose URL or ID names this listing is trusted
+over the DOM; one that names no listing only fills fields the DOM lacks, and
+one that names another listing is ignored.
+"""
+
+import json
+import re
+from collections import deque
+
+from listing_extractor import LISTING_ID_RE
+
+
+# Fields of a listing record that structured data can supply
+STRUCTURED_FIELDS = (
+    'business_type', 'price', 'revenue', 'ebitda', 'franchise', 'established_year',
+    'description', 'business_name', 'location', 'employees', 'facilities', 'reason_for_selling',
+)
+
+JSON_SCRIPT_RE = re.compile(
+    rb'<script[^>]*\btype\s*=\s*["\']application/(ld\+json|json)["\'][^>]*>(.*?)</script\s*>',
+    re.IGNORECASE | re.DOTALL
+)
+STATE_BLOB_RE = re.compile(
+    rb'window\.__(?:INITIAL_STATE|PRELOADED_STATE|APP_STATE|NUXT)__\s*=\s*', re.IGNORECASE
+)
+
+# Keys (lower-cased) of the listing object in a state blob, and of the ID inside it
+STATE_LISTING_KEYS = ('listing', 'listingdetail', 'listingdetails', 'businesslisting')
+STATE_ID_KEYS = ('id', 'listingid', 'listing_id')
+
+# Keys (lower-cased) that hold each field in a state blob's listing object, most specific first
+STATE_KEYS = {
+    'business_name': ('businessname', 'listingtitle', 'headline', 'title'),
+    'business_type': ('businesstype', 'industry', 'category'),
+    'price': ('askingprice', 'listprice', 'price'),
+    'revenue': ('grossrevenue', 'annualrevenue', 'revenue'),
+    'ebitda': ('cashflow', 'ebitda', 'sde'),
+    'franchise': ('isfranchise', 'franchise'),
+    'established_year': ('yearestablished', 'established', 'foundingyear'),
+    'description': ('description', 'summary'),
+    'location': ('location', 'city'),
+    'employees': ('numberofemployees', 'employeecount', 'employees'),
+    'facilities': ('facilities', 'realestate'),
+    'reason_for_selling': ('reasonforselling', 'reasonforsale'),
+}
+
+# schema.org types that describe the listing itself; Organization, LocalBusiness
+# and the like are also used for the site's own publisher node, so they are not read
+LISTING_TYPES = {'product', 'individualproduct', 'offer'}
+# JSON-LD keys that identify what a node describes
+LD_ID_KEYS = ('url', '@id', 'sku', 'productID', 'identifier', 'mainEntityOfPage')
+
+MONEY_FIELDS = ('price', 'revenue', 'ebitda')
+
+
+def _json_documents(content):
+    """Yield (kind, document) for every JSON-LD block and state blob in the page"""
+    for match in JSON_SCRIPT_RE.finditer(content):
+        try:
+            yield match.group(1).lower().decode('ascii'), json.loads(match.group(2).decode('utf-8', 'replace'))
+        except ValueError:
+            continue
+    decoder = json.JSONDecoder()
+    for match in STATE_BLOB_RE.finditer(content):
+        # raw_decode stops at the end of the object, whatever follows it
+        text = content[match.end():].decode('utf-8', 'replace')
+        try:
+            yield 'state', decoder.raw_decode(text)[0]
+        except ValueError:
+            continue
+
+
+def _ld_nodes(document):
+    """Flatten a JSON-LD document (lists and @graph) into its nodes"""
+    if isinstance(document, list):
+        for item in document:
+            yield from _ld_nodes(item)
+    elif isinstance(document, dict):
+        if '@graph' in document:
+            yield from _ld_nodes(document['@graph'])
+        else:
+            yield document
+
+
+def _ld_types(node):
+    types = node.get('@type', ())
+    types = [types] if isinstance(types, str) else types
+    return {str(t).lower() for t in types}
+
+
+def _format_money(value):
+    if isinstance(value, str) and re.fullmatch(r'\s*\d+(?:\.\d+)?\s*', value):
+        value = float(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"${value:,.0f}"
+    return str(value).strip()
+
+
+def _format_location(value):
+    if isinstance(value, dict):
+        if 'address' in value:
+            return _format_location(value['address'])
+        parts = [value.get(k) for k in ('addressLocality', 'addressRegion', 'name', 'city', 'state')]
+        return ', '.join(str(p) for p in parts if p)
+    if isinstance(value, list):
+        return _format_location(value[0]) if value else ''
+    return str(value).strip()
+
+
+def _format(field, value):
+    """Render a structured value the way the DOM extractor would report it"""
+    if value is None or (isinstance(value, (list, dict)) and field not in ('location', 'employees')):
+        return ''
+    if field in MONEY_FIELDS:
+        if isinstance(value, dict):
+            return ''
+        return _format_money(value)
+    if field == 'franchise':
+        if isinstance(value, bool):
+            return 'Yes' if value else 'No'
+        return 'Yes' if 'yes' in str(value).lower() or str(value).lower() == 'true' else 'No'
+    if field == 'established_year':
+        year = re.search(r'\d{4}', str(value))
+        return year.group(0) if year else ''
+    if field == 'location':
+        return _format_location(value)
+    if field == 'employees' and isinstance(value, dict):
+        value = value.get('value', value.get('minValue', ''))
+    return ' '.join(str(value).split())
+
+
+def _names_listing(values, listing_id):
+    """
+    Whether identifying values (URLs, IDs) point at this listing
+
+    Returns:
+        True if one of them does, False if they all name something else, or
+        None when there are none (or the listing ID is unknown)
+    """
+    values = [v.get('@id') or v.get('url') if isinstance(v, dict) else v for v in values]
+    values = [str(v).strip() for v in values if isinstance(v, (str, int)) and not isinstance(v, bool)]
+    values = [v for v in values if v]
+    if not values or not listing_id:
+        return None
+    for value in values:
+        match = LISTING_ID_RE.search(value)
+        if value == listing_id or (match and match.group(1) == listing_id):
+            return True
+    return False
+
+
+def _ld_offers(node):
+    offers = node.get('offers') or {}
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    return offers if isinstance(offers, dict) else {}
+
+
+def _ld_names_listing(node, listing_id):
+    """_names_listing() for a Product / Offer node and its offer"""
+    values = [node.get(key) for key in LD_ID_KEYS]
+    offers = _ld_offers(node)
+    values += [offers.get('url'), offers.get('@id')]
+    item = node.get('itemOffered')
+    if isinstance(item, dict):
+        values += [item.get(key) for key in LD_ID_KEYS]
+    return _names_listing([v for v in values if v is not None], listing_id)
+
+
+def _from_json_ld(node):
+    """Map one schema.org Product / Offer node onto listing fields"""
+    offers = _ld_offers(node)
+    if 'offer' in _ld_types(node):
+        # An Offer carries the price itself and describes the business in itemOffered
+        item = node.get('itemOffered')
+        found = _from_json_ld(item) if isinstance(item, dict) else {}
+        if node.get('price') not in (None, ''):
+            found['price'] = node.get('price')
+        return found
+    found = {
+        'business_name': node.get('name'),
+        'description': node.get('description'),
+        'business_type': node.get('category'),
+        'price': offers.get('price'),
+        'location': node.get('address') or node.get('areaServed') or node.get('location'),
+        'established_year': node.get('foundingDate'),
+        'employees': node.get('numberOfEmployees'),
+    }
+    return {field: value for field, value in found.items() if value not in (None, '')}
+
+
+def _listing_object(document, listing_id):
+    """
+    The object of a state blob that describes this listing
+
+    Returns:
+        (object, named) where named is True when its ID confirms it is this
+        listing; (None, False) when the blob holds no listing object, or only
+        another listing's
+    """
+    candidate = None
+    queue = deque([document])
+    while queue:
+        node = queue.popleft()
+        if isinstance(node, list):
+            queue.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        keys = {str(k).lower(): k for k in node}
+        ids = [node[keys[key]] for key in STATE_ID_KEYS if key in keys]
+        if _names_listing(ids, listing_id):
+            return node, True
+        for key in STATE_LISTING_KEYS:
+            if candidate is None and isinstance(node.get(keys.get(key)), dict):
+                candidate = node[keys[key]]
+        queue.extend(v for v in node.values() if isinstance(v, (dict, list)))
+    if candidate is None:
+        return None, False
+    candidate_keys = {str(k).lower(): k for k in candidate}
+    if _names_listing([candidate[candidate_keys[key]] for key in STATE_ID_KEYS if key in candidate_keys],
+                      listing_id) is False:
+        return None, False
+    return candidate, False
+
+
+def _from_state(document):
+    """Breadth-first search of a listing object for the first key holding each field"""
+    found = {}
+    queue = deque([document])
+    while queue and len(found) < len(STATE_KEYS):
+        node = queue.popleft()
+        if isinstance(node, list):
+            queue.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        keys = {str(k).lower(): k for k in node}
+        for field, aliases in STATE_KEYS.items():
+            if field in found:
+                continue
+            for alias in aliases:
+                value = node.get(keys[alias]) if alias in keys else None
+                if value not in (None, '') and (not isinstance(value, (dict, list)) or field == 'location'):
+                    found[field] = value
+                    break
+        queue.extend(v for v in node.values() if isinstance(v, (dict, list)))
+    return found
+
+
+def extract_structured(content, url=None):
+    """
+    Listing fields found in embedded structured data
+
+    Args:
+        content: Raw page bytes
+        url: Listing URL; its listing ID tells this listing's data from the rest
+
+    Returns:
+        (fields, named): field -> string for every field that had a non-empty
+        value, and the set of those fields that came from data naming this
+        listing (the only ones that may override the DOM)
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    match = LISTING_ID_RE.search(url or '')
+    listing_id = match.group(1) if match else None
+    named_raw = {}
+    other_raw = {}
+    for kind, document in _json_documents(content):
+        if kind == 'ld+json':
+            for node in _ld_nodes(document):
+                if not _ld_types(node) & LISTING_TYPES:
+                    continue
+                named = _ld_names_listing(node, listing_id)
+                if named is False:
+                    continue  # e.g. a related listing
+                raw = named_raw if named else other_raw
+                for field, value in _from_json_ld(node).items():
+                    raw.setdefault(field, value)
+        else:
+            listing, named = _listing_object(document, listing_id)
+            if listing is None:
+                continue
+            raw = named_raw if named else other_raw
+            for field, value in _from_state(listing).items():
+                raw.setdefault(field, value)
+
+    fields = {}
+    named = set()
+    for raw in (other_raw, named_raw):
+        for field, value in raw.items():
+            text = _format(field, value)
+            if text:
+                fields[field] = text
+                if raw is named_raw:
+                    named.add(field)
+    return fields, named
@@ -10,8 +10,8 @@ print("=" * 60)
 # Test 1: Python version
 print("\n1. Python Version:")
 print(f"   {sys.version}")
-if sys.version_info < (3, 7):
-    print("   ⚠️  WARNING: Python 3.7+ recommended")
+if sys.version_info < (3, 10):
+    print("   ✗ Python 3.10+ required (the Listing record uses slotted dataclasses)")
 else:
     print("   ✓ Python version OK")
 
@@ -25,12 +25,14 @@ required_packages = {
     'oauth2client': 'oauth2client'
 }
 
+# find_spec locates a package without importing it (pandas alone takes ~0.5s to import)
+from importlib.util import find_spec
+
 missing_packages = []
 for package_name, import_name in required_packages.items():
-    try:
-        __import__(import_name)
+    if find_spec(import_name) is not None:
         print(f"   ✓ {package_name} installed")
-    except ImportError:
+    else:
         print(f"   ✗ {package_name} NOT installed")
         missing_packages.append(package_name)
 
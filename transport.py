@@ -0,0 +1,253 @@
+"""
+Shared HTTP transport for both scrapers
+One pooled, keep-alive client with compressed responses, cached DNS lookups,
+a uniform timeout / connection-retry policy and optional HTTP/2 (when httpx
+with h2 is installed: pip install "httpx[http2]"). A GET can also be streamed
+and cut short once the caller's watcher has seen everything it needs.
+"""
+
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+import config
+from metrics import metrics
+
+
+def _accept_encoding():
+    """Only advertise encodings this process can decode"""
+    encodings = ['gzip', 'deflate']
+    try:
+        import brotli  # noqa: F401 - requests/urllib3 decode br when it is installed
+        encodings.append('br')
+    except ImportError:
+        pass
+    return ', '.join(encodings)
+
+
+_dns_cache = {}
+_dns_lock = threading.Lock()
+# TTL of the transport request running on this thread (unset elsewhere)
+_dns_scope = threading.local()
+_original_getaddrinfo = socket.getaddrinfo
+
+
+def _cached_getaddrinfo(*args, **kwargs):
+    """getaddrinfo that reuses results inside a transport request and passes through everywhere else"""
+    ttl = getattr(_dns_scope, 'ttl', 0)
+    if ttl <= 0:
+        return _original_getaddrinfo(*args, **kwargs)
+    key = (args, tuple(sorted(kwargs.items())))
+    now = time.monotonic()
+    with _dns_lock:
+        hit = _dns_cache.get(key)
+        if hit and hit[0] > now:
+            metrics.inc('dns_cache_total', result='hit')
+            return hit[1]
+    result = _original_getaddrinfo(*args, **kwargs)
+    with _dns_lock:
+        _dns_cache[key] = (now + ttl, result)
+    metrics.inc('dns_cache_total', result='miss')
+    return result
+
+
+def install_dns_cache():
+    """
+    Route getaddrinfo through the DNS cache
+
+    Lookups are only cached while a transport request runs on the calling
+    thread (see _dns_cached), so new pooled connections skip the resolver
+    while other libraries in the process (gspread, oauth) resolve as usual.
+    """
+    socket.getaddrinfo = _cached_getaddrinfo
+
+
+@contextmanager
+def _dns_cached(ttl_seconds):
+    """Cache the lookups made on this thread for ttl_seconds (0 passes them through)"""
+    previous = getattr(_dns_scope, 'ttl', 0)
+    _dns_scope.ttl = ttl_seconds
+    try:
+        yield
+    finally:
+        _dns_scope.ttl = previous
+
+
+def _http2_client(pool_size, timeout, connect_retries):
+    """An httpx HTTP/2 client, or None when httpx / h2 are not installed"""
+    try:
+        import h2  # noqa: F401
+        import httpx
+    except ImportError:
+        return None
+    # The client ignores limits= when it is given a transport, so the pool size goes here
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return httpx.Client(
+        timeout=timeout,
+        transport=httpx.HTTPTransport(http2=True, retries=connect_retries, limits=limits),
+        follow_redirects=True,
+    )
+
+
+def _read_until_complete(chunks, watcher):
+    """
+    Read a streamed body until watcher.feed() reports it has everything
+
+    Returns:
+        (body, truncated) where truncated is False when the body ended anyway
+    """
+    chunks = iter(chunks)
+    body = []
+    for chunk in chunks:
+        body.append(chunk)
+        if watcher.feed(chunk):
+            # One more read tells a finished body from a cut-off one
+            rest = next(chunks, b'')
+            if not rest:
+                break
+            body.append(rest)
+            return b''.join(body), True
+    return b''.join(body), False
+
+
+class HttpTransport:
+    def __init__(self, cache=None, pool_size=None, timeout=None, connect_retries=None, http2=None,
+                 archive=None):
+        """
+        Open the shared client
+
+        Args:
+            cache: Optional ResponseCache consulted (and revalidated) by fetch()
+            pool_size: Keep-alive connections per host (defaults to the in-flight limit)
+            timeout: Seconds for connect and read (defaults to config.REQUEST_TIMEOUT)
+            connect_retries: Retries for failed connects; status retries are left to the fetch engine
+            http2: Use HTTP/2 when httpx + h2 are installed (defaults to config.HTTP2_ENABLED)
+            archive: Optional HtmlArchive that keeps every 200 body received from the network
+        """
+        self.cache = cache
+        self.archive = archive
+        self.pool_size = pool_size or config.MAX_CONCURRENT_REQUESTS
+        self.timeout = timeout or config.REQUEST_TIMEOUT
+        connect_retries = config.HTTP_CONNECT_RETRIES if connect_retries is None else connect_retries
+        http2 = config.HTTP2_ENABLED if http2 is None else http2
+        self.dns_cache_seconds = config.DNS_CACHE_SECONDS
+        if self.dns_cache_seconds > 0:
+            install_dns_cache()
+
+        self.accept_encoding = _accept_encoding()
+        self.client = _http2_client(self.pool_size, self.timeout, connect_retries) if http2 else None
+        self.protocol = 'HTTP/2' if self.client is not None else 'HTTP/1.1'
+
+        # The requests session is always kept: it is the HTTP/1.1 path and holds cookies
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=self.pool_size,
+            max_retries=Retry(total=connect_retries, connect=connect_retries, read=0,
+                              status=0, redirect=5, backoff_factor=0.5,
+                              allowed_methods=frozenset(['GET', 'HEAD'])),
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _from_httpx(self, url, result, body=None):
+        # Hand back a requests.Response so callers, the cache and the engine see one type
+        response = requests.models.Response()
+        response.status_code = result.status_code
+        response._content = result.content if body is None else body
+        response.headers = CaseInsensitiveDict(result.headers)
+        response.url = str(result.url)
+        response.encoding = result.encoding
+        response.reason = result.reason_phrase
+        return response
+
+    def get(self, url, headers=None, watcher=None):
+        """
+        One GET over the pooled connections (no cache, no status check)
+
+        Args:
+            url: URL to fetch
+            headers: Request headers; Accept-Encoding is always set by the transport
+            watcher: Optional object whose feed(chunk) returns True once the body
+                received so far is all the caller needs; the rest of a 200 body is
+                then not downloaded and the response is marked truncated
+        """
+        headers = {**(headers or {}), 'Accept-Encoding': self.accept_encoding}
+        with _dns_cached(self.dns_cache_seconds):
+            if watcher is not None:
+                response = self._get_streaming(url, headers, watcher)
+            elif self.client is not None:
+                import httpx
+                try:
+                    response = self._from_httpx(url, self.client.get(url, headers=headers))
+                except httpx.TransportError as e:
+                    raise requests.ConnectionError(str(e)) from e
+            else:
+                response = self.session.get(url, headers=headers, timeout=self.timeout, allow_redirects=True)
+        metrics.record_response(response)
+        metrics.inc('http_requests_total', protocol=self.protocol)
+        # A truncated body is not the page, so it is never archived
+        if self.archive is not None and response.status_code == 200 and not getattr(response, 'truncated', False):
+            self.archive.add(url, response)
+        return response
+
+    def _get_streaming(self, url, headers, watcher):
+        """GET that stops reading once the watcher has what it needs"""
+        chunk_size = config.STREAMING_CHUNK_KB * 1024
+        if self.client is not None:
+            import httpx
+            try:
+                with self.client.stream('GET', url, headers=headers) as result:
+                    if result.status_code == 200:
+                        body, truncated = _read_until_complete(result.iter_bytes(chunk_size), watcher)
+                    else:
+                        body, truncated = result.read(), False
+                    # Leaving the block resets just this stream; the HTTP/2 connection stays up
+                    received = result.num_bytes_downloaded
+            except httpx.TransportError as e:
+                raise requests.ConnectionError(str(e)) from e
+            response = self._from_httpx(url, result, body)
+        else:
+            response = self.session.get(url, headers=headers, timeout=self.timeout, allow_redirects=True,
+                                        stream=True)
+            if response.status_code == 200:
+                body, truncated = _read_until_complete(response.iter_content(chunk_size), watcher)
+            else:
+                body, truncated = response.content, False
+            received = response.raw.tell()
+            if truncated:
+                # A partly read connection cannot be reused, so it is dropped, not pooled
+                response.raw.close()
+            response._content = body
+            response._content_consumed = True
+            response.close()
+
+        response.truncated = truncated
+        response.bytes_saved = None
+        if truncated:
+            length = response.headers.get('Content-Length', '')
+            if length.isdigit():
+                response.bytes_saved = max(int(length) - received, 0)
+                metrics.inc('stream_bytes_saved_total', response.bytes_saved)
+        metrics.inc('stream_pages_total', result='stopped_early' if truncated else 'complete')
+        return response
+
+    def fetch(self, url, headers=None, watcher=None):
+        """Fetch a page through the response cache, raising on HTTP errors (watcher as in get())"""
+        def send(extra_headers):
+            return self.get(url, {**(headers or {}), **extra_headers}, watcher)
+
+        response = self.cache.fetch(url, send) if self.cache else send({})
+        response.raise_for_status()
+        return response
+
+    def close(self):
+        self.session.close()
+        if self.client is not None:
+            self.client.close()
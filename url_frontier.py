@@ -0,0 +1,81 @@
+"""
+Run-wide URL frontier
+Canonicalizes listing URLs and keys them by listing ID, so a listing that shows
+up in several counties' search results is fetched once and tagged with every
+county it appeared in
+"""
+
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from http_cache import canonical_url
+from listing_store import listing_id_from_url
+
+
+def canonical_listing_url(url, base_url):
+    """
+    Normalize a listing link found on a search page
+
+    Relative links are made absolute against base_url; tracking query strings
+    and fragments are dropped from /listing/ URLs and the path always ends in '/'.
+    """
+    url = canonical_url(urljoin(base_url + '/', url))
+    if not listing_id_from_url(url):
+        return url
+    parts = urlsplit(url)
+    path = parts.path if parts.path.endswith('/') else parts.path + '/'
+    return urlunsplit((parts.scheme, parts.netloc, path, '', ''))
+
+
+def listing_key(url):
+    """Listing ID when the URL has one, otherwise the canonical URL itself"""
+    return listing_id_from_url(url) or canonical_url(url)
+
+
+class UrlFrontier:
+    def __init__(self, base_url):
+        """
+        Start an empty frontier for one run
+
+        Args:
+            base_url: Site root used to resolve relative links
+        """
+        self.base_url = base_url.rstrip('/')
+        self._counties = {}
+        self._urls = {}
+        self.duplicates = 0
+
+    def add(self, url, county):
+        """
+        Record a sighting of a listing in a county's results
+
+        Returns:
+            The canonical URL the first time the listing is seen, None after that
+        """
+        url = canonical_listing_url(url, self.base_url)
+        key = listing_key(url)
+        county = county.title()
+        counties = self._counties.get(key)
+        if counties is None:
+            self._counties[key] = [county]
+            self._urls[key] = url
+            return url
+        if county not in counties:
+            counties.append(county)
+        self.duplicates += 1
+        return None
+
+    def counties_for(self, url):
+        """Every county a listing has appeared in so far, in order of first sighting"""
+        return list(self._counties.get(listing_key(url), ()))
+
+    def county_label(self, url, default=''):
+        """Counties joined for the 'county' column, e.g. 'Mecklenburg, Cabarrus'"""
+        return ', '.join(self.counties_for(url)) or default
+
+    def labels(self):
+        """(canonical URL, county label) for every listing seen"""
+        for key, url in self._urls.items():
+            yield url, ', '.join(self._counties[key])
+
+    def __len__(self):
+        return len(self._counties)